@@ -11,8 +11,13 @@ import subprocess
 import sys
 import re
 
-BUCKET = "gs://gen-lang-client-0540480379-dropbox-mirror"
-REV_INDEX_KEY = "mirror/state/rev_index.json"
+sys.path.insert(0, ".")
+from shared.state_store import StateStore  # noqa: E402
+
+BUCKET_NAME = "gen-lang-client-0540480379-dropbox-mirror"
+BUCKET = f"gs://{BUCKET_NAME}"
+REV_INDEX_STORE = "rev_index"
+LEGACY_REV_INDEX_KEY = "mirror/state/rev_index.json"
 SYNC_STATE_KEY = "mirror/state/sync_state.json"
 
 def gsutil_cat(key):
@@ -49,7 +54,8 @@ def main():
     
     # Step 1: Load rev_index
     print("1. Loading rev_index...")
-    rev_index = gsutil_cat(REV_INDEX_KEY) or {}
+    rev_store = StateStore(BUCKET_NAME, REV_INDEX_STORE, LEGACY_REV_INDEX_KEY)
+    rev_index = rev_store.load()
     original_count = len(rev_index)
     print(f"   Found {original_count} entries in rev_index")
     
@@ -78,18 +84,20 @@ def main():
     # Step 4: Keep only entries for images and existing docs with extensions
     print("\n4. Filtering rev_index to keep only valid entries...")
     keep_ids = image_file_ids | existing_doc_ids
-    new_rev_index = {fid: rev for fid, rev in rev_index.items() if fid in keep_ids}
-    removed = original_count - len(new_rev_index)
+    for fid in [fid for fid in rev_index if fid not in keep_ids]:
+        del rev_index[fid]
+    removed = original_count - len(rev_index)
     
     print(f"   Removed {removed} entries (docs without extensions, media)")
-    print(f"   Keeping {len(new_rev_index)} entries")
+    print(f"   Keeping {len(rev_index)} entries")
     
-    # Step 5: Save updated rev_index
+    # Step 5: Save updated rev_index (appends a delta of the removed keys)
     print("\n5. Saving updated rev_index...")
-    if gsutil_cp(new_rev_index, REV_INDEX_KEY):
+    try:
+        rev_store.checkpoint(rev_index)
         print("   OK - rev_index saved")
-    else:
-        print("   FAILED to save rev_index")
+    except Exception as e:
+        print(f"   FAILED to save rev_index: {e}")
         sys.exit(1)
     
     # Step 6: Clear cursor from sync_state to force full re-scan
@@ -109,7 +117,7 @@ def main():
     print(f"\nSummary:")
     print(f"  - Original rev_index entries: {original_count}")
     print(f"  - Entries removed (need re-sync): {removed}")
-    print(f"  - Entries kept (images + valid docs): {len(new_rev_index)}")
+    print(f"  - Entries kept (images + valid docs): {len(rev_index)}")
     print(f"\nNext steps:")
     print("  1. Run: gcloud run jobs execute sync-dropbox-to-gcs --region=us-central1")
     print("  2. After sync completes, verify docs have extensions:")
@@ -10,8 +10,12 @@ is a JSON object with:
 """
 import json
 import subprocess
+import sys
 import os
 
+sys.path.insert(0, ".")
+from shared.auth import get_session  # noqa: E402
+
 BUCKET = "gen-lang-client-0540480379-dropbox-mirror"
 PROJECT_ID = "gen-lang-client-0540480379"
 DATASTORE_ID = "dropbox-docs-datastore-ocr"
@@ -34,13 +38,6 @@ def gsutil_ls(prefix):
         return []
     return [l for l in result.stdout.strip().split("\n") if l]
 
-def get_access_token():
-    result = subprocess.run(
-        ["gcloud", "auth", "print-access-token"],
-        capture_output=True, text=True
-    )
-    return result.stdout.strip()
-
 def main():
     print("=== Generate JSONL and Import Docs to Vertex AI Search ===\n")
     
@@ -90,8 +87,6 @@ def main():
     
     # Step 4: Trigger import
     print("\n4. Triggering import...")
-    token = get_access_token()
-    
     # For unstructured docs with content.uri, use "content" dataSchema
     payload = {
         "gcsSource": {
@@ -103,16 +98,13 @@ def main():
     
     url = f"https://discoveryengine.googleapis.com/v1/projects/{PROJECT_ID}/locations/global/collections/default_collection/dataStores/{DATASTORE_ID}/branches/default_branch/documents:import"
     
-    result = subprocess.run(
-        ["curl", "-s", "-X", "POST", url,
-         "-H", f"Authorization: Bearer {token}",
-         "-H", f"x-goog-user-project: {PROJECT_ID}",
-         "-H", "Content-Type: application/json",
-         "-d", json.dumps(payload)],
-        capture_output=True, text=True
+    resp = get_session().post(
+        url, json=payload,
+        headers={"x-goog-user-project": PROJECT_ID},
+        timeout=120,
     )
     
-    response = json.loads(result.stdout) if result.stdout else {}
+    response = resp.json() if resp.content else {}
     
     if "name" in response:
         op_name = response["name"]
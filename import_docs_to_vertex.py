@@ -2,10 +2,13 @@
 """
 Import docs to Vertex AI Search in batches of 1000.
 """
-import json
 import subprocess
+import sys
 import time
 
+sys.path.insert(0, ".")
+from shared.auth import get_session  # noqa: E402
+
 BUCKET = "gen-lang-client-0540480379-dropbox-mirror"
 PROJECT_ID = "gen-lang-client-0540480379"
 DATASTORE_ID = "dropbox-docs-datastore-ocr"
@@ -20,30 +23,20 @@ def gsutil_ls(prefix):
         return []
     return [l for l in result.stdout.strip().split("\n") if l]
 
-def get_access_token():
-    result = subprocess.run(
-        ["gcloud", "auth", "print-access-token"],
-        capture_output=True, text=True
-    )
-    return result.stdout.strip()
-
 def trigger_import(uris):
-    token = get_access_token()
     payload = {
         "gcsSource": {"inputUris": uris},
         "reconciliationMode": "INCREMENTAL"
     }
     url = f"https://discoveryengine.googleapis.com/v1/projects/{PROJECT_ID}/locations/global/collections/default_collection/dataStores/{DATASTORE_ID}/branches/default_branch/documents:import"
     
-    result = subprocess.run(
-        ["curl", "-s", "-X", "POST", url,
-         "-H", f"Authorization: Bearer {token}",
-         "-H", f"x-goog-user-project: {PROJECT_ID}",
-         "-H", "Content-Type: application/json",
-         "-d", json.dumps(payload)],
-        capture_output=True, text=True
+    # Shared keep-alive session; the token is cached across batches
+    resp = get_session().post(
+        url, json=payload,
+        headers={"x-goog-user-project": PROJECT_ID},
+        timeout=120,
     )
-    return json.loads(result.stdout) if result.stdout else {"error": "No response"}
+    return resp.json() if resp.content else {"error": "No response"}
 
 def main():
     print("=== Importing docs to Vertex AI Search ===\n")
@@ -3,31 +3,48 @@ Job B — Generate multimodal embeddings for images and upsert to Vector Search.
 
 Behaviour:
   1. Load embedding_state.json from GCS (file_id → embedded_rev).
-  2. Scan all mirror/meta/*.json for category=="images".
-  3. For new/changed images: embed via multimodalembedding@001, upsert datapoint.
+  2. Load the image rows of the file manifest (mirror/state/manifest/);
+     falls back to scanning mirror/meta/*.json if the sync job hasn't
+     written one yet.
+  3. For new/changed images, a three-stage pipeline:
+       cache     — content already embedded (same content hash, model and
+                   dimension; shared/embedding_cache.py) skips to upsert
+       prefetch  — download image bytes on a small pool
+       embed     — multimodalembedding@001 calls on a worker pool, paced by
+                   a token bucket sized to the API quota
+       upsert    — datapoints accumulated into batched upsert_datapoints
+     embedding_state is advanced and checkpointed only for committed batches.
   4. For stale IDs (image deleted): remove datapoints.
   5. Persist updated embedding_state.json.
+  6. Export the current vectors (from the embedding cache) as the local
+     memory-mapped index (shared/local_index.py) when anything changed.
 """
 
 import logging
 import sys
+import time
 
 sys.path.insert(0, "/app")
 sys.path.insert(0, ".")
 
 import vertexai  # noqa: E402
+from google.api_core.exceptions import ResourceExhausted  # noqa: E402
 from google.cloud import aiplatform  # noqa: E402
 from google.cloud.aiplatform_v1.types import index as index_types  # noqa: E402
 from vertexai.vision_models import Image, MultiModalEmbeddingModel  # noqa: E402
 
 from shared import config  # noqa: E402
-from shared.gcs import (  # noqa: E402
-    download_bytes,
-    get_blob_size,
-    list_blobs,
-    read_json,
-    write_json,
+from shared.embedding_cache import EmbeddingCache  # noqa: E402
+from shared.gcs import BlobCatalog, download_bytes  # noqa: E402
+from shared.local_index import export_index, read_index_meta  # noqa: E402
+from shared.manifest import Manifest, ManifestRow, rows_from_sidecars  # noqa: E402
+from shared.rate_limit import TokenBucket  # noqa: E402
+from shared.state_store import (  # noqa: E402
+    EMBEDDING_VERSION_KEY,
+    StateStore,
+    publish_version,
 )
+from shared.transfer import TransferPool  # noqa: E402
 
 logging.basicConfig(
     level=logging.INFO,
@@ -41,6 +58,19 @@ BUCKET = config.GCS_BUCKET_NAME
 # Base64 adds ~33% overhead, so we limit raw file size to 20MB.
 MAX_IMAGE_SIZE_BYTES = 20 * 1024 * 1024  # 20 MB
 
+# Retries of a single embedding call on quota errors (429)
+EMBED_RETRIES = 5
+QUOTA_BACKOFF_SECONDS = 10
+
+
+def _restrict_images() -> list:
+    return [
+        index_types.IndexDatapoint.Restriction(
+            namespace="category",
+            allow_list=["images"],
+        ),
+    ]
+
 
 def run() -> None:
     """Main embedding logic."""
@@ -64,98 +94,178 @@ def run() -> None:
     vs_index = aiplatform.MatchingEngineIndex(index_name=index_resource)
 
     # ── Load state ────────────────────────────────────────
-    embedding_state: dict[str, str] = read_json(BUCKET, config.EMBEDDING_STATE_KEY)
+    state_store = StateStore(
+        BUCKET, config.EMBEDDING_STATE_STORE, config.EMBEDDING_STATE_KEY
+    )
+    embedding_state = state_store.load()
     # { file_id: rev }
-
-    # ── Scan metadata blobs ───────────────────────────────
-    meta_keys = list_blobs(BUCKET, config.GCS_PREFIX_META)
+    cache = EmbeddingCache(
+        BUCKET,
+        config.EMBEDDING_MODEL_NAME,
+        config.EMBEDDING_DIMENSION,
+        local_dir=config.EMBED_CACHE_DIR,
+    ).load()
+
+    # ── Load the image catalog ────────────────────────────
+    manifest = Manifest(BUCKET).load()
+    if manifest.exists:
+        image_rows = list(manifest.rows("images"))
+    else:
+        logger.warning("No file manifest yet — scanning metadata sidecars")
+        image_rows = [
+            row
+            for row in rows_from_sidecars(BUCKET, config.GCS_PREFIX_META)
+            if row.category == "images"
+        ]
+    logger.info("Catalog: %d images", len(image_rows))
     current_image_ids: set[str] = set()
 
-    stats = {"embedded": 0, "skipped": 0, "removed": 0, "errors": 0}
-    checkpoint_interval = 50  # Save state every N embeddings to survive timeouts
-    embeddings_since_checkpoint = 0
+    stats = {"embedded": 0, "cached": 0, "skipped": 0, "removed": 0, "errors": 0}
+    objects = BlobCatalog(BUCKET)  # sizes missing from older rows
 
-    for mk in meta_keys:
-        if not mk.endswith(".json"):
-            continue
+    # ── Pipeline stages ───────────────────────────────────
+    bucket = TokenBucket(rate=config.EMBED_REQUESTS_PER_MINUTE / 60)
 
-        meta = read_json(BUCKET, mk)
-        if meta.get("category") != "images":
-            continue
-
-        file_id = meta["dropbox_file_id"]
-        rev = meta["rev"]
+    def embed(image_bytes: bytes) -> list:
+        """Embed one image (worker thread), backing off on quota errors."""
+        for attempt in range(EMBED_RETRIES):
+            bucket.acquire()
+            try:
+                response = model.get_embeddings(
+                    image=Image(image_bytes=image_bytes),
+                    dimension=config.EMBEDDING_DIMENSION,
+                )
+                return response.image_embedding
+            except ResourceExhausted:
+                if attempt == EMBED_RETRIES - 1:
+                    raise
+                # Every worker waits, not just this one
+                bucket.pause(QUOTA_BACKOFF_SECONDS * 2**attempt)
+        return []
+
+    def upsert(datapoints: list) -> None:
+        vs_index.upsert_datapoints(datapoints=datapoints)
+
+    batch: list = []  # (row, datapoint) awaiting upsert
+    batch_seq = 0
+    # content hash → further rows with the same bytes, waiting on one embed
+    waiting: dict[str, list[ManifestRow]] = {}
+
+    def fail(row: ManifestRow) -> None:
+        stats["errors"] += 1 + len(waiting.pop(row.content_hash, []))
+
+    def on_fetched(row: ManifestRow, image_bytes, error) -> None:
+        if error is not None:
+            logger.error("Failed to download %s", row.gcs_key, exc_info=error)
+            fail(row)
+            return
+        embed_pool.submit(row.file_id, embed, image_bytes, context=row)
+
+    def on_embedded(row: ManifestRow, vector, error) -> None:
+        if error is not None:
+            logger.error("Failed to embed %s", row.file_id, exc_info=error)
+            fail(row)
+            return
+        if not vector:
+            logger.warning("Empty embedding for %s — skipping", row.file_id)
+            fail(row)
+            return
+        if row.content_hash:
+            cache.put(row.content_hash, vector)
+        add_datapoint(row, vector)
+        for dup in waiting.pop(row.content_hash, []):
+            stats["cached"] += 1
+            add_datapoint(dup, vector)
+
+    def add_datapoint(row: ManifestRow, vector: list) -> None:
+        datapoint = index_types.IndexDatapoint(
+            datapoint_id=row.file_id,
+            feature_vector=vector,
+            restricts=_restrict_images(),
+        )
+        batch.append((row, datapoint))
+        if len(batch) >= config.EMBED_UPSERT_BATCH:
+            flush_batch()
+
+    def flush_batch() -> None:
+        nonlocal batch, batch_seq
+        if not batch:
+            return
+        items, batch = batch, []
+        batch_seq += 1
+        upsert_pool.submit(
+            batch_seq, upsert, [dp for _, dp in items], context=items
+        )
+
+    def on_upserted(items: list, _result, error) -> None:
+        if error is not None:
+            # Not recorded in embedding_state, so the next run retries them
+            logger.error("Failed to upsert %d datapoints", len(items), exc_info=error)
+            stats["errors"] += len(items)
+            return
+        for row, _ in items:
+            embedding_state[row.file_id] = row.rev
+        stats["embedded"] += len(items)
+        # ── Checkpoint save to survive timeouts ───────
+        cache.flush()  # never record a rev whose vector isn't cached
+        state_store.checkpoint(embedding_state)
+        logger.info(
+            "Committed %d datapoints — embedded=%d  skipped=%d so far",
+            len(items),
+            stats["embedded"],
+            stats["skipped"],
+        )
+
+    fetch_pool = TransferPool(config.EMBED_PREFETCH_WORKERS, on_done=on_fetched)
+    embed_pool = TransferPool(config.EMBED_WORKERS, on_done=on_embedded)
+    upsert_pool = TransferPool(1, on_done=on_upserted)
+
+    started = time.monotonic()
+    for row in image_rows:
+        file_id = row.file_id
         current_image_ids.add(file_id)
 
         # Already embedded at this rev?
-        if embedding_state.get(file_id) == rev:
+        if embedding_state.get(file_id) == row.rev:
             stats["skipped"] += 1
             continue
 
         # ── Check file size before downloading ─────────
-        image_key = f"{config.GCS_PREFIX_IMAGES}{file_id}"
-        try:
-            file_size = get_blob_size(BUCKET, image_key)
-        except Exception:
-            file_size = 0
-
-        if file_size > MAX_IMAGE_SIZE_BYTES:
+        size = row.size or objects.size(row.gcs_key)
+        if size > MAX_IMAGE_SIZE_BYTES:
             logger.info(
                 "Skipping %s — size %d MB exceeds 20 MB limit",
-                meta.get("caption", file_id),
-                file_size // (1024 * 1024),
+                file_id,
+                size // (1024 * 1024),
             )
             stats["skipped"] += 1
             continue
 
-        # ── Embed ─────────────────────────────────────────
-        try:
-            gcs_uri = meta["gcs_uri"]
-            image_bytes = download_bytes(BUCKET, image_key)
-            image = Image(image_bytes=image_bytes)
-
-            response = model.get_embeddings(
-                image=image,
-                dimension=config.EMBEDDING_DIMENSION,
-            )
-            vector = response.image_embedding
-
-            if not vector:
-                logger.warning("Empty embedding for %s — skipping", file_id)
-                stats["errors"] += 1
+        # Same bytes embedded before (or being embedded now)?  Reuse it.
+        content_hash = row.content_hash
+        if content_hash:
+            if content_hash in waiting:
+                waiting[content_hash].append(row)
+                continue
+            vector = cache.get(content_hash)
+            if vector is not None:
+                stats["cached"] += 1
+                add_datapoint(row, vector)
                 continue
+            waiting[content_hash] = []
 
-            # ── Upsert datapoint ──────────────────────────
-            datapoint = index_types.IndexDatapoint(
-                datapoint_id=file_id,
-                feature_vector=vector,
-                restricts=[
-                    index_types.IndexDatapoint.Restriction(
-                        namespace="category",
-                        allow_list=["images"],
-                    ),
-                ],
-            )
-            vs_index.upsert_datapoints(datapoints=[datapoint])
-
-            embedding_state[file_id] = rev
-            stats["embedded"] += 1
-            embeddings_since_checkpoint += 1
-            logger.info("Embedded %s (rev=%s)", meta.get("caption", file_id), rev)
-
-            # ── Checkpoint save to survive timeouts ───────
-            if embeddings_since_checkpoint >= checkpoint_interval:
-                write_json(BUCKET, config.EMBEDDING_STATE_KEY, embedding_state)
-                logger.info(
-                    "Checkpoint saved — embedded=%d  skipped=%d so far",
-                    stats["embedded"],
-                    stats["skipped"],
-                )
-                embeddings_since_checkpoint = 0
+        # Duplicates share one stored object, so follow the row's key
+        fetch_pool.submit(file_id, download_bytes, BUCKET, row.gcs_key, context=row)
+        embed_pool.poll()
+        upsert_pool.poll()
 
-        except Exception:
-            logger.exception("Failed to embed %s", file_id)
-            stats["errors"] += 1
+    # Drain the stages in order so each feeds the next
+    fetch_pool.close()
+    embed_pool.close()
+    flush_batch()
+    upsert_pool.close()
+    cache.flush()  # vectors of failed upserts are still worth keeping
+    logger.info("Pipeline drained in %.0fs", time.monotonic() - started)
 
     # ── Remove stale datapoints ───────────────────────────
     stale_ids = set(embedding_state.keys()) - current_image_ids
@@ -170,11 +280,50 @@ def run() -> None:
             logger.exception("Failed to remove stale datapoints")
 
     # ── Persist state ─────────────────────────────────────
-    write_json(BUCKET, config.EMBEDDING_STATE_KEY, embedding_state)
+    state_store.checkpoint(embedding_state)
+
+    # ── Export the local index ────────────────────────────
+    changed = stats["embedded"] or stats["removed"]
+    if changed or not read_index_meta(
+        BUCKET, config.EMBEDDING_MODEL_NAME, config.EMBEDDING_DIMENSION
+    ):
+        uncached = 0
+
+        def current_vectors():
+            nonlocal uncached
+            for row in image_rows:
+                if embedding_state.get(row.file_id) != row.rev:
+                    continue
+                vector = cache.get(row.content_hash) if row.content_hash else None
+                if vector is None:
+                    uncached += 1  # embedded before the cache existed
+                    continue
+                yield row.file_id, vector
+
+        try:
+            export_index(
+                BUCKET,
+                config.EMBEDDING_MODEL_NAME,
+                config.EMBEDDING_DIMENSION,
+                current_vectors(),
+                count=len(image_rows),
+                dtype=config.LOCAL_INDEX_DTYPE,
+            )
+            if uncached:
+                logger.warning(
+                    "Local index: %d embedded images have no cached vector", uncached
+                )
+        except Exception:
+            logger.exception("Failed to export the local index")
+
+    # Image results changed: let query caches know
+    if changed:
+        publish_version(BUCKET, EMBEDDING_VERSION_KEY)
 
     logger.info(
-        "Embedding complete — embedded=%d  skipped=%d  removed=%d  errors=%d",
+        "Embedding complete — embedded=%d  cached=%d  skipped=%d  removed=%d  errors=%d",
         stats["embedded"],
+        stats["cached"],
         stats["skipped"],
         stats["removed"],
         stats["errors"],
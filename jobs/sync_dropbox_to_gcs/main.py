@@ -3,38 +3,99 @@ Job A — Sync Dropbox → GCS mirror.
 
 Behaviour:
   1. Read saved cursor from GCS (or None on first run).
-  2. Baseline crawl (no cursor) or incremental sync (has cursor).
-  3. For each FileMetadata  → download, upload to mirror/<cat>/<id>, write meta JSON.
+  2. Baseline crawl (no cursor) or incremental sync (has cursor), streamed
+     one listing page at a time.
+  3. For each FileMetadata  → stream Dropbox → mirror/<cat>/<id>, write meta JSON
+     (regular files run concurrently on a bounded transfer pool).
+     Content already mirrored (same Dropbox content_hash) is not transferred
+     again; duplicates reference one stored object via hash_index.
      For each DeletedMetadata → remove blob + meta, update path index.
-  4. Persist new cursor + path index to GCS.
+     Deletes paired with an add of the same file id in the same page are
+     moves/renames: only path_index and the sidecar are rewritten.
+  4. After each finished page, persist indexes + that page's cursor to GCS
+     (throttled), so a timed-out run resumes from the last finished page.
+  5. Keep the columnar file manifest (shared/manifest.py) in step with the
+     sidecars so other jobs can load the catalog without reading them.
+
+With several tasks (SYNC_TASK_COUNT / CLOUD_RUN_TASK_COUNT) each task syncs
+the files whose id hashes to it and saves its changes to its own shard;
+the last task to finish merges them and commits the cursor
+(shared/sync_shards.py).
 """
 
 import logging
 import mimetypes
 import os
 import sys
+import threading
+import time
+import zipfile
+from functools import partial
 from pathlib import Path
+from typing import Any, Optional
 
 # ── make `shared` importable when running from repo root ──
 sys.path.insert(0, "/app")  # Docker layout
 sys.path.insert(0, ".")     # local dev
 
 from shared import config  # noqa: E402
-from shared.categories import categorize, gcs_key, meta_key, mime_type  # noqa: E402
-from shared.dropbox_client import DropboxClient  # noqa: E402
-from shared.dropbox_download import download_large_file  # noqa: E402
-from shared.zip_handler import extract_zip_streaming, SCRATCH_DIR  # noqa: E402
+from shared.categories import (  # noqa: E402
+    categorize,
+    gcs_key,
+    members_key,
+    meta_key,
+    mime_type,
+)
+from shared.dedup import HashIndex, dedup_key, shared_object_key  # noqa: E402
+from shared.dropbox_client import (  # noqa: E402
+    KIND_DELETED,
+    KIND_FILE,
+    DropboxClient,
+    ListedEntry,
+)
+from shared.dropbox_download import (  # noqa: E402
+    discard_download,
+    download_large_file,
+)
+from shared.path_index import PathIndex  # noqa: E402
+from shared.zip_handler import (  # noqa: E402
+    SCRATCH_DIR,
+    ExtractedFile,
+    HashingReader,
+    ScratchBudget,
+    extract_zip_streaming,
+    extractable_members,
+)
 from shared.gcs import (  # noqa: E402
-    delete_blob,
-    list_blobs,
+    BlobCatalog,
+    copy_blob,
     read_json,
-    upload_bytes,
     upload_from_filename,
+    upload_stream,
     write_json,
 )
-from shared.vertex_search import DocImportBuffer  # noqa: E402
-
-from dropbox.files import DeletedMetadata, FileMetadata, FolderMetadata  # noqa: E402
+from shared.manifest import Manifest, ManifestRow, rows_from_sidecars  # noqa: E402
+from shared.remote_file import RemoteFile, member_ranges  # noqa: E402
+from shared.state_store import SYNC_VERSION_KEY, StateStore, publish_version  # noqa: E402
+from shared.sync_shards import (  # noqa: E402
+    TaskShard,
+    apply_delta,
+    apply_manifest_delta,
+    clear_changes,
+    delete_shards,
+    dict_delta,
+    load_shards,
+    manifest_delta,
+    merge_dict_deltas,
+    merge_hash_deltas,
+    merge_manifest_deltas,
+)
+from shared.transfer import PageLedger, TransferPool  # noqa: E402
+from shared.vertex_search import (  # noqa: E402
+    DocImportBuffer,
+    ImportTracker,
+    IncrementalImporter,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -44,18 +105,151 @@ logger = logging.getLogger(__name__)
 
 BUCKET = config.GCS_BUCKET_NAME
 
-# Size limit: skip files larger than 150 MB (Dropbox SDK download limit)
-MAX_FILE_SIZE = 150 * 1024 * 1024
-
 # Save state every N files to survive timeouts
 SAVE_INTERVAL = 100
 
+# Commit the listing cursor at a page boundary at least this often (seconds)
+CURSOR_COMMIT_SECONDS = 60
+
 
 def _clean_file_id(raw_id: str) -> str:
     """Strip the 'id:' prefix Dropbox uses, keep alphanumeric ID."""
     return raw_id.replace("id:", "") if raw_id else raw_id
 
 
+_local = threading.local()
+
+
+def _worker_dropbox() -> DropboxClient:
+    """Per-thread Dropbox client so workers don't share an HTTP session."""
+    dbx = getattr(_local, "dbx", None)
+    if dbx is None:
+        dbx = DropboxClient(
+            app_key=config.DROPBOX_APP_KEY,
+            app_secret=config.DROPBOX_APP_SECRET,
+            refresh_token=config.DROPBOX_REFRESH_TOKEN,
+            max_connections=2,
+        )
+        _local.dbx = dbx
+    return dbx
+
+
+def _transfer_file(
+    entry: ListedEntry,
+    file_id: str,
+    cat: str,
+    obj_key: str,
+    source_key: Optional[str] = None,
+) -> dict:
+    """Stream one file Dropbox → GCS and write its sidecar (worker thread).
+
+    The Dropbox response body is piped straight into a GCS upload with
+    bounded buffers, so file size doesn't affect memory.  The download is
+    pinned to the listed rev so the byte count matches ``entry.size``.
+    With *source_key* (content already mirrored) nothing is transferred and
+    the sidecar points at that object instead.
+    Returns the metadata sidecar written for the file.
+    """
+    content_type = mime_type(entry.name)
+    if source_key:
+        gcs_uri = f"gs://{BUCKET}/{source_key}"
+    else:
+        with _worker_dropbox().open_download(entry.path_lower, rev=entry.rev) as (
+            _,
+            response,
+        ):
+            gcs_uri = upload_stream(
+                BUCKET, obj_key, response.raw, entry.size, content_type
+            )
+
+    # Write metadata sidecar
+    meta_obj = {
+        "dropbox_file_id": file_id,
+        "dropbox_path": entry.path_display,
+        "rev": entry.rev,
+        "mime_type": content_type,
+        "size": entry.size,
+        "server_modified": entry.server_modified,
+        "category": cat,
+        "gcs_uri": gcs_uri,
+        "caption": entry.name,
+        "content_hash": entry.content_hash,
+    }
+    write_json(BUCKET, meta_key(file_id), meta_obj)
+    return meta_obj
+
+
+def _patch_meta(file_id: str, updates: dict) -> None:
+    """Read-modify-write a metadata sidecar (worker thread)."""
+    meta = read_json(BUCKET, meta_key(file_id))
+    if meta:
+        meta.update(updates)
+        write_json(BUCKET, meta_key(file_id), meta)
+
+
+def _upload_member(
+    extracted: ExtractedFile, obj_key: str, budget: ScratchBudget
+) -> str:
+    """Upload one extracted ZIP member, then free its scratch (worker thread)."""
+    try:
+        return upload_from_filename(
+            BUCKET, obj_key, str(extracted.local_path), mime_type(extracted.filename)
+        )
+    finally:
+        extracted.local_path.unlink(missing_ok=True)
+        budget.release(extracted.size)
+
+
+def _stream_member(
+    zf: zipfile.ZipFile, info: zipfile.ZipInfo, zip_dropbox_path: str, obj_key: str
+) -> ExtractedFile:
+    """Decompress one ZIP member straight into GCS, hashing it (worker thread)."""
+    filename = info.filename.rsplit("/", 1)[-1]
+    with zf.open(info) as src:
+        reader = HashingReader(src)
+        upload_stream(BUCKET, obj_key, reader, info.file_size, mime_type(filename))
+    return ExtractedFile(
+        original_zip_path=zip_dropbox_path,
+        inner_path=info.filename,
+        filename=filename,
+        local_path=None,
+        size=info.file_size,
+        content_hash=reader.hexdigest(),
+        crc=info.CRC,
+        header_offset=info.header_offset,
+    )
+
+
+def _write_sidecars(metas: list[dict]) -> None:
+    """Write a batch of metadata sidecars (worker thread)."""
+    for meta in metas:
+        write_json(BUCKET, meta_key(meta["dropbox_file_id"]), meta)
+
+
+def _storage_class(path: str) -> tuple:
+    """(category, key extension) — a file whose class changes needs a new object."""
+    cat = categorize(path)
+    _, ext = os.path.splitext(path)
+    return cat, ext.lower() if cat == "docs" else ""
+
+
+def rebuild_from_sidecars(rev_index: Any, manifest: Manifest) -> bool:
+    """Fill a missing rev_index / manifest from the metadata sidecars
+    (migration).  Returns whether anything was rebuilt."""
+    if rev_index and manifest.exists:
+        return False
+    logger.info("Rebuilding rev_index and manifest from existing metadata...")
+    fill_revs = not rev_index
+    for row in rows_from_sidecars(BUCKET, config.GCS_PREFIX_META):
+        manifest.upsert(row)
+        if fill_revs and row.rev:
+            rev_index[row.file_id] = row.rev
+    if rev_index:
+        logger.info("Rebuilt rev_index with %d entries", len(rev_index))
+    manifest.mark_all_dirty()  # write every shard, even empty ones
+    return True
+
+
 def run() -> None:
     """Main sync logic."""
     dbx = DropboxClient(
@@ -66,84 +260,752 @@ def run() -> None:
 
     # ── Load state ────────────────────────────────────────
     sync_state = read_json(BUCKET, config.SYNC_STATE_KEY)
-    path_index: dict[str, str] = read_json(BUCKET, config.PATH_INDEX_KEY)
-    rev_index: dict[str, str] = read_json(BUCKET, config.REV_INDEX_KEY) or {}
-    # path_index: { dropbox_path_lower: file_id }
-    # rev_index: { file_id: rev } — tracks synced revisions to skip unchanged files
+    path_store = StateStore(
+        BUCKET, config.PATH_INDEX_STORE, config.PATH_INDEX_KEY, container=PathIndex
+    )
+    rev_store = StateStore(BUCKET, config.REV_INDEX_STORE, config.REV_INDEX_KEY)
+    hash_store = StateStore(BUCKET, config.HASH_INDEX_STORE, config.HASH_INDEX_KEY)
+    path_index = path_store.load()
+    rev_index = rev_store.load()
+    hash_entries = hash_store.load()
+    manifest = Manifest(BUCKET).load()
+
+    # Sharded run: this task handles the files it owns and keeps its changes
+    # in its own shard; the last task to finish merges them
+    task = None
+    previous = None
+    if config.SYNC_TASK_COUNT > 1:
+        task = TaskShard(
+            BUCKET, config.SYNC_RUN_ID, config.SYNC_TASK_INDEX, config.SYNC_TASK_COUNT
+        )
+        previous = task.load()
+        if previous and previous["finished"]:
+            logger.info("Task %d already finished in run %s", task.index, task.run_id)
+            if task.finish():
+                merge_shards(task.run_id, task.count)
+            return
+
+    # ── Rebuild rev_index / manifest from existing metadata (migration) ──
+    if rebuild_from_sidecars(rev_index, manifest):
+        if task is None:
+            rev_store.checkpoint(rev_index)
+            manifest.save()
+        else:  # in memory only: the merge rebuilds and saves them once
+            clear_changes(manifest, rev_index)
 
-    # ── Rebuild rev_index from existing metadata (migration) ──
-    if not rev_index:
-        logger.info("Rebuilding rev_index from existing metadata...")
-        meta_keys = list_blobs(BUCKET, config.GCS_PREFIX_META)
-        for mkey in meta_keys:
-            if mkey.endswith(".json"):
-                meta = read_json(BUCKET, mkey)
-                fid = meta.get("dropbox_file_id")
-                rev = meta.get("rev")
-                if fid and rev:
-                    rev_index[fid] = rev
-        if rev_index:
-            write_json(BUCKET, config.REV_INDEX_KEY, rev_index)
-            logger.info("Rebuilt rev_index with %d entries", len(rev_index))
+    if previous:  # an earlier attempt of this task: carry on from its delta
+        logger.info("Task %d resuming from its shard", task.index)
+        apply_delta(path_index, previous["path"])
+        apply_delta(rev_index, previous["rev"])
+        apply_delta(hash_entries, previous["hash"])
+        apply_manifest_delta(manifest, previous["manifest"])
+        clear_changes(manifest, path_index, rev_index, hash_entries)
+    hashes = HashIndex(hash_entries)
+    # path_index: { dropbox_path_lower: file_id }, sorted for prefix queries
+    # rev_index: { file_id: rev } — tracks synced revisions to skip unchanged files
+    # hashes: content hash → stored object + referencing file ids (dedup)
+    # manifest: file_id → (category, rev, size, gcs key, hash) for readers
 
     saved_cursor = sync_state.get("cursor")
 
-    # ── List entries ──────────────────────────────────────
-    if saved_cursor:
-        logger.info("Incremental sync from saved cursor")
-        entries, new_cursor = dbx.list_changes(saved_cursor)
-    else:
-        logger.info("Baseline crawl (no cursor found)")
-        entries, new_cursor = dbx.list_all("")
+    # Blob attributes from listings.  A baseline crawl touches most of the
+    # mirror, so list it up front; incremental runs look keys up on demand.
+    objects = BlobCatalog(BUCKET)
+    if not saved_cursor:
+        for prefix in (
+            config.GCS_PREFIX_IMAGES,
+            config.GCS_PREFIX_DOCS,
+            config.GCS_PREFIX_MEDIA,
+            config.GCS_PREFIX_META,
+        ):
+            objects.load(prefix)
 
     # ── Process entries ───────────────────────────────────
-    stats = {"synced": 0, "deleted": 0, "skipped": 0, "unchanged": 0, "zip_extracted": 0, "docs_imported": 0}
+    stats = {"synced": 0, "deduped": 0, "moved": 0, "deleted": 0, "skipped": 0, "unchanged": 0, "zip_extracted": 0, "docs_imported": 0}
     total_processed = 0
-    doc_buffer = DocImportBuffer()  # Batch doc imports (50 at a time)
+    listed = 0  # listing entries seen (sharded runs pick the cursor by it)
+    # Sharded: orphaned objects, deleted by the merge if no task still uses them
+    orphans: set[str] = set()
+    if previous:
+        stats.update(previous["stats"])
+        total_processed = previous["processed"]
+    saved_at = total_processed  # total_processed at the last index save
+    committed_at = 0  # total_processed at the last cursor commit
+    last_commit_time = time.monotonic()
+    # Operations left in flight by earlier runs are resolved by this one
+    if task is None:
+        import_tracker = ImportTracker(BUCKET)
+    else:
+        import_tracker = ImportTracker(
+            BUCKET,
+            ledger_key=config.DOC_IMPORT_LEDGER_KEY.replace(
+                ".json", f"-task-{task.index}.json"
+            ),
+        )
+    import_tracker.load()
+    doc_buffer = DocImportBuffer(import_tracker)  # Batch doc imports (50 at a time, background worker)
+    jsonl_import = config.DOC_IMPORT_MODE == "jsonl"
+
+    def queue_doc_import(gcs_uri: str) -> None:
+        """Batch mode only: jsonl mode diffs the manifest at the end instead."""
+        if not jsonl_import:
+            doc_buffer.add(gcs_uri)
+
+    def task_state(cursor: Optional[str] = None) -> dict:
+        """Sharded: this task's changes since its last save, plus what the
+        merge needs.  *cursor* marks the task as finished."""
+        return {
+            "task": task.index,
+            "start_cursor": saved_cursor,
+            "finished": cursor is not None,
+            "cursor": cursor,
+            "listed": listed,
+            "processed": total_processed,
+            "stats": stats,
+            "path": dict_delta(path_index),
+            "rev": dict_delta(rev_index),
+            "hash": dict_delta(hash_entries),
+            "manifest": manifest_delta(manifest),
+            "orphans": sorted(orphans),
+        }
 
     def save_state_checkpoint():
-        """Save state periodically to survive timeouts."""
-        write_json(BUCKET, config.PATH_INDEX_KEY, path_index)
-        write_json(BUCKET, config.REV_INDEX_KEY, rev_index)
+        """Save state periodically to survive timeouts (changed keys only)."""
+        nonlocal saved_at
+        if task is not None:
+            task.save(task_state())
+            clear_changes(manifest, path_index, rev_index, hash_entries)
+            orphans.clear()
+        else:
+            path_store.checkpoint(path_index)
+            rev_store.checkpoint(rev_index)
+            hash_store.checkpoint(hash_entries)
+            manifest.checkpoint()  # changed rows only; shards at the end
+        import_tracker.save()
+        saved_at = total_processed
         logger.info("Checkpoint saved: %d processed so far", total_processed)
 
-    for entry in entries:
-        # — Folders: skip —
-        if isinstance(entry, FolderMetadata):
-            continue
+    def commit_cursor(cursor: str) -> None:
+        """Persist indexes (if dirty), then the cursor of a finished page."""
+        nonlocal committed_at, last_commit_time
+        if total_processed != saved_at:
+            save_state_checkpoint()
+        if task is None:  # sharded: the merge commits the cursor
+            write_json(BUCKET, config.SYNC_STATE_KEY, {"cursor": cursor})
+        committed_at = total_processed
+        last_commit_time = time.monotonic()
+
+    # dedup key → {path_lower: source_key} for transfers still in flight
+    inflight: dict[str, dict[str, Optional[str]]] = {}
+
+    def wait_for_uploads(dkey: str) -> None:
+        """Wait for in-flight uploads of *dkey* so the content can be reused."""
+        for path, source_key in list(inflight.get(dkey, {}).items()):
+            if source_key is None:
+                pool.wait_for(path)
+
+    def release_object(
+        file_id: str, keep_key: str = "", doomed: Optional[list[str]] = None
+    ) -> None:
+        """Drop *file_id*'s hash reference; delete the object once orphaned.
+
+        With *doomed*, the orphan's key is appended there for a batch delete.
+        """
+        dkey = hashes.dedup_key_of(file_id)
+        orphan = hashes.release(file_id)
+        if not orphan or orphan == keep_key:
+            return
+        if orphan in inflight.get(dkey, {}).values():
+            return  # an in-flight transfer is about to reference it again
+        if task is not None:
+            orphans.add(orphan)  # another task may have deduped onto it
+        elif doomed is not None:
+            doomed.append(orphan)
+        else:
+            objects.delete(orphan)
+
+    def switch_reference(
+        file_id: str, dkey: str, stored_key: str, own_key: str
+    ) -> None:
+        """Point *file_id*'s hash reference at *stored_key*, dropping the old one."""
+        if hashes.dedup_key_of(file_id):
+            release_object(file_id, keep_key=stored_key)
+        elif stored_key != own_key and hashes.dedup_key_of_object(own_key) is None:
+            # Mirrored before hash tracking; its own copy is now redundant
+            objects.delete(own_key)
+        if dkey:
+            hashes.add_ref(dkey, stored_key, file_id)
+
+    def preserve_shared_object(obj_key: str, file_id: str) -> None:
+        """Before *file_id* overwrites *obj_key*, move content other files
+        still reference to a shared key and repoint their sidecars.
+
+        Either way *obj_key* stops being the object for its old content, so
+        nothing dedups onto it while the new bytes are on their way.
+        """
+        dkey = hashes.dedup_key_of_object(obj_key)
+        if dkey is None:
+            return
+        for path in list(inflight.get(dkey, {})):
+            pool.wait_for(path)
+        others = [fid for fid in hashes.refs(dkey) if fid != file_id]
+        if not others:
+            hashes.release(file_id)  # the object is about to be replaced
+            return
+        new_key = shared_object_key(dkey)
+        gcs_uri = copy_blob(BUCKET, obj_key, new_key)
+        hashes.move_object(dkey, new_key)
+        for fid in others:
+            meta = objects.read_json(meta_key(fid))
+            if meta:
+                meta["gcs_uri"] = gcs_uri
+                write_json(BUCKET, meta_key(fid), meta)
+            manifest.update(fid, gcs_key=new_key)
+        if dkey.startswith("docs/"):
+            queue_doc_import(gcs_uri)
+        logger.info("Moved shared content %s → %s", obj_key, new_key)
+
+    def delete_file_objects(
+        file_id: str, doomed: Optional[list[str]] = None
+    ) -> None:
+        """Delete a file's blob (unless still shared) and its meta sidecar.
 
+        With *doomed*, the keys are appended there instead, so the caller
+        can send many files' deletes as batch requests.
+        """
+        keys = [] if doomed is None else doomed
+        if hashes.dedup_key_of(file_id):
+            release_object(file_id, doomed=keys)
+        else:
+            # Mirrored before hash tracking: the manifest row has the key
+            row = manifest.get(file_id)
+            if row is not None:
+                if row.gcs_key:  # "" for archives
+                    if task is not None:
+                        orphans.add(row.gcs_key)  # the merge keeps it if a row uses it
+                    elif hashes.dedup_key_of_object(row.gcs_key) is None and not any(
+                        other.gcs_key == row.gcs_key and other.file_id != file_id
+                        for other in manifest.rows(row.category)
+                    ):
+                        keys.append(row.gcs_key)  # no other file is served by it
+            else:
+                # Not in the manifest either: derive the key from the sidecar
+                meta = objects.read_json(meta_key(file_id))
+                cat = meta.get("category")
+                if cat and cat != "archive":
+                    # For docs, gcs_uri includes extension; extract it
+                    gcs_uri = meta.get("gcs_uri", "")
+                    extension = ""
+                    if cat == "docs" and gcs_uri:
+                        _, extension = os.path.splitext(gcs_uri)
+                    keys.append(gcs_key(cat, file_id, extension))
+        keys.append(meta_key(file_id))
+        manifest.remove(file_id)
+        if doomed is None:
+            objects.delete_many(keys)
+
+    # new path_lower → old path_lower for moves detected in the current page
+    moves: dict[str, str] = {}
+
+    def plan_page(entries: list[ListedEntry]) -> list[ListedEntry]:
+        """Pair this page's deletes with adds of the same file id.
+
+        Fills ``moves`` and returns the entries to process: deletes absorbed
+        by a move are dropped, and deleted folders are expanded into the
+        indexed files they contained (ZIP members go with their ZIP).
+        """
+        moves.clear()
+        added = {
+            _clean_file_id(e.id): e.path_lower for e in entries if e.kind == KIND_FILE
+        }
+        planned: list[ListedEntry] = []
+        for e in entries:
+            if e.kind != KIND_DELETED:
+                planned.append(e)
+                continue
+            if e.path_lower in path_index:
+                old_paths = [e.path_lower]
+            else:
+                prefix = f"{e.path_lower}/"
+                old_paths = [
+                    p for p, _ in path_index.with_prefix(prefix) if "!/" not in p
+                ]
+                if not old_paths:
+                    planned.append(e)
+                    continue
+            for old in old_paths:
+                new = added.get(path_index[old])
+                if new and new != old:
+                    moves[new] = old
+                elif old == e.path_lower:
+                    planned.append(e)
+                else:
+                    planned.append(
+                        ListedEntry(
+                            kind=KIND_DELETED,
+                            path_lower=old,
+                            path_display=old,
+                            name=old.rsplit("/", 1)[-1],
+                        )
+                    )
+        if moves:
+            logger.info("Detected %d moved/renamed files in page", len(moves))
+        return planned
+
+    def submit_patch(path: str, file_id: str, updates: dict) -> None:
+        ledger.add(page_seq)
+        pool.submit(
+            path,
+            _patch_meta,
+            file_id,
+            updates,
+            context=partial(on_patch_done, file_id, page_seq),
+        )
+
+    def on_patch_done(file_id: str, seq: int, _result, error) -> None:
+        ledger.done(seq)
+        if error is not None:
+            logger.error("Failed to update sidecar of %s", file_id, exc_info=error)
+
+    def apply_move(entry: ListedEntry, file_id: str, old_path: str) -> bool:
+        """Re-key a moved/renamed file.
+
+        Returns True when that was all it needed (metadata-only), False when
+        the caller must still process it normally (content changed too).
+        """
+        nonlocal total_processed
+        pool.wait_for(old_path)
+        path_index.pop(old_path, None)
+
+        if entry.name.lower().endswith(".zip"):
+            row = manifest.get(file_id)
+            unchanged = rev_index.get(file_id) == entry.rev or (
+                entry.content_hash
+                and row is not None
+                and row.content_hash == entry.content_hash
+            )
+            old_prefix = f"{old_path}!/"
+            new_prefix = f"{entry.path_lower}!/"
+            children = path_index.with_prefix(old_prefix)
+            for child_path, child_id in children:
+                new_child = new_prefix + child_path[len(old_prefix):]
+                path_index.pop(child_path, None)
+                path_index[new_child] = child_id
+                if unchanged:  # otherwise re-extraction rewrites the sidecars
+                    submit_patch(
+                        new_child,
+                        child_id,
+                        {"dropbox_path": new_child, "source_zip": entry.path_display},
+                    )
+            if not unchanged:
+                return False
+            updates = {
+                "dropbox_path": entry.path_display,
+                "rev": entry.rev,
+                "server_modified": entry.server_modified,
+            }
+        else:
+            if rev_index.get(file_id) != entry.rev:
+                return False  # edited as well; content-hash dedup keeps it cheap
+            if _storage_class(old_path) != _storage_class(entry.name):
+                rev_index.pop(file_id, None)  # must be stored under a new key
+                return False
+            updates = {"dropbox_path": entry.path_display, "caption": entry.name}
+
+        submit_patch(entry.path_lower, file_id, updates)
+        path_index[entry.path_lower] = file_id
+        rev_index[file_id] = entry.rev
+        manifest.update(file_id, rev=entry.rev)
+        stats["moved"] += 1
+        total_processed += 1
+        logger.info("Moved %s → %s (id=%s)", old_path, entry.path_display, file_id)
+        return True
+
+    def extract_zip_members(
+        entry: ListedEntry,
+        file_id: str,
+        zip_source: Path | RemoteFile,
+        previous: dict[str, Optional[list]],
+    ) -> tuple[int, bool, dict[str, list]]:
+        """Mirror the members of a ZIP (downloaded, or read remotely by range).
+
+        *previous* is the member manifest of the last synced rev
+        ({inner path: [crc, size, header offset]}; None values for a ZIP
+        synced before manifests existed).  Members whose CRC and size are
+        unchanged are left alone; members no longer in the archive have
+        their objects, sidecars and path_index entries removed.
+
+        In ``stream`` mode (ZIP_EXTRACT_MODE) each member is decompressed
+        straight into a GCS upload on a worker and hashed on the way; one
+        that turns out to duplicate stored content has its fresh copy
+        dropped.  In ``disk`` mode members are extracted to scratch first,
+        bounded by the scratch budget, so duplicates are never uploaded.
+        A RemoteFile source (stream mode only) is told which members will
+        be mirrored, so only their byte ranges are fetched.  Either way up to ZIP_UPLOAD_WORKERS members upload at once and
+        sidecars go out in batches of ZIP_SIDECAR_BATCH.
+        Returns (members mirrored, whether every upload and sidecar landed,
+        the new member manifest).
+        """
+        zip_pool = TransferPool(
+            config.ZIP_UPLOAD_WORKERS,
+            on_done=lambda done, result, error: done(result, error),
+        )
+        sidecars: list[dict] = []
+        uploading: dict[str, str] = {}  # dedup key → member being uploaded
+        members = {path: m for path, m in previous.items() if m is not None}
+        seen: set[str] = set()
+        listed = False  # the archive's directory was read
+        count = 0
+        ok = True
+
+        def wanted(info: zipfile.ZipInfo) -> bool:
+            """Note the member; extract it unless CRC and size are unchanged."""
+            seen.add(info.filename)
+            old = previous.get(info.filename)
+            if old is not None and old[:2] == [info.CRC, info.file_size]:
+                stats["unchanged"] += 1
+                return False
+            return True
+
+        def remove_member(inner_path: str, doomed: list[str]) -> None:
+            synthetic_path = f"{entry.path_lower}!/{inner_path}"
+            inner_id = path_index.pop(synthetic_path, None)
+            members.pop(inner_path, None)
+            if inner_id:
+                delete_file_objects(inner_id, doomed)
+                stats["deleted"] += 1
+                logger.info("Deleted ZIP member no longer in archive: %s", synthetic_path)
+
+        def on_sidecars_done(_result, error) -> None:
+            nonlocal ok
+            if error is not None:
+                logger.error(
+                    "Failed to write ZIP member sidecars for %s",
+                    entry.path_display,
+                    exc_info=error,
+                )
+                ok = False
+
+        def flush_sidecars() -> None:
+            if sidecars:
+                batch = sidecars[:]
+                sidecars.clear()
+                zip_pool.submit(
+                    ("sidecars", batch[0]["dropbox_file_id"]),
+                    _write_sidecars,
+                    batch,
+                    context=on_sidecars_done,
+                )
+
+        def member_target(
+            filename: str, inner_path: str
+        ) -> Optional[tuple[str, str, str, str]]:
+            """(category, inner id, key extension, object key), or None to skip."""
+            inner_cat = categorize(filename)
+            if inner_cat is None:
+                logger.debug(
+                    "Skipping unsupported in ZIP: %s/%s", entry.path_lower, inner_path
+                )
+                stats["skipped"] += 1
+                return None
+            inner_id = f"{file_id}___{inner_path.replace('/', '_')}"
+            # Preserve file extension for docs (Vertex AI Search needs it)
+            _, ext = os.path.splitext(filename)
+            extension = ext.lower() if inner_cat == "docs" else ""
+            return inner_cat, inner_id, extension, gcs_key(inner_cat, inner_id, extension)
+
+        def finish_member(
+            extracted: ExtractedFile,
+            inner_id: str,
+            inner_cat: str,
+            dkey: str,
+            obj_key: str,
+            source_key: Optional[str],
+        ) -> None:
+            nonlocal count
+            stored_key = source_key or obj_key
+            gcs_uri = f"gs://{BUCKET}/{stored_key}"
+            switch_reference(inner_id, dkey, stored_key, obj_key)
+
+            inner_mime, _ = mimetypes.guess_type(extracted.filename)
+            sidecars.append(
+                {
+                    "dropbox_file_id": inner_id,
+                    "dropbox_path": f"{entry.path_lower}!/{extracted.inner_path}",
+                    "rev": entry.rev,
+                    "mime_type": inner_mime or "application/octet-stream",
+                    "size": extracted.size,
+                    "server_modified": entry.server_modified,
+                    "category": inner_cat,
+                    "gcs_uri": gcs_uri,
+                    "caption": extracted.filename,
+                    "source_zip": entry.path_display,
+                    "content_hash": extracted.content_hash,
+                }
+            )
+            manifest.upsert(
+                ManifestRow(
+                    inner_id,
+                    inner_cat,
+                    entry.rev,
+                    extracted.size,
+                    stored_key,
+                    extracted.content_hash,
+                )
+            )
+
+            # Queue doc for batched import to Vertex AI Search
+            if inner_cat == "docs" and not source_key:
+                queue_doc_import(gcs_uri)
+                logger.debug("Queued ZIP-extracted doc for import: %s", extracted.filename)
+
+            # Update path_index for this extracted file
+            synthetic_path = f"{entry.path_lower}!/{extracted.inner_path}"
+            path_index[synthetic_path] = inner_id
+            members[extracted.inner_path] = [
+                extracted.crc,
+                extracted.size,
+                extracted.header_offset,
+            ]
+
+            count += 1
+            stats["zip_extracted"] += 1
+            if len(sidecars) >= config.ZIP_SIDECAR_BATCH:
+                flush_sidecars()
+
+        def upload_failed(extracted_path: str, error: BaseException) -> None:
+            nonlocal ok
+            logger.error("Failed to upload ZIP member %s", extracted_path, exc_info=error)
+            stats["skipped"] += 1
+            ok = False
+
+        # ── stream mode ──
+
+        def on_member_streamed(
+            inner_id: str,
+            inner_cat: str,
+            extension: str,
+            obj_key: str,
+            inner_path: str,
+            extracted: Optional[ExtractedFile],
+            error,
+        ) -> None:
+            if error is not None:
+                upload_failed(inner_path, error)
+                return
+            # The content hash is only known now that the bytes went past
+            dkey = dedup_key(inner_cat, extracted.content_hash, extension)
+            wait_for_uploads(dkey)
+            source_key = hashes.object_for(dkey)
+            if source_key and source_key != obj_key:
+                stats["deduped"] += 1
+                logger.debug("ZIP member %s duplicates %s", inner_path, source_key)
+                finish_member(extracted, inner_id, inner_cat, dkey, obj_key, source_key)
+                # The fresh copy is redundant unless something is stored there
+                if hashes.dedup_key_of_object(obj_key) is None:
+                    objects.delete(obj_key)
+                return
+            logger.info(
+                "Streamed ZIP member: %s (%.1f MB) → %s",
+                inner_path,
+                extracted.size / (1024 * 1024),
+                obj_key,
+            )
+            finish_member(extracted, inner_id, inner_cat, dkey, obj_key, None)
+
+        def stream_members() -> None:
+            nonlocal ok, listed
+            try:
+                zf = zipfile.ZipFile(zip_source)
+            except zipfile.BadZipFile:
+                logger.warning("Corrupt or invalid ZIP: %s", entry.path_display)
+                return
+            except OSError:
+                logger.exception("Failed to open ZIP: %s", entry.path_display)
+                ok = False
+                return
+            with zf:
+                listed = True
+                todo = []
+                for info in extractable_members(zf, entry.path_lower):
+                    if not wanted(info):
+                        continue
+                    target = member_target(info.filename.rsplit("/", 1)[-1], info.filename)
+                    if target is not None:
+                        todo.append((info, target))
+                if isinstance(zip_source, RemoteFile):
+                    # Fetch only the members that will be mirrored
+                    zip_source.plan(member_ranges(zf, [info for info, _ in todo]))
+
+                for info, (inner_cat, inner_id, extension, obj_key) in todo:
+                    zip_pool.poll()
+                    preserve_shared_object(obj_key, inner_id)
+                    zip_pool.submit(
+                        info.filename,
+                        _stream_member,
+                        zf,
+                        info,
+                        entry.path_lower,
+                        obj_key,
+                        context=partial(
+                            on_member_streamed,
+                            inner_id,
+                            inner_cat,
+                            extension,
+                            obj_key,
+                            info.filename,
+                        ),
+                    )
+                # Workers read from zf: finish before it closes
+                zip_pool.drain()
+            if isinstance(zip_source, RemoteFile):
+                logger.info(
+                    "Range-read %.1f MB of %.1f MB in %d requests: %s",
+                    zip_source.bytes_fetched / (1024 * 1024),
+                    zip_source.size / (1024 * 1024),
+                    zip_source.requests,
+                    entry.path_display,
+                )
+
+        # ── disk mode ──
+
+        def on_member_uploaded(
+            extracted: ExtractedFile,
+            inner_id: str,
+            inner_cat: str,
+            dkey: str,
+            obj_key: str,
+            _gcs_uri,
+            error,
+        ) -> None:
+            uploading.pop(dkey, None)
+            if error is not None:
+                upload_failed(extracted.inner_path, error)
+                return
+            logger.info(
+                "Uploaded ZIP member: %s (%.1f MB) → %s",
+                extracted.inner_path,
+                extracted.size / (1024 * 1024),
+                obj_key,
+            )
+            finish_member(extracted, inner_id, inner_cat, dkey, obj_key, None)
+
+        def extract_members() -> None:
+            budget = ScratchBudget(config.ZIP_SCRATCH_BUDGET_MB * 1024 * 1024)
+            for extracted in extract_zip_streaming(
+                zip_source, entry.path_lower, budget=budget, wanted=wanted
+            ):
+                zip_pool.poll()
+                target = member_target(extracted.filename, extracted.inner_path)
+                if target is None:
+                    extracted.local_path.unlink(missing_ok=True)
+                    budget.release(extracted.size)
+                    continue
+                inner_cat, inner_id, extension, obj_key = target
+
+                # Reuse an object with identical content if one exists
+                dkey = dedup_key(inner_cat, extracted.content_hash, extension)
+                wait_for_uploads(dkey)
+                if dkey in uploading:
+                    zip_pool.wait_for(uploading[dkey])
+                source_key = hashes.object_for(dkey)
+                if source_key:
+                    extracted.local_path.unlink(missing_ok=True)
+                    budget.release(extracted.size)
+                    stats["deduped"] += 1
+                    logger.debug(
+                        "ZIP member %s duplicates %s",
+                        extracted.inner_path,
+                        source_key,
+                    )
+                    finish_member(
+                        extracted, inner_id, inner_cat, dkey, obj_key, source_key
+                    )
+                    continue
+
+                preserve_shared_object(obj_key, inner_id)
+                uploading[dkey] = extracted.inner_path
+                zip_pool.submit(
+                    extracted.inner_path,
+                    _upload_member,
+                    extracted,
+                    obj_key,
+                    budget,
+                    context=partial(
+                        on_member_uploaded, extracted, inner_id, inner_cat, dkey, obj_key
+                    ),
+                )
+
+        try:
+            if config.ZIP_EXTRACT_MODE == "disk":
+                extract_members()
+                listed = bool(seen)  # a corrupt archive yields nothing
+            else:
+                stream_members()
+            zip_pool.drain()
+            # Never on an unreadable archive: it would look empty
+            if listed:
+                doomed: list[str] = []
+                for inner_path in [p for p in previous if p not in seen]:
+                    remove_member(inner_path, doomed)
+                objects.delete_many(doomed)
+            flush_sidecars()
+        finally:
+            zip_pool.close()
+        return count, ok, members
+
+    def download_zip(entry: ListedEntry, zip_local: Path) -> None:
+        """Segmented download of a ZIP to scratch.
+
+        A second attempt (on a fresh temporary link, e.g. after the first
+        expired) resumes from the segments already on disk.
+        """
+        for attempt in (1, 2):
+            try:
+                download_large_file(
+                    dbx._dbx,
+                    entry.path_lower,
+                    zip_local,
+                    rev=entry.rev,
+                    workers=config.ZIP_DOWNLOAD_WORKERS,
+                    segment_size=config.ZIP_DOWNLOAD_SEGMENT_MB * 1024 * 1024,
+                )
+                return
+            except Exception:
+                if attempt == 2:
+                    raise
+                logger.warning(
+                    "ZIP download interrupted, resuming: %s",
+                    entry.path_display,
+                    exc_info=True,
+                )
+
+    def process_entry(entry: ListedEntry) -> None:
+        nonlocal total_processed
         # — Deletions —
-        if isinstance(entry, DeletedMetadata):
+        if entry.kind == KIND_DELETED:
             path_lower = entry.path_lower
+            pool.wait_for(path_lower)  # let an in-flight upload land first
 
             # ── ZIP deletion: clean up all extracted children ──
             if path_lower.endswith(".zip"):
                 zip_prefix = f"{path_lower}!/"
-                children_to_delete = [
-                    (p, fid)
-                    for p, fid in list(path_index.items())
-                    if p.startswith(zip_prefix)
-                ]
+                children_to_delete = path_index.with_prefix(zip_prefix)
+                doomed: list[str] = []
                 for child_path, child_id in children_to_delete:
-                    child_meta = read_json(BUCKET, meta_key(child_id))
-                    child_cat = child_meta.get("category")
-                    if child_cat:
-                        child_gcs_uri = child_meta.get("gcs_uri", "")
-                        child_ext = ""
-                        if child_cat == "docs" and child_gcs_uri:
-                            _, child_ext = os.path.splitext(child_gcs_uri)
-                        delete_blob(BUCKET, gcs_key(child_cat, child_id, child_ext))
-                    delete_blob(BUCKET, meta_key(child_id))
+                    delete_file_objects(child_id, doomed)
                     path_index.pop(child_path, None)
                     stats["deleted"] += 1
-                    logger.info("Deleted ZIP-extracted file: %s", child_path)
+                    logger.debug("Deleted ZIP-extracted file: %s", child_path)
 
                 # Remove the ZIP itself from rev_index
                 zip_file_id = path_index.get(path_lower)
                 if zip_file_id:
                     rev_index.pop(zip_file_id, None)
                     path_index.pop(path_lower, None)
-                    delete_blob(BUCKET, meta_key(zip_file_id))
+                    doomed += [meta_key(zip_file_id), members_key(zip_file_id)]
+                    manifest.remove(zip_file_id)
+                objects.delete_many(doomed)
 
                 total_processed += 1
                 logger.info(
@@ -153,26 +1015,16 @@ def run() -> None:
                 )
                 if total_processed % SAVE_INTERVAL == 0:
                     save_state_checkpoint()
-                continue
+                return
 
             # ── Regular file deletion ──
             file_id = path_index.get(path_lower)
             if not file_id:
                 logger.debug("Delete: no index entry for %s", path_lower)
                 stats["skipped"] += 1
-                continue
+                return
 
-            # Determine category from meta (if exists)
-            meta = read_json(BUCKET, meta_key(file_id))
-            cat = meta.get("category")
-            if cat:
-                # For docs, gcs_uri includes extension; extract it
-                gcs_uri = meta.get("gcs_uri", "")
-                extension = ""
-                if cat == "docs" and gcs_uri:
-                    _, extension = os.path.splitext(gcs_uri)
-                delete_blob(BUCKET, gcs_key(cat, file_id, extension))
-            delete_blob(BUCKET, meta_key(file_id))
+            delete_file_objects(file_id)
             path_index.pop(path_lower, None)
             rev_index.pop(file_id, None)
             stats["deleted"] += 1
@@ -181,20 +1033,40 @@ def run() -> None:
 
             if total_processed % SAVE_INTERVAL == 0:
                 save_state_checkpoint()
-            continue
+            return
 
         # — Files —
-        if isinstance(entry, FileMetadata):
+        if entry.kind == KIND_FILE:
             cat = categorize(entry.name)
 
             # ── ZIP file handling ──────────────────────────────
+            old_path = moves.pop(entry.path_lower, None)
+            if old_path and apply_move(entry, _clean_file_id(entry.id), old_path):
+                return
+
             if entry.name.lower().endswith(".zip"):
                 file_id = _clean_file_id(entry.id)
 
                 # Skip if ZIP rev unchanged
                 if rev_index.get(file_id) == entry.rev:
                     stats["unchanged"] += 1
-                    continue
+                    return
+
+                # Same bytes under a new rev (restore, re-listing): nothing to extract
+                if entry.content_hash and file_id in rev_index:
+                    prev_meta = objects.read_json(meta_key(file_id))
+                    if prev_meta.get("content_hash") == entry.content_hash:
+                        prev_meta.update(
+                            dropbox_path=entry.path_display,
+                            rev=entry.rev,
+                            server_modified=entry.server_modified,
+                        )
+                        write_json(BUCKET, meta_key(file_id), prev_meta)
+                        path_index[entry.path_lower] = file_id
+                        rev_index[file_id] = entry.rev
+                        manifest.update(file_id, rev=entry.rev)
+                        stats["unchanged"] += 1
+                        return
 
                 if entry.size > 10 * 1024 * 1024 * 1024:  # 10 GB hard limit
                     logger.warning(
@@ -203,7 +1075,7 @@ def run() -> None:
                         entry.path_display,
                     )
                     stats["skipped"] += 1
-                    continue
+                    return
 
                 logger.info(
                     "ZIP detected (%.2f GB): %s",
@@ -211,91 +1083,64 @@ def run() -> None:
                     entry.path_display,
                 )
 
-                # Step 1: Stream-download to scratch disk
-                zip_local = SCRATCH_DIR / f"{file_id}.zip"
-                zip_local.parent.mkdir(parents=True, exist_ok=True)
+                # Members mirrored from the last synced rev
+                previous_members = read_json(BUCKET, members_key(file_id)).get(
+                    "members", {}
+                )
+                if not previous_members and file_id in rev_index:
+                    # Synced before member manifests: diff against path_index
+                    zip_prefix = f"{entry.path_lower}!/"
+                    previous_members = {
+                        p[len(zip_prefix):]: None
+                        for p, _ in path_index.with_prefix(zip_prefix)
+                    }
+
+                # Step 1: Read the archive by range, or download it to scratch
+                zip_local = None
                 try:
-                    download_large_file(dbx._dbx, entry.path_lower, zip_local)
+                    if config.ZIP_EXTRACT_MODE != "disk" and config.ZIP_RANGE_READ:
+                        zip_source = RemoteFile(
+                            dbx.temporary_link(entry.path_lower, rev=entry.rev),
+                            entry.size,
+                        )
+                    else:
+                        zip_local = SCRATCH_DIR / f"{file_id}.zip"
+                        zip_local.parent.mkdir(parents=True, exist_ok=True)
+                        zip_source = zip_local
+                        download_zip(entry, zip_local)
                 except Exception:
                     logger.exception("Failed to download ZIP: %s", entry.path_display)
                     stats["skipped"] += 1
-                    continue
+                    if zip_local is not None:
+                        discard_download(zip_local)
+                    return
 
-                # Step 2: Stream-extract and upload one file at a time
-                zip_member_count = 0
+                # Step 2: Extract and upload members in a pipeline
                 try:
-                    for extracted in extract_zip_streaming(zip_local, entry.path_lower):
-                        inner_cat = categorize(extracted.filename)
-                        if inner_cat is None:
-                            logger.debug(
-                                "Skipping unsupported in ZIP: %s/%s",
-                                entry.path_lower,
-                                extracted.inner_path,
-                            )
-                            stats["skipped"] += 1
-                            extracted.local_path.unlink(missing_ok=True)
-                            continue
-
-                        inner_id = (
-                            f"{file_id}___{extracted.inner_path.replace('/', '_')}"
-                        )
-
-                        # Preserve file extension for docs (Vertex AI Search needs it)
-                        _, ext = os.path.splitext(extracted.filename)
-                        extension = ext.lower() if inner_cat == "docs" else ""
-                        obj_key = gcs_key(inner_cat, inner_id, extension)
-
-                        # Upload from disk (not memory)
-                        content_type_val = mime_type(extracted.filename)
-                        gcs_uri = upload_from_filename(
-                            BUCKET, obj_key, str(extracted.local_path), content_type_val
-                        )
-                        logger.info(
-                            "Uploaded ZIP member: %s (%.1f MB) → %s",
-                            extracted.inner_path,
-                            extracted.size / (1024 * 1024),
-                            obj_key,
-                        )
-
-                        # Write metadata sidecar
-                        inner_mime, _ = mimetypes.guess_type(extracted.filename)
-                        meta_obj = {
-                            "dropbox_file_id": inner_id,
-                            "dropbox_path": f"{entry.path_lower}!/{extracted.inner_path}",
-                            "rev": entry.rev,
-                            "mime_type": inner_mime or "application/octet-stream",
-                            "size": extracted.size,
-                            "server_modified": str(entry.server_modified),
-                            "category": inner_cat,
-                            "gcs_uri": gcs_uri,
-                            "caption": extracted.filename,
-                            "source_zip": entry.path_display,
-                        }
-                        write_json(BUCKET, meta_key(inner_id), meta_obj)
-
-                        # Queue doc for batched import to Vertex AI Search
-                        if inner_cat == "docs":
-                            doc_buffer.add(gcs_uri)
-                            logger.debug("Queued ZIP-extracted doc for import: %s", extracted.filename)
-
-                        # Update path_index for this extracted file
-                        synthetic_path = f"{entry.path_lower}!/{extracted.inner_path}"
-                        path_index[synthetic_path] = inner_id
-
-                        zip_member_count += 1
-                        stats["zip_extracted"] += 1
-
-                        # Delete temp file immediately to free disk
-                        extracted.local_path.unlink(missing_ok=True)
-
+                    zip_member_count, zip_ok, zip_members = extract_zip_members(
+                        entry, file_id, zip_source, previous_members
+                    )
                 finally:
                     # Always clean up the downloaded ZIP
-                    zip_local.unlink(missing_ok=True)
-                    logger.info(
-                        "ZIP done: %d files extracted from %s",
-                        zip_member_count,
-                        entry.path_display,
-                    )
+                    if zip_local is not None:
+                        discard_download(zip_local)
+                logger.info(
+                    "ZIP done: %d files extracted from %s",
+                    zip_member_count,
+                    entry.path_display,
+                )
+                # Written even for an incomplete run: the retry then only
+                # redoes members that didn't land
+                write_json(
+                    BUCKET,
+                    members_key(file_id),
+                    {"rev": entry.rev, "members": zip_members},
+                )
+                if not zip_ok:
+                    # Rev not recorded: the ZIP is diffed again next run
+                    logger.warning("ZIP incomplete, will retry: %s", entry.path_display)
+                    stats["skipped"] += 1
+                    return
 
                 # Track the ZIP itself so we skip it next run
                 path_index[entry.path_lower] = file_id
@@ -308,103 +1153,308 @@ def run() -> None:
                     "rev": entry.rev,
                     "category": "archive",
                     "size": entry.size,
-                    "server_modified": str(entry.server_modified),
-                    "extracted_count": zip_member_count,
+                    "server_modified": entry.server_modified,
+                    "extracted_count": len(zip_members),
+                    "content_hash": entry.content_hash,
                 }
                 write_json(BUCKET, meta_key(file_id), zip_meta)
+                manifest.upsert(
+                    ManifestRow(
+                        file_id, "archive", entry.rev, entry.size, "", entry.content_hash
+                    )
+                )
 
                 total_processed += 1
                 if total_processed % SAVE_INTERVAL == 0:
                     save_state_checkpoint()
-                continue
+                return
 
             # ── Regular file handling ──────────────────────────
             if cat is None:
                 logger.debug("Skipping unsupported extension: %s", entry.name)
                 stats["skipped"] += 1
-                continue
-
-            if entry.size > MAX_FILE_SIZE:
-                logger.warning(
-                    "Skipping large file (%d MB): %s",
-                    entry.size // (1024 * 1024),
-                    entry.path_display,
-                )
-                stats["skipped"] += 1
-                continue
+                return
 
             file_id = _clean_file_id(entry.id)
 
             # Skip if already synced with same revision
             if rev_index.get(file_id) == entry.rev:
                 stats["unchanged"] += 1
-                continue
+                return
 
             # For docs, include file extension so Vertex AI Search can detect type
             _, ext = os.path.splitext(entry.name)
             extension = ext.lower() if cat == "docs" else ""
             obj_key = gcs_key(cat, file_id, extension)
 
-            # Download from Dropbox
-            try:
-                _, data = dbx.download_file(entry.path_lower)
-            except Exception:
-                logger.exception("Failed to download %s", entry.path_display)
-                stats["skipped"] += 1
-                continue
+            # Content already mirrored (same file at a new rev, or a duplicate
+            # elsewhere)?  Then only the sidecar needs writing.
+            dkey = ""
+            source_key = None
+            if entry.content_hash:
+                dkey = dedup_key(cat, entry.content_hash, extension)
+                wait_for_uploads(dkey)
+                source_key = hashes.object_for(dkey)
+                inflight.setdefault(dkey, {})[entry.path_lower] = source_key
+            if source_key is None:
+                preserve_shared_object(obj_key, file_id)
 
-            # Upload to GCS
-            content_type = mime_type(entry.name)
-            gcs_uri = upload_bytes(BUCKET, obj_key, data, content_type)
+            # Download + upload + sidecar run on the transfer pool; the
+            # indexes are updated in on_transfer_done (this thread).
+            ledger.add(page_seq)
+            pool.submit(
+                entry.path_lower,
+                _transfer_file,
+                entry,
+                file_id,
+                cat,
+                obj_key,
+                source_key,
+                context=partial(on_transfer_done, entry, page_seq, dkey, obj_key),
+            )
 
-            # Write metadata sidecar
-            meta_obj = {
-                "dropbox_file_id": file_id,
-                "dropbox_path": entry.path_display,
-                "rev": entry.rev,
-                "mime_type": content_type,
-                "size": entry.size,
-                "server_modified": str(entry.server_modified),
-                "category": cat,
-                "gcs_uri": gcs_uri,
-                "caption": entry.name,
-            }
-            write_json(BUCKET, meta_key(file_id), meta_obj)
+    def on_transfer_done(
+        entry: ListedEntry, seq: int, dkey: str, obj_key: str, meta_obj, error
+    ) -> None:
+        nonlocal total_processed
+        ledger.done(seq)
+        source_key = None
+        if dkey:
+            source_key = inflight[dkey].pop(entry.path_lower)
+            if not inflight[dkey]:
+                del inflight[dkey]
+        if error is not None:
+            logger.error(
+                "Failed to transfer %s", entry.path_display, exc_info=error
+            )
+            stats["skipped"] += 1
+            return
 
-            # Queue doc for batched import to Vertex AI Search
-            if cat == "docs":
-                doc_buffer.add(gcs_uri)
-                logger.debug("Queued doc for import: %s", entry.name)
+        file_id = meta_obj["dropbox_file_id"]
+        gcs_uri = meta_obj["gcs_uri"]
+
+        # Swap the file's hash reference over to the stored object
+        switch_reference(file_id, dkey, source_key or obj_key, obj_key)
+
+        # Queue doc for batched import to Vertex AI Search
+        if meta_obj["category"] == "docs" and not source_key:
+            queue_doc_import(gcs_uri)
+            logger.debug("Queued doc for import: %s", entry.name)
 
-            # Update indexes
-            path_index[entry.path_lower] = file_id
-            rev_index[file_id] = entry.rev
+        # Update indexes
+        path_index[entry.path_lower] = file_id
+        rev_index[file_id] = entry.rev
+        manifest.upsert(
+            ManifestRow(
+                file_id,
+                meta_obj["category"],
+                entry.rev,
+                entry.size,
+                source_key or obj_key,
+                entry.content_hash,
+            )
+        )
 
+        total_processed += 1
+        if source_key:
+            stats["deduped"] += 1
+            logger.info("Deduped %s → %s", entry.path_display, gcs_uri)
+        else:
             stats["synced"] += 1
-            total_processed += 1
-            logger.info("Synced %s → %s", entry.path_display, obj_key)
+            logger.info("Synced %s → %s", entry.path_display, gcs_uri)
 
-            # Periodic checkpoint
-            if total_processed % SAVE_INTERVAL == 0:
-                save_state_checkpoint()
+        # Periodic checkpoint
+        if total_processed % SAVE_INTERVAL == 0:
+            save_state_checkpoint()
+
+    # Each task's context is its completion callback
+    pool = TransferPool(
+        config.SYNC_TRANSFER_WORKERS,
+        on_done=lambda done, result, error: done(result, error),
+    )
+    ledger = PageLedger()
+    page_seq = 0
+
+    def owns(entry: ListedEntry) -> bool:
+        """Sharded: whether this task handles *entry* (by its file id).
+
+        A delete belongs to the owner of the file indexed at its path; one
+        this task can't resolve is left to task 0 (it's a no-op anyway).
+        """
+        if task is None:
+            return True
+        if entry.kind == KIND_DELETED:
+            file_id = path_index.get(entry.path_lower)
+            if file_id is None:
+                return task.index == 0
+            return task.owns(file_id)
+        return task.owns(_clean_file_id(entry.id))
+
+    # ── List + process page by page ───────────────────────
+    if saved_cursor:
+        logger.info("Incremental sync from saved cursor")
+    else:
+        logger.info("Baseline crawl (no cursor found)")
+    if task is not None:
+        logger.info("Sharded run %s: task %d of %d", task.run_id, task.index, task.count)
+
+    for page in dbx.iter_pages(cursor=saved_cursor):
+        page_seq = ledger.open_page()
+        listed += len(page.entries)
+        for entry in plan_page(page.entries):
+            if owns(entry):
+                process_entry(entry)
+        ledger.close_page(page_seq, page.cursor)
+        pool.poll()
+
+        # A page's cursor is committable once its transfers (and those of
+        # every earlier page) have finished.  Throttle commits so small
+        # pages don't each cost a PUT.
+        cursor = ledger.committable()
+        if cursor and (
+            total_processed - committed_at >= SAVE_INTERVAL
+            or time.monotonic() - last_commit_time >= CURSOR_COMMIT_SECONDS
+        ):
+            commit_cursor(cursor)
 
     # ── Persist final state ───────────────────────────────
-    write_json(BUCKET, config.SYNC_STATE_KEY, {"cursor": new_cursor})
-    write_json(BUCKET, config.PATH_INDEX_KEY, path_index)
-    write_json(BUCKET, config.REV_INDEX_KEY, rev_index)
+    pool.close()
+    if task is None:
+        commit_cursor(ledger.committable() or saved_cursor)
+        manifest.save()  # fold the run's deltas into the shards
+
+    # Submit any remaining docs, then wait (bounded) for the imports to finish
+    doc_buffer.get_stats()
+    import_tracker.settle(config.DOC_IMPORT_WAIT_SECONDS)
+    import_tracker.save()
+    docs_imported, docs_failed = import_tracker.imported, import_tracker.failed
+    docs_pending = import_tracker.pending
+
+    if task is not None:
+        task.save(task_state(ledger.committable() or saved_cursor or ""))
+        logger.info(
+            "Task %d done — synced=%d  deduped=%d  moved=%d  deleted=%d  skipped=%d  unchanged=%d  zip_extracted=%d  docs_imported=%d  docs_failed=%d  docs_pending=%d",
+            task.index,
+            stats["synced"],
+            stats["deduped"],
+            stats["moved"],
+            stats["deleted"],
+            stats["skipped"],
+            stats["unchanged"],
+            stats["zip_extracted"],
+            docs_imported,
+            docs_failed,
+            docs_pending,
+        )
+        if task.finish():
+            merge_shards(task.run_id, task.count)
+        return
 
-    # Flush any remaining docs and get import stats
-    docs_imported, docs_failed = doc_buffer.get_stats()
+    if jsonl_import:
+        importer = IncrementalImporter(BUCKET)
+        importer.load()
+        importer.run(manifest.rows("docs"), config.DOC_IMPORT_WAIT_SECONDS)
+        docs_imported += importer.imported
+        docs_failed += importer.failed
+        docs_pending += importer.pending
+
+    # The mirror changed: let query caches know
+    if total_processed:
+        publish_version(BUCKET, SYNC_VERSION_KEY)
 
     logger.info(
-        "Sync complete — synced=%d  deleted=%d  skipped=%d  unchanged=%d  zip_extracted=%d  docs_imported=%d  docs_failed=%d",
+        "Sync complete — synced=%d  deduped=%d  moved=%d  deleted=%d  skipped=%d  unchanged=%d  zip_extracted=%d  docs_imported=%d  docs_failed=%d  docs_pending=%d",
         stats["synced"],
+        stats["deduped"],
+        stats["moved"],
         stats["deleted"],
         stats["skipped"],
         stats["unchanged"],
         stats["zip_extracted"],
         docs_imported,
         docs_failed,
+        docs_pending,
+    )
+
+
+
+def merge_shards(run_id: str, count: int) -> None:
+    """Coordinator of a sharded run: fold every task's delta into the shared
+    state, delete what no task still uses, and advance the cursor."""
+    shards = load_shards(BUCKET, run_id, count)
+    missing = [i for i, shard in enumerate(shards) if not shard or not shard["finished"]]
+    if missing:
+        logger.error("Run %s: no finished shard from tasks %s; not merging", run_id, missing)
+        return
+    if len({shard["start_cursor"] for shard in shards}) > 1:
+        logger.error("Run %s: tasks started from different cursors; not merging", run_id)
+        return
+
+    path_store = StateStore(
+        BUCKET, config.PATH_INDEX_STORE, config.PATH_INDEX_KEY, container=PathIndex
+    )
+    rev_store = StateStore(BUCKET, config.REV_INDEX_STORE, config.REV_INDEX_KEY)
+    hash_store = StateStore(BUCKET, config.HASH_INDEX_STORE, config.HASH_INDEX_KEY)
+    path_index = path_store.load()
+    rev_index = rev_store.load()
+    hash_entries = hash_store.load()
+    manifest = Manifest(BUCKET).load()
+    rebuild_from_sidecars(rev_index, manifest)  # the tasks only read theirs
+
+    merge_dict_deltas(path_index, [shard["path"] for shard in shards])
+    merge_dict_deltas(rev_index, [shard["rev"] for shard in shards])
+    merge_manifest_deltas(manifest, [shard["manifest"] for shard in shards])
+
+    def row_key(file_id: str) -> Optional[str]:
+        row = manifest.get(file_id)
+        return row.gcs_key if row else None
+
+    stale, repoint = merge_hash_deltas(
+        hash_entries, [shard["hash"] for shard in shards], row_key
+    )
+    for file_id, key in repoint:
+        _patch_meta(file_id, {"gcs_uri": f"gs://{BUCKET}/{key}"})
+        manifest.update(file_id, gcs_key=key)
+
+    # Objects a task let go of are deleted only if nothing uses them now
+    doomed = stale.union(*(shard["orphans"] for shard in shards))
+    if doomed:
+        doomed -= {entry["key"] for entry in hash_entries.values()}
+        doomed -= {row.gcs_key for row in manifest.rows()}
+        BlobCatalog(BUCKET).delete_many(sorted(doomed))
+
+    path_store.checkpoint(path_index)
+    rev_store.checkpoint(rev_index)
+    hash_store.checkpoint(hash_entries)
+    manifest.save()
+
+    # Every task processed the listing at least as far as the shortest one
+    cursor = min(shards, key=lambda shard: shard["listed"])["cursor"]
+    if cursor:
+        write_json(BUCKET, config.SYNC_STATE_KEY, {"cursor": cursor})
+
+    if config.DOC_IMPORT_MODE == "jsonl":
+        importer = IncrementalImporter(BUCKET)
+        importer.load()
+        importer.run(manifest.rows("docs"), config.DOC_IMPORT_WAIT_SECONDS)
+
+    totals = {k: sum(shard["stats"][k] for shard in shards) for k in shards[0]["stats"]}
+    if any(shard["processed"] for shard in shards):
+        publish_version(BUCKET, SYNC_VERSION_KEY)
+    delete_shards(BUCKET, run_id)
+
+    logger.info(
+        "Merged run %s from %d tasks — synced=%d  deduped=%d  moved=%d  deleted=%d  skipped=%d  unchanged=%d  zip_extracted=%d  orphans_deleted=%d",
+        run_id,
+        count,
+        totals["synced"],
+        totals["deduped"],
+        totals["moved"],
+        totals["deleted"],
+        totals["skipped"],
+        totals["unchanged"],
+        totals["zip_extracted"],
+        len(doomed),
     )
 
 
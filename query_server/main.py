@@ -0,0 +1,361 @@
+"""
+Resident query server — images (Vector Search) + docs (Vertex AI Search).
+
+Does once what curl/*.sh used to do on every query:
+  - credentials are cached and refreshed in-process by google-auth
+    (no `gcloud auth print-access-token` per query)
+  - the index endpoint's public domain is resolved once
+    (no `gcloud ai index-endpoints describe` per query)
+  - all calls share one pooled keep-alive session
+  - the doc search runs concurrently with embed → findNeighbors
+  - query embeddings are memoized (memory LRU + sqlite on disk) and
+    results are cached for RESULT_TTL_SECONDS, keyed by the state versions
+    the jobs publish, so warm queries never leave the process
+
+Endpoints (GET, query string):
+  /search?q=…&k=5&page_size=5   merged JSON, same shape as combine_results.sh
+  /images?q=…&k=10              {"query", "image_matches"}
+  /docs?q=…&page_size=10        {"query", "document_matches", "total"}
+  /healthz
+Add ``format=text`` for the listings the scripts print.
+
+IMAGE_BACKEND=local answers image queries from the exported local index
+(shared/local_index.py) instead of the deployed endpoint.
+
+Config comes from the same env vars the curl scripts use, so the server
+doesn't need the jobs' Dropbox secrets.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, "/app")
+sys.path.insert(0, ".")
+
+import google.auth  # noqa: E402
+import requests  # noqa: E402
+from google.auth.transport.requests import AuthorizedSession  # noqa: E402
+
+from shared.query_cache import LRUCache, VectorMemo  # noqa: E402
+from shared.state_store import (  # noqa: E402
+    EMBEDDING_VERSION_KEY,
+    SYNC_VERSION_KEY,
+    read_version,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "")
+REGION = os.environ.get("GCP_REGION", "us-central1")
+ENDPOINT_ID = os.environ.get("VECTOR_SEARCH_ENDPOINT_ID", "")
+DEPLOYED_INDEX_ID = os.environ.get("VECTOR_SEARCH_DEPLOYED_INDEX_ID", "")
+DATASTORE_ID = os.environ.get("VERTEX_SEARCH_DATASTORE_ID", "")
+IMAGE_BACKEND = os.environ.get("IMAGE_BACKEND", "vertex")  # vertex | local
+PORT = int(os.environ.get("PORT", "8080"))
+# Bucket holding the jobs' version stamps (result caching is TTL-only without)
+BUCKET = os.environ.get("GCS_BUCKET_NAME", "")
+QUERY_CACHE_DIR = os.environ.get("QUERY_CACHE_DIR", "/tmp/query_cache")
+RESULT_TTL_SECONDS = float(os.environ.get("RESULT_TTL_SECONDS", "300"))
+VERSION_POLL_SECONDS = float(os.environ.get("VERSION_POLL_SECONDS", "15"))
+RESULT_CACHE_ENTRIES = 4096
+
+EMBEDDING_MODEL_NAME = "multimodalembedding@001"
+EMBEDDING_DIMENSION = 1408
+
+# Keep-alive connections shared by all request threads
+HTTP_POOL_SIZE = 16
+REQUEST_TIMEOUT = 30
+
+AIPLATFORM = f"https://{REGION}-aiplatform.googleapis.com/v1"
+DISCOVERY = "https://discoveryengine.googleapis.com/v1"
+
+
+class QueryService:
+    """The upstream calls, with everything per-process cached."""
+
+    def __init__(self) -> None:
+        credentials, _ = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        self.session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+        )
+        self.session.mount("https://", adapter)
+        self.fanout = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE)
+        self._endpoint_domain: Optional[str] = None
+        self._lock = threading.Lock()
+        self.embed_text = VectorMemo(
+            self._embed_text,
+            f"{QUERY_CACHE_DIR}/embeddings.sqlite",
+            namespace=f"{EMBEDDING_MODEL_NAME}-{EMBEDDING_DIMENSION}",
+        )
+        self.results = LRUCache(RESULT_CACHE_ENTRIES, ttl=RESULT_TTL_SECONDS)
+        self.local_index = None
+        # Published by the jobs; part of every result key
+        self.versions = {"sync": "", "embed": ""}
+        if BUCKET:
+            self._poll_versions()
+            threading.Thread(
+                target=self._watch_versions, name="versions", daemon=True
+            ).start()
+        if IMAGE_BACKEND == "local":
+            self._load_local_index()
+
+    def _post(self, url: str, body: dict) -> dict:
+        resp = self.session.post(url, json=body, timeout=REQUEST_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _load_local_index(self) -> None:
+        from shared.local_index import LocalIndex
+
+        self.local_index = LocalIndex.fetch(
+            BUCKET,
+            EMBEDDING_MODEL_NAME,
+            EMBEDDING_DIMENSION,
+            os.environ.get("LOCAL_INDEX_DIR", "/tmp/local_index"),
+        )
+        logger.info("Local image index: %d vectors", len(self.local_index))
+
+    def _poll_versions(self) -> None:
+        current = {
+            "sync": read_version(BUCKET, SYNC_VERSION_KEY),
+            "embed": read_version(BUCKET, EMBEDDING_VERSION_KEY),
+        }
+        if current == self.versions:
+            return
+        logger.info("State versions changed: %s → %s", self.versions, current)
+        if self.local_index is not None and current["embed"] != self.versions["embed"]:
+            self._load_local_index()
+        # Old entries are unreachable (versions are in the keys); free them
+        self.versions = current
+        self.results.clear()
+
+    def _watch_versions(self) -> None:
+        while True:
+            time.sleep(VERSION_POLL_SECONDS)
+            try:
+                self._poll_versions()
+            except Exception:
+                logger.exception("Failed to read state versions")
+
+    def _cached(self, key: tuple, compute) -> Any:
+        result = self.results.get(key)
+        if result is None:
+            result = compute()
+            self.results.put(key, result)
+        return result
+
+    @property
+    def endpoint_domain(self) -> str:
+        """Public domain of the index endpoint (looked up once)."""
+        with self._lock:
+            if self._endpoint_domain is None:
+                resp = self.session.get(
+                    f"{AIPLATFORM}/projects/{PROJECT_ID}/locations/{REGION}"
+                    f"/indexEndpoints/{ENDPOINT_ID}",
+                    timeout=REQUEST_TIMEOUT,
+                )
+                resp.raise_for_status()
+                self._endpoint_domain = resp.json()["publicEndpointDomainName"]
+                logger.info("Index endpoint domain: %s", self._endpoint_domain)
+            return self._endpoint_domain
+
+    # ── Upstream calls ───────────────────────────────────────
+
+    def _embed_text(self, text: str) -> list[float]:
+        resp = self._post(
+            f"{AIPLATFORM}/projects/{PROJECT_ID}/locations/{REGION}"
+            f"/publishers/google/models/{EMBEDDING_MODEL_NAME}:predict",
+            {"instances": [{"text": text}]},
+        )
+        return resp["predictions"][0]["textEmbedding"]
+
+    def find_neighbors(self, vector: list[float], k: int) -> list[dict[str, Any]]:
+        if self.local_index is not None:
+            return [
+                {"file_id": file_id, "distance": score}
+                for file_id, score in self.local_index.search(vector, k=k)
+            ]
+        resp = self._post(
+            f"https://{self.endpoint_domain}/v1/projects/{PROJECT_ID}"
+            f"/locations/{REGION}/indexEndpoints/{ENDPOINT_ID}:findNeighbors",
+            {
+                "deployed_index_id": DEPLOYED_INDEX_ID,
+                "queries": [
+                    {"datapoint": {"feature_vector": vector}, "neighbor_count": k}
+                ],
+            },
+        )
+        neighbors = resp.get("nearestNeighbors", [{}])[0].get("neighbors", [])
+        return [
+            {
+                "file_id": n.get("datapoint", {}).get("datapointId", ""),
+                "distance": n.get("distance", 0),
+            }
+            for n in neighbors
+        ]
+
+    def search_docs(self, text: str, page_size: int) -> dict[str, Any]:
+        serving_config = (
+            f"projects/{PROJECT_ID}/locations/global/collections/default_collection"
+            f"/dataStores/{DATASTORE_ID}/servingConfigs/default_search"
+        )
+        resp = self._post(
+            f"{DISCOVERY}/{serving_config}:search",
+            {
+                "query": text,
+                "pageSize": page_size,
+                "contentSearchSpec": {"snippetSpec": {"returnSnippet": True}},
+            },
+        )
+        matches = []
+        for r in resp.get("results", []):
+            d = r.get("document", {})
+            derived = d.get("derivedStructData", {})
+            snippets = derived.get("snippets", [])
+            matches.append(
+                {
+                    "document_id": d.get("id", ""),
+                    "title": derived.get("title", ""),
+                    "link": derived.get("link", ""),
+                    "snippet": snippets[0].get("snippet", "") if snippets else "",
+                }
+            )
+        return {"document_matches": matches, "total": resp.get("totalSize", 0)}
+
+    # ── Queries ──────────────────────────────────────────────
+
+    def images(self, text: str, k: int) -> dict[str, Any]:
+        return self._cached(
+            ("images", text, k, self.versions["embed"]),
+            lambda: {
+                "query": text,
+                "image_matches": self.find_neighbors(self.embed_text(text), k),
+            },
+        )
+
+    def docs(self, text: str, page_size: int) -> dict[str, Any]:
+        return self._cached(
+            ("docs", text, page_size, self.versions["sync"]),
+            lambda: {"query": text, **self.search_docs(text, page_size)},
+        )
+
+    def search(self, text: str, k: int, page_size: int) -> dict[str, Any]:
+        """Both backends concurrently, merged like combine_results.sh."""
+        images = self.fanout.submit(self.images, text, k)
+        docs = self.fanout.submit(self.docs, text, page_size)
+        return {
+            "query": text,
+            "image_matches": images.result()["image_matches"],
+            "document_matches": docs.result()["document_matches"],
+        }
+
+
+# ── Text rendering (what the scripts used to print) ──────────
+
+
+def _render_images(result: dict) -> str:
+    lines = ["═══ IMAGE MATCHES ═══"]
+    if not result["image_matches"]:
+        lines.append("  (no results)")
+    for m in result["image_matches"]:
+        lines.append(f"  id={m['file_id']}  distance={m['distance']:.4f}")
+    return "\n".join(lines) + "\n"
+
+
+def _render_docs(result: dict) -> str:
+    lines = ["═══ DOCUMENT MATCHES ═══"]
+    if not result["document_matches"]:
+        lines.append("  (no results)")
+    for i, m in enumerate(result["document_matches"], 1):
+        lines.append(f"  {i}. {m['title'] or m['document_id']}")
+        lines.append(f"     id:      {m['document_id']}")
+        if m["link"]:
+            lines.append(f"     link:    {m['link']}")
+        if m["snippet"]:
+            lines.append(f"     snippet: {m['snippet'][:120]}")
+        lines.append("")
+    lines.append(f"  Total: {result.get('total', 0)} document(s)")
+    return "\n".join(lines) + "\n"
+
+
+# ── HTTP ─────────────────────────────────────────────────────
+
+
+class Handler(BaseHTTPRequestHandler):
+    service: QueryService
+    protocol_version = "HTTP/1.1"  # keep client connections alive too
+
+    def do_GET(self) -> None:  # noqa: N802
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/healthz":
+            self._send(200, {"status": "ok"})
+            return
+        text = params.get("q", "").strip()
+        if not text:
+            self._send(400, {"error": "missing q"})
+            return
+        as_text = params.get("format") == "text"
+        try:
+            if url.path == "/search":
+                result = self.service.search(
+                    text, int(params.get("k", 5)), int(params.get("page_size", 5))
+                )
+                body = result
+            elif url.path == "/images":
+                result = self.service.images(text, int(params.get("k", 10)))
+                body = _render_images(result) if as_text else result
+            elif url.path == "/docs":
+                result = self.service.docs(text, int(params.get("page_size", 10)))
+                body = _render_docs(result) if as_text else result
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+                return
+        except requests.HTTPError as exc:
+            logger.error("Upstream error for %s: %s", url.path, exc)
+            self._send(502, {"error": str(exc)})
+            return
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+            return
+        self._send(200, body)
+
+    def _send(self, status: int, body: Any) -> None:
+        if isinstance(body, str):
+            raw, content_type = body.encode(), "text/plain; charset=utf-8"
+        else:
+            raw, content_type = json.dumps(body, indent=2).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.info("%s %s", self.address_string(), fmt % args)
+
+
+def run() -> None:
+    Handler.service = QueryService()
+    server = ThreadingHTTPServer(("", PORT), Handler)
+    logger.info("Query server listening on :%d (images via %s)", PORT, IMAGE_BACKEND)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,155 @@
+"""
+Cached GCP access tokens and a shared keep-alive HTTP session.
+
+``TokenProvider`` holds one access token per process and refreshes it on a
+background thread shortly before it expires, so callers never wait on the
+metadata server (or gcloud) in the hot path.  Credentials come from
+google.auth — the metadata server on Cloud Run, ADC locally — and fall back
+to ``gcloud auth print-access-token`` when no ADC is configured.
+
+``get_session()`` returns the process-wide ``requests.Session``: a pooled
+adapter, keep-alive connections, and the current token attached to every
+request.  Used for all Discovery Engine calls.
+
+Doesn't depend on shared.config, so standalone scripts can use it too.
+"""
+
+import logging
+import subprocess
+import threading
+import time
+from datetime import timezone
+from typing import Optional
+
+import google.auth
+import requests
+from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import Request
+
+logger = logging.getLogger(__name__)
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+# Refresh this long before the token expires
+REFRESH_MARGIN_SECONDS = 300
+# gcloud doesn't report expiry; its tokens live 60 minutes
+GCLOUD_TOKEN_SECONDS = 3000
+# Retry delay after a failed background refresh
+REFRESH_RETRY_SECONDS = 30
+
+# Connections kept alive by the shared session
+HTTP_POOL_SIZE = 8
+
+
+class TokenProvider:
+    """
+    Usage:
+        provider = TokenProvider()
+        headers = {"Authorization": f"Bearer {provider.token()}"}
+    """
+
+    def __init__(self, refresh_margin: float = REFRESH_MARGIN_SECONDS) -> None:
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()  # guards the token; held only to read/swap
+        self._fetch_lock = threading.Lock()  # one credentials refresh at a time
+        self._token: Optional[str] = None
+        self._expiry = 0.0  # epoch seconds
+        self._refresher: Optional[threading.Thread] = None
+        try:
+            self._credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+        except DefaultCredentialsError:
+            logger.info("No application default credentials; using gcloud tokens")
+            self._credentials = None
+
+    def token(self) -> str:
+        """A valid access token (refreshed inline only if it has expired)."""
+        with self._lock:
+            if self._token is None or time.time() >= self._expiry:
+                self._token, self._expiry = self._fetch()
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="token-refresh", daemon=True
+                )
+                self._refresher.start()
+            return self._token
+
+    def _fetch(self) -> tuple[str, float]:
+        """A new (token, expiry epoch seconds).  Network call: callers don't
+        hold the token lock unless there is no valid token to hand out."""
+        with self._fetch_lock:
+            return self._fetch_unlocked()
+
+    def _fetch_unlocked(self) -> tuple[str, float]:
+        if self._credentials is not None:
+            self._credentials.refresh(Request())
+            token = self._credentials.token
+            expiry = self._credentials.expiry
+            expires_at = (
+                expiry.replace(tzinfo=timezone.utc).timestamp()
+                if expiry
+                else time.time() + GCLOUD_TOKEN_SECONDS
+            )
+        else:
+            result = subprocess.run(
+                ["gcloud", "auth", "print-access-token"],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                raise RuntimeError("Could not obtain GCP access token")
+            token = result.stdout.strip()
+            expires_at = time.time() + GCLOUD_TOKEN_SECONDS
+        logger.debug("Access token refreshed (expires in %.0fs)", expires_at - time.time())
+        return token, expires_at
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._lock:
+                wait = self._expiry - self.refresh_margin - time.time()
+            # Never spin, even if a fresh token already expires within the margin
+            time.sleep(max(wait, REFRESH_RETRY_SECONDS))
+            try:
+                token, expires_at = self._fetch()
+                with self._lock:
+                    self._token, self._expiry = token, expires_at
+            except Exception:
+                logger.warning("Background token refresh failed; retrying", exc_info=True)
+                time.sleep(REFRESH_RETRY_SECONDS)
+
+
+class _BearerAuth(requests.auth.AuthBase):
+    def __init__(self, provider: TokenProvider) -> None:
+        self.provider = provider
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        request.headers["Authorization"] = f"Bearer {self.provider.token()}"
+        return request
+
+
+_provider: Optional[TokenProvider] = None
+_session: Optional[requests.Session] = None
+_singleton_lock = threading.Lock()
+
+
+def get_token_provider() -> TokenProvider:
+    global _provider
+    with _singleton_lock:
+        if _provider is None:
+            _provider = TokenProvider()
+        return _provider
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session that authenticates every request."""
+    global _session
+    provider = get_token_provider()
+    with _singleton_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+            )
+            session.mount("https://", adapter)
+            session.auth = _BearerAuth(provider)
+            _session = session
+        return _session
@@ -71,6 +71,11 @@ def meta_key(file_id: str) -> str:
     return f"mirror/meta/{file_id}.json"
 
 
+def members_key(file_id: str) -> str:
+    """GCS key for a ZIP's member manifest (next to its thin sidecar)."""
+    return f"mirror/meta/{file_id}.members.json"
+
+
 def mime_type(filename: str) -> str:
     """Best-effort MIME type from extension; falls back to octet-stream."""
     _, ext = os.path.splitext(filename)
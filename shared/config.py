@@ -49,6 +49,57 @@ VECTOR_SEARCH_DEPLOYED_INDEX_ID: str = _optional(
 VERTEX_SEARCH_DATASTORE_ID: str = _optional("VERTEX_SEARCH_DATASTORE_ID", "")
 VERTEX_SEARCH_ENGINE_ID: str = _optional("VERTEX_SEARCH_ENGINE_ID", "")
 
+# ── Sync job tuning ──────────────────────────────────────
+# Concurrent regular-file transfers (each worker has its own sessions)
+SYNC_TRANSFER_WORKERS: int = int(_optional("SYNC_TRANSFER_WORKERS", "8"))
+# Sharded sync: this task's index and the task count (Cloud Run job tasks
+# get CLOUD_RUN_TASK_INDEX / CLOUD_RUN_TASK_COUNT), and the id shared by
+# one run's tasks (Cloud Run: the execution name)
+SYNC_TASK_INDEX: int = int(
+    _optional("SYNC_TASK_INDEX", os.environ.get("CLOUD_RUN_TASK_INDEX", "0"))
+)
+SYNC_TASK_COUNT: int = int(
+    _optional("SYNC_TASK_COUNT", os.environ.get("CLOUD_RUN_TASK_COUNT", "1"))
+)
+SYNC_RUN_ID: str = _optional("SYNC_RUN_ID", os.environ.get("CLOUD_RUN_EXECUTION", ""))
+# ZIP members: stream (decompress straight into GCS) | disk (extract to
+# scratch first; duplicates are caught before upload)
+ZIP_EXTRACT_MODE: str = _optional("ZIP_EXTRACT_MODE", "stream")
+# Stream mode: read ZIPs by HTTP range over a Dropbox temporary link
+# (central directory + the members being mirrored) instead of downloading
+ZIP_RANGE_READ: bool = _optional("ZIP_RANGE_READ", "true").lower() == "true"
+# Concurrent ZIP member uploads (extraction runs ahead of them)
+ZIP_UPLOAD_WORKERS: int = int(_optional("ZIP_UPLOAD_WORKERS", "4"))
+# Scratch disk extracted-but-not-yet-uploaded members may occupy (disk mode)
+ZIP_SCRATCH_BUDGET_MB: int = int(_optional("ZIP_SCRATCH_BUDGET_MB", "1024"))
+# Disk mode: parallel range requests per ZIP download, and their size
+ZIP_DOWNLOAD_WORKERS: int = int(_optional("ZIP_DOWNLOAD_WORKERS", "4"))
+ZIP_DOWNLOAD_SEGMENT_MB: int = int(_optional("ZIP_DOWNLOAD_SEGMENT_MB", "64"))
+# ZIP member sidecars written per background batch
+ZIP_SIDECAR_BATCH: int = int(_optional("ZIP_SIDECAR_BATCH", "50"))
+# How docs reach Vertex AI Search: batch (50-URI imports as docs sync) |
+# jsonl (one import of the docs changed since the last import, per run)
+DOC_IMPORT_MODE: str = _optional("DOC_IMPORT_MODE", "batch")
+# How long the sync job waits for its doc imports to finish (the rest are
+# resolved by the next run)
+DOC_IMPORT_WAIT_SECONDS: int = int(_optional("DOC_IMPORT_WAIT_SECONDS", "120"))
+
+# ── Embed job tuning ─────────────────────────────────────
+# Parallel image downloads feeding the embedders
+EMBED_PREFETCH_WORKERS: int = int(_optional("EMBED_PREFETCH_WORKERS", "4"))
+# Concurrent embedding requests
+EMBED_WORKERS: int = int(_optional("EMBED_WORKERS", "8"))
+# Embedding API quota (requests per minute) shared by all workers
+EMBED_REQUESTS_PER_MINUTE: int = int(_optional("EMBED_REQUESTS_PER_MINUTE", "120"))
+# Datapoints per Vector Search upsert call
+EMBED_UPSERT_BATCH: int = int(_optional("EMBED_UPSERT_BATCH", "100"))
+# Local read-through copy of the embedding cache segments
+EMBED_CACHE_DIR: str = _optional("EMBED_CACHE_DIR", "/tmp/embedding_cache")
+# Element type of the exported local image index: float16 | int8
+LOCAL_INDEX_DTYPE: str = _optional("LOCAL_INDEX_DTYPE", "float16")
+# Where readers keep their memory-mapped copy of the local index
+LOCAL_INDEX_DIR: str = _optional("LOCAL_INDEX_DIR", "/tmp/local_index")
+
 # ── GCS prefixes (constants) ─────────────────────────────────
 GCS_PREFIX_IMAGES = "mirror/images/"
 GCS_PREFIX_DOCS = "mirror/docs/"
@@ -57,8 +108,27 @@ GCS_PREFIX_META = "mirror/meta/"
 GCS_PREFIX_STATE = "mirror/state/"
 
 SYNC_STATE_KEY = "mirror/state/sync_state.json"
+# Per-task deltas of sharded sync runs (shared/sync_shards.py)
+SYNC_SHARDS_PREFIX = "mirror/state/shards/"
+
+# Vertex AI Search import operations in flight / to retry (shared/vertex_search.py)
+DOC_IMPORT_LEDGER_KEY = "mirror/state/doc_import_ledger.json"
+DOC_IMPORT_ERRORS_PREFIX = "mirror/state/doc_import_errors/"
+# Incremental JSONL import: object key → imported content hash, plus the
+# JSONL files and pending operation of the current import
+DOC_IMPORT_STATE_STORE = "doc_import_state"
+DOC_IMPORT_JSONL_PREFIX = "mirror/state/doc_import/"
+
+# Delta-log state stores (shared/state_store.py) → mirror/state/<name>/
+PATH_INDEX_STORE = "path_index"
+REV_INDEX_STORE = "rev_index"
+HASH_INDEX_STORE = "hash_index"
+EMBEDDING_STATE_STORE = "embedding_state"
+
+# Legacy whole-file JSON state, migrated into the stores on first load
 PATH_INDEX_KEY = "mirror/state/path_index.json"
 REV_INDEX_KEY = "mirror/state/rev_index.json"
+HASH_INDEX_KEY = "mirror/state/hash_index.json"
 EMBEDDING_STATE_KEY = "mirror/state/embedding_state.json"
 
 # ── Embedding model ──────────────────────────────────────────
@@ -0,0 +1,46 @@
+"""
+Dropbox content hash, computed locally.
+
+Dropbox hashes a file as SHA-256 over the concatenated SHA-256 digests of
+its 4 MiB blocks (see the Dropbox "content hash" reference).  Hashing bytes
+we produce ourselves — e.g. ZIP members — the same way lets them share one
+dedup index with regular files.
+"""
+
+import hashlib
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class DropboxContentHasher:
+    """Incremental Dropbox content hasher (``update`` / ``hexdigest``)."""
+
+    def __init__(self) -> None:
+        self._overall = hashlib.sha256()
+        self._block = hashlib.sha256()
+        self._block_pos = 0
+
+    def update(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if self._block_pos == BLOCK_SIZE:
+                self._overall.update(self._block.digest())
+                self._block = hashlib.sha256()
+                self._block_pos = 0
+            take = min(len(view), BLOCK_SIZE - self._block_pos)
+            self._block.update(view[:take])
+            self._block_pos += take
+            view = view[take:]
+
+    def hexdigest(self) -> str:
+        overall = self._overall.copy()
+        if self._block_pos > 0:
+            overall.update(self._block.digest())
+        return overall.hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    """Dropbox content hash of an in-memory byte string."""
+    hasher = DropboxContentHasher()
+    hasher.update(data)
+    return hasher.hexdigest()
@@ -0,0 +1,106 @@
+"""
+Content-hash index for deduplicating mirrored objects.
+
+Maps a dedup key (category + Dropbox content hash + extension) to the one
+GCS object holding those bytes and the file ids whose sidecars point at it.
+Persisted in the ``hash_index`` state store (shared/state_store.py):
+
+  { "<category>/<content_hash><ext>": {"key": "<gcs key>", "refs": [file_id, …]} }
+
+Every tracked file id references exactly one entry.  An object is deleted
+only once its last reference is released.
+"""
+
+from typing import Any, Optional
+
+from shared.categories import gcs_prefix
+
+
+def dedup_key(category: str, content_hash: str, extension: str = "") -> str:
+    """Dedup key for content stored under *category* with *extension*."""
+    return f"{category}/{content_hash}{extension}"
+
+
+def shared_object_key(dkey: str) -> str:
+    """Object key for content that no longer belongs to a single file.
+
+    Lives under ``mirror/<category>/dedup/`` so it can never collide with a
+    file id's own key.
+    """
+    category, rest = dkey.split("/", 1)
+    return f"{gcs_prefix(category)}dedup/{rest}"
+
+
+class HashIndex:
+    """In-memory view of the hash index with reverse lookups.
+
+    Entries changed in place are re-assigned so a TrackedDict backing store
+    sees them as dirty.
+    """
+
+    def __init__(self, entries: Optional[dict[str, dict[str, Any]]] = None) -> None:
+        self._entries: dict[str, dict[str, Any]] = {} if entries is None else entries
+        self._by_file: dict[str, str] = {
+            fid: dk for dk, e in self._entries.items() for fid in e["refs"]
+        }
+        self._by_object: dict[str, str] = {
+            e["key"]: dk for dk, e in self._entries.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def object_for(self, dkey: str) -> Optional[str]:
+        """GCS key already holding the content for *dkey*, if any."""
+        entry = self._entries.get(dkey)
+        return entry["key"] if entry else None
+
+    def dedup_key_of(self, file_id: str) -> Optional[str]:
+        return self._by_file.get(file_id)
+
+    def dedup_key_of_object(self, key: str) -> Optional[str]:
+        return self._by_object.get(key)
+
+    def refs(self, dkey: str) -> list[str]:
+        entry = self._entries.get(dkey)
+        return list(entry["refs"]) if entry else []
+
+    def add_ref(self, dkey: str, key: str, file_id: str) -> None:
+        """Record that *file_id* is served by *key* (created if new).
+
+        The caller releases the file's previous reference first.
+        """
+        entry = self._entries.get(dkey)
+        if entry is None:
+            entry = self._entries[dkey] = {"key": key, "refs": []}
+            self._by_object[key] = dkey
+        if file_id not in entry["refs"]:
+            entry["refs"].append(file_id)
+            self._entries[dkey] = entry
+        self._by_file[file_id] = dkey
+
+    def release(self, file_id: str) -> Optional[str]:
+        """Drop *file_id*'s reference.
+
+        Returns the object key when it was the last reference, i.e. the
+        object is now orphaned and may be deleted; otherwise None.
+        """
+        dkey = self._by_file.pop(file_id, None)
+        if dkey is None:
+            return None
+        entry = self._entries[dkey]
+        entry["refs"].remove(file_id)
+        if entry["refs"]:
+            self._entries[dkey] = entry
+            return None
+        del self._entries[dkey]
+        self._by_object.pop(entry["key"], None)
+        return entry["key"]
+
+    def move_object(self, dkey: str, new_key: str) -> None:
+        """Point *dkey* at a new object key (after a server-side copy)."""
+        entry = self._entries[dkey]
+        self._by_object.pop(entry["key"], None)
+        entry["key"] = new_key
+        self._entries[dkey] = entry
+        self._by_object[new_key] = dkey
@@ -2,15 +2,19 @@
 Dropbox SDK wrapper — OAuth2 refresh-token flow.
 
 Provides helpers for:
-  - cursor-based folder listing (baseline + incremental)
-  - file download with proper resource cleanup
+  - cursor-based folder listing (baseline + incremental), streamed a page
+    at a time with compact per-entry records
+  - file download with proper resource cleanup (buffered or streamed)
+  - temporary links for ranged reads
 """
 
 import contextlib
 import logging
-from typing import Optional
+from dataclasses import dataclass
+from typing import Iterator, Optional
 
 import dropbox
+import requests
 from dropbox.files import (
     DeletedMetadata,
     FileMetadata,
@@ -21,6 +25,61 @@ from dropbox.files import (
 
 logger = logging.getLogger(__name__)
 
+KIND_FILE = "file"
+KIND_DELETED = "deleted"
+
+
+@dataclass(slots=True)
+class ListedEntry:
+    """Compact record of a single listing entry (files and deletions only).
+
+    Holds just the fields the sync job needs so that large listings don't
+    keep whole SDK ``Metadata`` objects alive.
+    """
+
+    kind: str  # KIND_FILE or KIND_DELETED
+    path_lower: str
+    path_display: str
+    name: str
+    id: str = ""
+    rev: str = ""
+    size: int = 0
+    server_modified: str = ""
+    content_hash: str = ""
+
+
+@dataclass(slots=True)
+class ListingPage:
+    """One page of a cursor-based listing."""
+
+    entries: list[ListedEntry]
+    cursor: str  # cursor to resume *after* this page
+    has_more: bool
+
+
+def _compact(entry: Metadata) -> Optional[ListedEntry]:
+    """Convert an SDK Metadata object to a ListedEntry (None for folders)."""
+    if isinstance(entry, FileMetadata):
+        return ListedEntry(
+            kind=KIND_FILE,
+            path_lower=entry.path_lower,
+            path_display=entry.path_display,
+            name=entry.name,
+            id=entry.id,
+            rev=entry.rev,
+            size=entry.size or 0,
+            server_modified=str(entry.server_modified),
+            content_hash=entry.content_hash or "",
+        )
+    if isinstance(entry, DeletedMetadata):
+        return ListedEntry(
+            kind=KIND_DELETED,
+            path_lower=entry.path_lower,
+            path_display=entry.path_display,
+            name=entry.name,
+        )
+    return None
+
 
 class DropboxClient:
     """Light wrapper around the official Dropbox SDK."""
@@ -30,65 +89,65 @@ class DropboxClient:
         app_key: str,
         app_secret: str,
         refresh_token: str,
+        max_connections: int = 8,
     ) -> None:
         self._dbx = dropbox.Dropbox(
             oauth2_refresh_token=refresh_token,
             app_key=app_key,
             app_secret=app_secret,
+            session=dropbox.create_session(max_connections=max_connections),
         )
         logger.info("Dropbox client initialised (refresh-token flow)")
 
     # ── Listing ──────────────────────────────────────────────
 
-    def list_all(
+    def iter_pages(
         self,
+        cursor: Optional[str] = None,
         path: str = "",
         recursive: bool = True,
         include_deleted: bool = True,
-    ) -> tuple[list[Metadata], str]:
+    ) -> Iterator[ListingPage]:
         """
-        Full recursive listing from *path* ('' = root).
-        Returns (entries, cursor).
-        """
-        result: ListFolderResult = self._dbx.files_list_folder(
-            path,
-            recursive=recursive,
-            include_deleted=include_deleted,
-        )
-        entries: list[Metadata] = list(result.entries)
-
-        while result.has_more:
-            result = self._dbx.files_list_folder_continue(result.cursor)
-            entries.extend(result.entries)
-
-        logger.info(
-            "Baseline listing: %d entries, cursor=%s…",
-            len(entries),
-            result.cursor[:20],
-        )
-        return entries, result.cursor
+        Stream a listing one page at a time.
 
-    def list_changes(
-        self, cursor: str
-    ) -> tuple[list[Metadata], str]:
-        """
-        Incremental change listing from a saved cursor.
-        Returns (entries, new_cursor).
+        Starts a baseline listing of *path* when *cursor* is None, otherwise
+        continues from *cursor*.  Each yielded page carries the cursor to
+        resume from once all of its entries have been processed, so callers
+        can commit progress page by page.  Folder entries are dropped.
         """
-        entries: list[Metadata] = []
-        result: ListFolderResult = self._dbx.files_list_folder_continue(cursor)
-        entries.extend(result.entries)
-
-        while result.has_more:
+        if cursor:
+            result: ListFolderResult = self._dbx.files_list_folder_continue(cursor)
+        else:
+            result = self._dbx.files_list_folder(
+                path,
+                recursive=recursive,
+                include_deleted=include_deleted,
+            )
+
+        pages = 0
+        total = 0
+        while True:
+            entries = [
+                rec for rec in (_compact(e) for e in result.entries) if rec
+            ]
+            pages += 1
+            total += len(entries)
+            yield ListingPage(
+                entries=entries,
+                cursor=result.cursor,
+                has_more=result.has_more,
+            )
+            if not result.has_more:
+                break
             result = self._dbx.files_list_folder_continue(result.cursor)
-            entries.extend(result.entries)
 
         logger.info(
-            "Incremental listing: %d changes, cursor=%s…",
-            len(entries),
+            "Streamed listing: %d pages, %d entries, cursor=%s…",
+            pages,
+            total,
             result.cursor[:20],
         )
-        return entries, result.cursor
 
     # ── Download ─────────────────────────────────────────────
 
@@ -104,3 +163,28 @@ class DropboxClient:
             data = response.content
         logger.debug("Downloaded %s (%d bytes)", md.path_display, len(data))
         return md, data
+
+    def temporary_link(self, path: str, rev: Optional[str] = None) -> str:
+        """
+        Short-lived (4 h) direct URL to a file's content (pinned to *rev*).
+
+        The link serves HTTP Range requests, so large files can be read
+        piecewise (see shared/remote_file.py).
+        """
+        return self._dbx.files_get_temporary_link(f"rev:{rev}" if rev else path).link
+
+    @contextlib.contextmanager
+    def open_download(
+        self, path: str, rev: Optional[str] = None
+    ) -> Iterator[tuple[FileMetadata, requests.Response]]:
+        """
+        Open a streaming download; yields (FileMetadata, response).
+
+        Read the body incrementally (``response.raw`` or ``iter_content``)
+        so memory stays constant regardless of file size.  The response is
+        closed when the block exits.
+        """
+        md, response = self._dbx.files_download(path, rev=rev)
+        with contextlib.closing(response):
+            response.raw.decode_content = True
+            yield md, response
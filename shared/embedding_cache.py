@@ -0,0 +1,241 @@
+"""
+Content-addressed cache of image embeddings.
+
+Vectors are keyed by the image's Dropbox content hash and namespaced by
+model name and dimension, so identical images anywhere in the mirror —
+and every rebuild after a lost embedding_state — reuse one model call.
+
+Layout under mirror/state/embedding_cache/<model>-<dim>/:
+
+  manifest.json        {"seq": n, "segments": [{"name", "count"}, …]}
+  seg-<seq>.bin        count × 32-byte SHA-256 digests, then
+                       count × dim little-endian float32 vectors
+
+Segments are immutable.  ``load`` range-reads only the digest block of
+each segment; a vector is served from a local copy of its segment
+(downloaded on first use into ``local_dir``), so later lookups in the same
+segment — and later runs on the same disk — cost no request.  New vectors
+are appended as a new segment on ``flush``; small segments are merged once
+too many pile up.
+
+Not thread-safe: call from the job's main thread.
+"""
+
+import logging
+import re
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from shared.gcs import (
+    delete_blob,
+    download_bytes,
+    download_range,
+    read_json,
+    upload_bytes,
+    write_json,
+)
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "mirror/state/embedding_cache/"
+DIGEST_SIZE = 32
+
+# Merge segments smaller than this …
+SMALL_SEGMENT = 10_000
+# … once this many of them exist
+MAX_SMALL_SEGMENTS = 64
+
+LOAD_WORKERS = 16
+
+
+def _floats_to_bytes(vector: list[float]) -> bytes:
+    arr = array("f", vector)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _bytes_to_floats(raw: bytes) -> list[float]:
+    arr = array("f")
+    arr.frombytes(raw)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tolist()
+
+
+class EmbeddingCache:
+    """
+    Usage:
+        cache = EmbeddingCache(BUCKET, "multimodalembedding@001", 1408).load()
+        vector = cache.get(content_hash)      # None on a miss
+        cache.put(content_hash, vector)
+        cache.flush()                         # one new segment
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        model: str,
+        dimension: int,
+        local_dir: str = "/tmp/embedding_cache",
+        prefix: str = CACHE_PREFIX,
+    ) -> None:
+        namespace = f"{re.sub(r'[^A-Za-z0-9._-]', '_', model)}-{dimension}"
+        self.bucket_name = bucket_name
+        self.dimension = dimension
+        self.prefix = f"{prefix}{namespace}/"
+        self.manifest_key = f"{self.prefix}manifest.json"
+        self.local_dir = Path(local_dir) / namespace
+        self._manifest: dict = {"seq": 0, "segments": []}
+        self._where: dict[bytes, tuple[str, int]] = {}  # digest → (segment, i)
+        self._counts: dict[str, int] = {}
+        self._pending: dict[bytes, bytes] = {}  # digest → packed vector
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _record_size(self) -> int:
+        return self.dimension * 4
+
+    def __len__(self) -> int:
+        return len(self._where) + len(self._pending)
+
+    # ── Load ─────────────────────────────────────────────────
+
+    def load(self) -> "EmbeddingCache":
+        self._manifest = read_json(self.bucket_name, self.manifest_key) or {
+            "seq": 0,
+            "segments": [],
+        }
+        segments = self._manifest["segments"]
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            heads = list(pool.map(self._read_digests, segments))
+        for seg, head in zip(segments, heads):
+            self._index_segment(seg["name"], seg["count"], head)
+        logger.info(
+            "Embedding cache: %d vectors in %d segments", len(self._where), len(segments)
+        )
+        return self
+
+    def _read_digests(self, seg: dict) -> bytes:
+        local = self.local_dir / seg["name"]
+        length = seg["count"] * DIGEST_SIZE
+        if local.exists():
+            with open(local, "rb") as f:
+                return f.read(length)
+        return download_range(
+            self.bucket_name, self.prefix + seg["name"], 0, length - 1
+        )
+
+    def _index_segment(self, name: str, count: int, head: bytes) -> None:
+        self._counts[name] = count
+        for i in range(count):
+            self._where[head[i * DIGEST_SIZE : (i + 1) * DIGEST_SIZE]] = (name, i)
+
+    # ── Lookup / insert ──────────────────────────────────────
+
+    def get(self, content_hash: str) -> Optional[list[float]]:
+        digest = bytes.fromhex(content_hash)
+        packed = self._pending.get(digest)
+        if packed is None:
+            loc = self._where.get(digest)
+            if loc is None:
+                self.misses += 1
+                return None
+            packed = self._read_vector(*loc)
+        self.hits += 1
+        return _bytes_to_floats(packed)
+
+    def put(self, content_hash: str, vector: list[float]) -> None:
+        if len(vector) != self.dimension:
+            raise ValueError(
+                f"Expected {self.dimension}-dim vector, got {len(vector)}"
+            )
+        digest = bytes.fromhex(content_hash)
+        if digest not in self._where:
+            self._pending[digest] = _floats_to_bytes(vector)
+
+    def _local_segment(self, name: str) -> Path:
+        """Path of the local copy of segment *name* (read-through)."""
+        local = self.local_dir / name
+        if not local.exists():
+            local.parent.mkdir(parents=True, exist_ok=True)
+            tmp = local.with_suffix(".part")
+            tmp.write_bytes(download_bytes(self.bucket_name, self.prefix + name))
+            tmp.replace(local)
+        return local
+
+    def _read_vector(self, name: str, i: int) -> bytes:
+        offset = self._counts[name] * DIGEST_SIZE + i * self._record_size
+        with open(self._local_segment(name), "rb") as f:
+            f.seek(offset)
+            return f.read(self._record_size)
+
+    # ── Persist ──────────────────────────────────────────────
+
+    def flush(self) -> None:
+        """Write pending vectors as one new segment."""
+        if not self._pending:
+            return
+        items = list(self._pending.items())
+        name = self._write_segment(items)
+        self._manifest["segments"].append({"name": name, "count": len(items)})
+        self._counts[name] = len(items)
+        for i, (digest, _) in enumerate(items):
+            self._where[digest] = (name, i)
+        self._pending.clear()
+
+        small = [s for s in self._manifest["segments"] if s["count"] < SMALL_SEGMENT]
+        merged = self._merge(small) if len(small) > MAX_SMALL_SEGMENTS else set()
+        write_json(self.bucket_name, self.manifest_key, self._manifest)
+        logger.info("Embedding cache: wrote %s (%d vectors)", name, len(items))
+
+        # Superseded segments are no longer referenced by the manifest
+        for old in merged:
+            delete_blob(self.bucket_name, self.prefix + old)
+            (self.local_dir / old).unlink(missing_ok=True)
+
+    def _write_segment(self, items: list[tuple[bytes, bytes]]) -> str:
+        self._manifest["seq"] += 1
+        name = f"seg-{self._manifest['seq']:08d}.bin"
+        raw = b"".join(d for d, _ in items) + b"".join(v for _, v in items)
+        upload_bytes(self.bucket_name, self.prefix + name, raw)
+        # Keep a local copy; the segment never changes
+        local = self.local_dir / name
+        local.parent.mkdir(parents=True, exist_ok=True)
+        local.write_bytes(raw)
+        return name
+
+    def _merge(self, segments: list[dict]) -> set[str]:
+        """Merge *segments* into one; returns the names it replaced.
+
+        The caller writes the manifest before deleting them.
+        """
+        items: list[tuple[bytes, bytes]] = []
+        for seg in segments:
+            raw = self._local_segment(seg["name"]).read_bytes()
+            count = seg["count"]
+            vectors = count * DIGEST_SIZE
+            for i in range(count):
+                digest = raw[i * DIGEST_SIZE : (i + 1) * DIGEST_SIZE]
+                if self._where.get(digest, (None,))[0] == seg["name"]:
+                    start = vectors + i * self._record_size
+                    items.append((digest, raw[start : start + self._record_size]))
+        name = self._write_segment(items)
+
+        merged = {seg["name"] for seg in segments}
+        self._manifest["segments"] = [
+            s for s in self._manifest["segments"] if s["name"] not in merged
+        ] + [{"name": name, "count": len(items)}]
+        self._counts[name] = len(items)
+        for i, (digest, _) in enumerate(items):
+            self._where[digest] = (name, i)
+        for old in merged:
+            self._counts.pop(old, None)
+        logger.info(
+            "Embedding cache: merged %d segments into %s", len(merged), name
+        )
+        return merged
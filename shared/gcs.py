@@ -1,24 +1,64 @@
 """
 Thin wrapper around google-cloud-storage for mirror operations.
+
+Each thread gets its own ``storage.Client`` (the client is not thread-safe)
+backed by a keep-alive session with a sized connection pool.
+
+``BlobCatalog`` keeps the attributes a listing already returns (size, md5,
+crc32c, generation) so size/existence questions are answered from memory.
+Writes and deletes made through this module keep live catalogs current.
 """
 
 import json
 import logging
-from typing import Any, Optional
-
+import threading
+import weakref
+from typing import Any, BinaryIO, NamedTuple, Optional
+
+import google.auth
+import requests
+from google.api_core.exceptions import GoogleAPICallError, NotFound
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
 
 logger = logging.getLogger(__name__)
 
-# Module-level client (lazy-initialised)
-_client: Optional[storage.Client] = None
+# Connections kept alive per thread-local client
+HTTP_POOL_SIZE = 4
+
+# Resumable-upload chunk size for streamed uploads (multiple of 256 KiB).
+# Streams up to this size go up in a single request instead.
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Deletes per GCS batch request (the JSON API's limit)
+DELETE_BATCH_SIZE = 100
+
+# Listing fields kept by list_blob_infos (smaller responses than full metadata)
+LIST_FIELDS = "items(name,size,md5Hash,crc32c,generation),nextPageToken"
+
+# Per-thread clients (lazy-initialised)
+_local = threading.local()
+
+# Live catalogs, told about writes/deletes so they never serve stale answers
+_catalogs: "weakref.WeakSet[BlobCatalog]" = weakref.WeakSet()
+
+
+def _new_client() -> storage.Client:
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+    )
+    session.mount("https://", adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
 
 
 def _get_client() -> storage.Client:
-    global _client
-    if _client is None:
-        _client = storage.Client()
-    return _client
+    client = getattr(_local, "client", None)
+    if client is None:
+        client = _new_client()
+        _local.client = client
+    return client
 
 
 def _bucket(bucket_name: str) -> storage.Bucket:
@@ -37,6 +77,7 @@ def upload_bytes(
     """Upload raw bytes to GCS. Returns the gs:// URI."""
     blob = _bucket(bucket_name).blob(key)
     blob.upload_from_string(data, content_type=content_type)
+    _changed(bucket_name, key)
     uri = f"gs://{bucket_name}/{key}"
     logger.debug("Uploaded %s (%d bytes)", uri, len(data))
     return uri
@@ -55,22 +96,93 @@ def upload_from_filename(
     """
     blob = _bucket(bucket_name).blob(key)
     blob.upload_from_filename(local_path, content_type=content_type, timeout=timeout)
+    _changed(bucket_name, key)
     uri = f"gs://{bucket_name}/{key}"
     logger.debug("Uploaded %s from %s", uri, local_path)
     return uri
 
 
+def upload_stream(
+    bucket_name: str,
+    key: str,
+    stream: BinaryIO,
+    size: int,
+    content_type: str = "application/octet-stream",
+    timeout: int = 600,
+) -> str:
+    """Upload *size* bytes read from a file-like *stream* to GCS.
+
+    Uses a resumable upload that reads STREAM_CHUNK_SIZE at a time, so
+    memory stays constant regardless of object size.  If the stream fails
+    or ends early the upload is never finalised.  Returns the gs:// URI.
+    """
+    blob = _bucket(bucket_name).blob(key, chunk_size=STREAM_CHUNK_SIZE)
+    blob.upload_from_file(
+        stream, size=size, content_type=content_type, timeout=timeout
+    )
+    _changed(bucket_name, key)
+    uri = f"gs://{bucket_name}/{key}"
+    logger.debug("Streamed %s (%d bytes)", uri, size)
+    return uri
+
+
+def upload_bytes_if_generation(
+    bucket_name: str,
+    key: str,
+    data: bytes,
+    generation: int,
+    content_type: str = "application/octet-stream",
+) -> int:
+    """Upload only if the blob is still at *generation* (0: doesn't exist yet).
+
+    Returns the new generation; raises ``PreconditionFailed`` when another
+    writer got there first.
+    """
+    blob = _bucket(bucket_name).blob(key)
+    blob.upload_from_string(
+        data, content_type=content_type, if_generation_match=generation
+    )
+    _changed(bucket_name, key)
+    return blob.generation
+
+
 def download_bytes(bucket_name: str, key: str) -> bytes:
     """Download a blob as bytes."""
     blob = _bucket(bucket_name).blob(key)
     return blob.download_as_bytes()
 
 
+def download_range(bucket_name: str, key: str, start: int, end: int) -> bytes:
+    """Download bytes [start, end] (inclusive) of a blob."""
+    blob = _bucket(bucket_name).blob(key)
+    return blob.download_as_bytes(start=start, end=end)
+
+
+def download_with_generation(bucket_name: str, key: str) -> tuple[bytes, int]:
+    """(content, generation) of a blob, or (b"", 0) if it doesn't exist."""
+    blob = _bucket(bucket_name).get_blob(key)
+    if blob is None:
+        return b"", 0
+    try:
+        return blob.download_as_bytes(), blob.generation  # pinned to that generation
+    except NotFound:  # replaced between the two requests
+        return download_with_generation(bucket_name, key)
+
+
 def get_blob_size(bucket_name: str, key: str) -> int:
     """Get the size of a blob in bytes. Returns 0 if blob doesn't exist."""
-    blob = _bucket(bucket_name).blob(key)
-    blob.reload()  # Fetch metadata from GCS
-    return blob.size or 0
+    info = get_blob_info(bucket_name, key)
+    return info.size if info else 0
+
+
+def copy_blob(bucket_name: str, src_key: str, dst_key: str) -> str:
+    """Server-side copy within a bucket (no download). Returns the gs:// URI."""
+    bucket = _bucket(bucket_name)
+    bucket.copy_blob(bucket.blob(src_key), bucket, dst_key)
+    _changed(bucket_name, dst_key)
+    uri = f"gs://{bucket_name}/{dst_key}"
+    logger.debug("Copied gs://%s/%s → %s", bucket_name, src_key, uri)
+    return uri
 
 
 # ── Delete ───────────────────────────────────────────────────
@@ -84,6 +196,43 @@ def delete_blob(bucket_name: str, key: str) -> None:
         logger.debug("Deleted gs://%s/%s", bucket_name, key)
     except Exception:
         logger.debug("Blob gs://%s/%s not found (already deleted?)", bucket_name, key)
+    _changed(bucket_name, key, deleted=True)
+
+
+def delete_blobs(bucket_name: str, keys: list[str]) -> None:
+    """Delete many blobs, DELETE_BATCH_SIZE per batch request.
+
+    Missing blobs are ignored; other per-blob failures are logged.
+    """
+    client = _get_client()
+    bucket = client.bucket(bucket_name)
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        chunk = keys[start : start + DELETE_BATCH_SIZE]
+        try:
+            with client.batch():
+                for key in chunk:
+                    bucket.blob(key).delete()
+        except GoogleAPICallError:
+            # A batch raises only its last failure (often just a 404):
+            # redo the chunk one blob at a time to sort them out
+            for key in chunk:
+                _delete_one(bucket, key)
+            continue
+        for key in chunk:
+            _changed(bucket_name, key, deleted=True)
+    logger.debug("Deleted %d blobs from gs://%s", len(keys), bucket_name)
+
+
+def _delete_one(bucket: storage.Bucket, key: str) -> None:
+    try:
+        bucket.blob(key).delete()
+    except NotFound:
+        pass
+    except GoogleAPICallError as e:
+        logger.warning("Delete of gs://%s/%s failed: %s", bucket.name, key, e)
+        _changed(bucket.name, key)  # state unknown: ask GCS next time
+        return
+    _changed(bucket.name, key, deleted=True)
 
 
 # ── JSON helpers ─────────────────────────────────────────────
@@ -92,9 +241,10 @@ def delete_blob(bucket_name: str, key: str) -> None:
 def read_json(bucket_name: str, key: str) -> dict[str, Any]:
     """Download a JSON blob and parse it. Returns {} if the blob doesn't exist."""
     blob = _bucket(bucket_name).blob(key)
-    if not blob.exists():
+    try:
+        raw = blob.download_as_bytes()
+    except NotFound:
         return {}
-    raw = blob.download_as_bytes()
     return json.loads(raw)
 
 
@@ -115,3 +265,152 @@ def list_blobs(bucket_name: str, prefix: str) -> list[str]:
 
 def blob_exists(bucket_name: str, key: str) -> bool:
     return _bucket(bucket_name).blob(key).exists()
+
+
+# ── Blob attributes ──────────────────────────────────────────
+
+
+class BlobInfo(NamedTuple):
+    name: str
+    size: int
+    md5_hash: str
+    crc32c: str
+    generation: int
+
+
+def _blob_info(blob: storage.Blob) -> BlobInfo:
+    return BlobInfo(
+        name=blob.name,
+        size=blob.size or 0,
+        md5_hash=blob.md5_hash or "",
+        crc32c=blob.crc32c or "",
+        generation=blob.generation or 0,
+    )
+
+
+def list_blob_infos(bucket_name: str, prefix: str) -> list[BlobInfo]:
+    """Like list_blobs, but keep the attributes the listing returns."""
+    blobs = _get_client().list_blobs(bucket_name, prefix=prefix, fields=LIST_FIELDS)
+    return [_blob_info(b) for b in blobs]
+
+
+def get_blob_info(bucket_name: str, key: str) -> Optional[BlobInfo]:
+    """Attributes of one blob (one metadata GET), or None if it doesn't exist."""
+    blob = _bucket(bucket_name).get_blob(key)
+    return _blob_info(blob) if blob else None
+
+
+def _changed(bucket_name: str, key: str, deleted: bool = False) -> None:
+    for catalog in list(_catalogs):
+        if catalog.bucket_name == bucket_name:
+            if deleted:
+                catalog.forget(key)
+            else:
+                catalog.invalidate(key)
+
+
+class BlobCatalog:
+    """
+    In-memory blob attributes for one bucket, filled from listings.
+
+    Under a prefix passed to ``load`` the listing is authoritative: a key
+    that isn't in it doesn't exist, with no request.  Anything else (and
+    any key written since the listing) costs one metadata GET, which is
+    then cached.  Thread-safe.
+
+    Usage:
+        catalog = BlobCatalog(BUCKET).load("mirror/images/")
+        catalog.size(key)            # from the listing
+        catalog.delete(key)          # skipped if the blob isn't there
+        catalog.delete_many(keys)    # the rest in batch requests
+    """
+
+    def __init__(self, bucket_name: str) -> None:
+        self.bucket_name = bucket_name
+        self._known: dict[str, Optional[BlobInfo]] = {}  # None → absent
+        self._prefixes: list[str] = []
+        self._unsure: set[str] = set()  # written since listed
+        self._lock = threading.Lock()
+        _catalogs.add(self)
+
+    def load(self, prefix: str) -> "BlobCatalog":
+        infos = list_blob_infos(self.bucket_name, prefix)
+        with self._lock:
+            for info in infos:
+                self._known[info.name] = info
+            self._prefixes.append(prefix)
+        logger.info("Catalog: %d blobs under %s", len(infos), prefix)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def _cached(self, key: str) -> tuple[bool, Optional[BlobInfo]]:
+        """(answered, info) from memory alone."""
+        with self._lock:
+            if key in self._known:
+                return True, self._known[key]
+            listed = key not in self._unsure and any(
+                key.startswith(p) for p in self._prefixes
+            )
+            return listed, None
+
+    def info(self, key: str) -> Optional[BlobInfo]:
+        answered, info = self._cached(key)
+        if answered:
+            return info
+        info = get_blob_info(self.bucket_name, key)
+        with self._lock:
+            self._known[key] = info
+            self._unsure.discard(key)
+        return info
+
+    def exists(self, key: str) -> bool:
+        return self.info(key) is not None
+
+    def size(self, key: str) -> int:
+        info = self.info(key)
+        return info.size if info else 0
+
+    def generation(self, key: str) -> int:
+        """Current generation, or 0 if the blob doesn't exist."""
+        info = self.info(key)
+        return info.generation if info else 0
+
+    def invalidate(self, key: str) -> None:
+        """Forget what is known about *key*; the next query goes to GCS."""
+        with self._lock:
+            self._known.pop(key, None)
+            self._unsure.add(key)
+
+    def forget(self, key: str) -> None:
+        """Record that *key* no longer exists."""
+        with self._lock:
+            self._known[key] = None
+            self._unsure.discard(key)
+
+    # ── Catalog-aware helpers ────────────────────────────
+
+    def read_json(self, key: str) -> dict[str, Any]:
+        """read_json, without a request when the blob is known to be absent."""
+        answered, info = self._cached(key)
+        if answered and info is None:
+            return {}
+        return read_json(self.bucket_name, key)
+
+    def delete(self, key: str) -> None:
+        """delete_blob, skipped when the blob is known to be absent."""
+        answered, info = self._cached(key)
+        if answered and info is None:
+            return
+        delete_blob(self.bucket_name, key)
+
+    def delete_many(self, keys: list[str]) -> None:
+        """delete_blobs for the keys not known to be absent."""
+        todo = []
+        for key in dict.fromkeys(keys):
+            answered, info = self._cached(key)
+            if not (answered and info is None):
+                todo.append(key)
+        if todo:
+            delete_blobs(self.bucket_name, todo)
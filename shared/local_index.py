@@ -0,0 +1,308 @@
+"""
+Local, memory-mapped image vector index.
+
+The embed job exports every current image vector as a quantized matrix so
+image search can run in-process, without a Vertex endpoint round trip.
+
+Layout under mirror/state/local_index/<model>-<dim>/:
+
+  meta.json                 points at the live version
+  v<version>/vectors.bin    N × D float16 or int8, row-major
+  v<version>/scales.bin     N float32 per-row scales (int8 only)
+  v<version>/ids.json       file id of each row
+  v<version>/centroids.bin  L × D float32  (IVF only)
+  v<version>/offsets.bin    L + 1 int64 row offsets per list (IVF only)
+
+Versions are immutable; meta.json is written last, so a reader never sees
+half an export.  With IVF the rows are stored grouped by list, so probing
+a list scans one contiguous slice of the memory map.
+
+Scores are dot products (the Vector Search index uses DOT_PRODUCT_DISTANCE).
+"""
+
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from shared.gcs import (
+    delete_blob,
+    download_bytes,
+    list_blobs,
+    read_json,
+    upload_bytes,
+    write_json,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = "mirror/state/local_index/"
+
+# Build IVF lists once the corpus has this many rows
+IVF_MIN_ROWS = 50_000
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+# Rows scored per step of a full scan (bounds temporary float32 memory)
+SCAN_CHUNK = 65_536
+
+_FILES = ("vectors.bin", "scales.bin", "ids.json", "centroids.bin", "offsets.bin")
+
+
+def _namespace(model: str, dimension: int) -> str:
+    return f"{re.sub(r'[^A-Za-z0-9._-]', '_', model)}-{dimension}"
+
+
+def _quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: v ≈ q * scale."""
+    peak = np.abs(vectors).max(axis=1)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    q = np.rint(vectors / scales[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scales
+
+
+def _kmeans(data: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means on *data* (float32); returns nlist centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+
+def read_index_meta(
+    bucket_name: str, model: str, dimension: int, prefix: str = INDEX_PREFIX
+) -> dict:
+    """meta.json of the live version, or {} if nothing was exported yet."""
+    return read_json(bucket_name, f"{prefix}{_namespace(model, dimension)}/meta.json")
+
+
+# ── Export ───────────────────────────────────────────────────
+
+
+def export_index(
+    bucket_name: str,
+    model: str,
+    dimension: int,
+    items: Iterable[tuple[str, list[float]]],
+    count: int,
+    dtype: str = "float16",
+    nlist: Optional[int] = None,
+    prefix: str = INDEX_PREFIX,
+) -> int:
+    """Quantize and upload (file_id, vector) pairs as a new index version.
+
+    *count* is an upper bound on the number of items, used to preallocate.
+    *nlist* defaults to √N lists once N ≥ IVF_MIN_ROWS, else a flat index.
+    Returns the number of rows exported.
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"Unsupported index dtype: {dtype}")
+    ids: list[str] = []
+    int8 = dtype == "int8"
+    # Rows are quantized as they arrive, so peak memory is the stored size
+    matrix = np.empty((count, dimension), dtype=np.int8 if int8 else np.float16)
+    scales = np.empty(count if int8 else 0, dtype=np.float32)
+    for file_id, vector in items:
+        row = len(ids)
+        if int8:
+            q, scale = _quantize_int8(np.asarray(vector, dtype=np.float32)[None, :])
+            matrix[row], scales[row] = q[0], scale[0]
+        else:
+            matrix[row] = vector
+        ids.append(file_id)
+    n = len(ids)
+    matrix = matrix[:n]
+    scales = scales[:n]
+
+    def as_float(rows: np.ndarray) -> np.ndarray:
+        """float32 view of stored rows (dequantized for int8)."""
+        out = np.asarray(matrix[rows], dtype=np.float32)
+        return out * scales[rows][:, None] if int8 else out
+
+    if nlist is None:
+        nlist = int(np.sqrt(n)) if n >= IVF_MIN_ROWS else 0
+    nlist = min(nlist, n)
+    offsets = centroids = None
+    if nlist:
+        sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = as_float(
+            np.random.default_rng(0).choice(n, sample_size, replace=False)
+        )
+        centroids = _kmeans(sample, nlist)
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, SCAN_CHUNK):
+            chunk = as_float(np.arange(start, min(start + SCAN_CHUNK, n)))
+            assign[start : start + SCAN_CHUNK] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        matrix = matrix[order]
+        if int8:
+            scales = scales[order]
+        ids = [ids[i] for i in order]
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+
+    files: dict[str, bytes] = {"ids.json": json.dumps(ids).encode()}
+    if int8:
+        files["vectors.bin"] = matrix.tobytes()
+        files["scales.bin"] = scales.tobytes()
+    else:
+        files["vectors.bin"] = matrix.tobytes()
+    if nlist:
+        files["centroids.bin"] = centroids.astype(np.float32).tobytes()
+        files["offsets.bin"] = offsets.tobytes()
+
+    root = f"{prefix}{_namespace(model, dimension)}/"
+    old = read_index_meta(bucket_name, model, dimension, prefix)
+    version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    for name, raw in files.items():
+        upload_bytes(bucket_name, f"{root}v{version}/{name}", raw)
+    write_json(
+        bucket_name,
+        f"{root}meta.json",
+        {
+            "version": version,
+            "model": model,
+            "dimension": dimension,
+            "dtype": dtype,
+            "count": n,
+            "nlist": nlist,
+        },
+    )
+    # Superseded version
+    if old.get("version") and old["version"] != version:
+        for key in list_blobs(bucket_name, f"{root}v{old['version']}/"):
+            delete_blob(bucket_name, key)
+    logger.info(
+        "Local index: exported %d × %d %s (nlist=%d) as v%s",
+        n,
+        dimension,
+        dtype,
+        nlist,
+        version,
+    )
+    return n
+
+
+# ── Search ───────────────────────────────────────────────────
+
+
+class LocalIndex:
+    """
+    Read-only view of one exported index version, memory-mapped from disk.
+
+    Usage:
+        index = LocalIndex.fetch(BUCKET, model, 1408, "/tmp/local_index")
+        hits = index.search(query_vector, k=10)   # [(file_id, score), …]
+    """
+
+    def __init__(self, directory: Path) -> None:
+        meta = json.loads((directory / "meta.json").read_text())
+        self.meta = meta
+        self.dimension = meta["dimension"]
+        self.dtype = meta["dtype"]
+        n = meta["count"]
+        self.ids: list[str] = json.loads((directory / "ids.json").read_text())
+        np_dtype = np.int8 if self.dtype == "int8" else np.float16
+        # Zero-copy: pages are read on demand and shared between processes
+        if n:
+            self.vectors = np.memmap(
+                directory / "vectors.bin",
+                dtype=np_dtype,
+                mode="r",
+                shape=(n, self.dimension),
+            )
+        else:
+            self.vectors = np.empty((0, self.dimension), dtype=np_dtype)
+        self.scales = (
+            np.fromfile(directory / "scales.bin", dtype=np.float32)
+            if self.dtype == "int8"
+            else None
+        )
+        self.centroids = self.offsets = None
+        if meta.get("nlist"):
+            self.centroids = np.fromfile(
+                directory / "centroids.bin", dtype=np.float32
+            ).reshape(meta["nlist"], self.dimension)
+            self.offsets = np.fromfile(directory / "offsets.bin", dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def fetch(
+        cls,
+        bucket_name: str,
+        model: str,
+        dimension: int,
+        local_dir: str = "/tmp/local_index",
+        prefix: str = INDEX_PREFIX,
+    ) -> "LocalIndex":
+        """Open the live version, downloading it first if it isn't on disk."""
+        root = f"{prefix}{_namespace(model, dimension)}/"
+        meta = read_index_meta(bucket_name, model, dimension, prefix)
+        if not meta:
+            raise FileNotFoundError(f"No local index exported under {root}")
+        version = f"v{meta['version']}"
+        directory = Path(local_dir) / _namespace(model, dimension) / version
+        if not (directory / "meta.json").exists():
+            directory.mkdir(parents=True, exist_ok=True)
+            present = set(list_blobs(bucket_name, f"{root}{version}/"))
+            for name in _FILES:
+                key = f"{root}{version}/{name}"
+                if key in present:
+                    (directory / name).write_bytes(download_bytes(bucket_name, key))
+            # meta.json last marks the download complete
+            (directory / "meta.json").write_text(json.dumps(meta))
+        return cls(directory)
+
+    def _scores(self, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        scores = np.asarray(self.vectors[start:end], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[start:end]
+        return scores
+
+    def search(
+        self, query: list[float], k: int = 10, nprobe: int = 8
+    ) -> list[tuple[str, float]]:
+        """Top-*k* rows by dot product with *query*, best first.
+
+        With IVF lists, only the *nprobe* lists whose centroids score
+        highest are scanned.
+        """
+        q = np.asarray(query, dtype=np.float32)
+        if self.centroids is not None:
+            probe = np.argsort(self.centroids @ q)[::-1][:nprobe]
+            ranges = [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in probe]
+        else:
+            ranges = [
+                (s, min(s + SCAN_CHUNK, len(self.ids)))
+                for s in range(0, len(self.ids), SCAN_CHUNK)
+            ]
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, end in ranges:
+            if start == end:
+                continue
+            scores = self._scores(start, end, q)
+            rows = np.arange(start, end)
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                scores, rows = scores[top], rows[top]
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, rows])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[top], best_rows[top]
+
+        order = np.argsort(best_scores)[::-1]
+        return [(self.ids[best_rows[i]], float(best_scores[i])) for i in order]
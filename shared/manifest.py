@@ -0,0 +1,269 @@
+"""
+Columnar catalog of mirrored files, sharded under mirror/state/manifest/.
+
+Rows are spread over NUM_SHARDS shards by a stable hash of the file id.
+Each shard is a gzip JSON object holding one list per column:
+
+  {"file_id": [...], "category": [...], "rev": [...], "size": [...],
+   "gcs_key": [...], "content_hash": [...]}
+
+The sync job keeps the catalog current.  Its periodic checkpoints append
+only the rows changed since the last one as a delta segment
+
+  {"seq": n, "upsert": [[file_id, category, …], …], "remove": [file_id, …]}
+
+(delta-<seq>.json.gz), and ``save()`` — at the end of a run, or once
+MAX_DELTAS are live — rewrites the touched shards and drops the deltas.
+Each shard records the last delta ``seq`` folded into it, so a delta left
+behind by an interrupted save is never replayed over newer rows.
+
+Readers (the embed job, tools) load the whole catalog with one GET per
+shard and live delta instead of one exists() + download per sidecar.
+"""
+
+import gzip
+import json
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, NamedTuple, Optional
+
+from shared.gcs import (
+    delete_blobs,
+    download_with_generation,
+    list_blobs,
+    read_json,
+    upload_bytes,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PREFIX = "mirror/state/manifest/"
+NUM_SHARDS = 16
+# Fold the deltas into the shards once this many are live
+MAX_DELTAS = 64
+
+
+class ManifestRow(NamedTuple):
+    file_id: str
+    category: str  # images | docs | media | archive
+    rev: str
+    size: int
+    gcs_key: str  # stored object ("" for archives); may be shared (dedup)
+    content_hash: str
+
+    @classmethod
+    def from_meta(cls, bucket_name: str, meta: dict[str, Any]) -> "ManifestRow":
+        """Build a row from a metadata sidecar."""
+        uri = meta.get("gcs_uri", "")
+        return cls(
+            file_id=meta["dropbox_file_id"],
+            category=meta.get("category", ""),
+            rev=meta.get("rev", ""),
+            size=int(meta.get("size") or 0),
+            gcs_key=uri.removeprefix(f"gs://{bucket_name}/"),
+            content_hash=meta.get("content_hash", ""),
+        )
+
+
+COLUMNS = ManifestRow._fields
+
+
+def shard_of(file_id: str, num_shards: int = NUM_SHARDS) -> int:
+    return zlib.crc32(file_id.encode()) % num_shards
+
+
+class Manifest:
+    """In-memory catalog with per-shard dirty tracking.
+
+    Usage:
+        manifest = Manifest(BUCKET).load()
+        for row in manifest.rows("images"):
+            ...
+        manifest.upsert(ManifestRow(...))
+        manifest.checkpoint()  # one delta segment with the changed rows
+        manifest.save()        # rewrites dirty shards only
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str = MANIFEST_PREFIX,
+        num_shards: int = NUM_SHARDS,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.num_shards = num_shards
+        self._rows: dict[str, ManifestRow] = {}
+        self._dirty: set[int] = set()
+        self._pending: set[str] = set()  # changed since the last checkpoint
+        self._deltas: list[str] = []  # live delta segment keys
+        self._seq = 0  # last delta seq written or loaded
+        # file ids upserted/removed since load (a sharded sync task's delta)
+        self.changed: set[str] = set()
+        self.exists = False  # True once any shard has been written
+
+    def _shard_key(self, shard: int) -> str:
+        return f"{self.prefix}shard-{shard:03d}-of-{self.num_shards:03d}.json.gz"
+
+    # ── Load / save ──────────────────────────────────────────
+
+    def _delta_key(self, seq: int) -> str:
+        return f"{self.prefix}delta-{seq:08d}.json.gz"
+
+    def _download(self, keys: list[str]) -> list[bytes]:
+        """Contents of *keys* (b"" for one deleted since it was listed)."""
+        with ThreadPoolExecutor(max_workers=self.num_shards) as pool:
+            return [
+                raw
+                for raw, _ in pool.map(
+                    lambda k: download_with_generation(self.bucket_name, k), keys
+                )
+            ]
+
+    def load(self) -> "Manifest":
+        present = set(list_blobs(self.bucket_name, self.prefix))
+        keys = [self._shard_key(i) for i in range(self.num_shards)]
+        shards = [i for i, k in enumerate(keys) if k in present]
+        self.exists = bool(shards)
+        delta_prefix = f"{self.prefix}delta-"
+        deltas = sorted(k for k in present if k.startswith(delta_prefix))
+
+        folded = [0] * self.num_shards  # last delta seq in each shard
+        blobs = self._download([keys[i] for i in shards] + deltas)
+        for shard, raw in zip(shards, blobs):
+            if not raw:
+                continue
+            cols = json.loads(gzip.decompress(raw))
+            folded[shard] = cols.get("seq", 0)
+            for values in zip(*(cols[c] for c in COLUMNS)):
+                row = ManifestRow(*values)
+                self._rows[row.file_id] = row
+        self._seq = max(folded)
+
+        for key, raw in zip(deltas, blobs[len(shards) :]):
+            if not raw:
+                continue  # folded into the shards by a concurrent save
+            delta = json.loads(gzip.decompress(raw))
+            self._seq = max(self._seq, delta["seq"])
+            self._deltas.append(key)
+            for values in delta["upsert"]:
+                shard = shard_of(values[0], self.num_shards)
+                if delta["seq"] > folded[shard]:
+                    self._rows[values[0]] = ManifestRow(*values)
+                    self._dirty.add(shard)
+            for file_id in delta["remove"]:
+                shard = shard_of(file_id, self.num_shards)
+                if delta["seq"] > folded[shard]:
+                    self._rows.pop(file_id, None)
+                    self._dirty.add(shard)
+        logger.info(
+            "Manifest: loaded %d rows from %d shards and %d deltas",
+            len(self._rows),
+            len(shards),
+            len(self._deltas),
+        )
+        return self
+
+    def checkpoint(self) -> None:
+        """Persist the rows changed since the last checkpoint as one delta."""
+        if not self._pending:
+            return
+        if not self.exists or len(self._deltas) >= MAX_DELTAS:
+            self.save()
+            return
+        self._seq += 1
+        rows = [self._rows.get(fid) for fid in self._pending]
+        delta = {
+            "seq": self._seq,
+            "upsert": [list(row) for row in rows if row is not None],
+            "remove": [fid for fid in self._pending if fid not in self._rows],
+        }
+        key = self._delta_key(self._seq)
+        raw = gzip.compress(
+            json.dumps(delta, separators=(",", ":")).encode(), compresslevel=6
+        )
+        upload_bytes(self.bucket_name, key, raw, "application/gzip")
+        self._deltas.append(key)
+        logger.debug("Manifest: delta %s (%d rows)", key, len(self._pending))
+        self._pending.clear()
+
+    def save(self) -> None:
+        """Rewrite every shard touched since the last save; drop the deltas."""
+        if not self._dirty and not self._deltas:
+            return
+        by_shard: dict[int, list[ManifestRow]] = {s: [] for s in self._dirty}
+        for row in self._rows.values():
+            shard = shard_of(row.file_id, self.num_shards)
+            if shard in by_shard:
+                by_shard[shard].append(row)
+
+        def write(item: tuple[int, list[ManifestRow]]) -> None:
+            shard, rows = item
+            cols: dict[str, Any] = {c: [getattr(r, c) for r in rows] for c in COLUMNS}
+            cols["seq"] = self._seq
+            raw = gzip.compress(
+                json.dumps(cols, separators=(",", ":")).encode(), compresslevel=6
+            )
+            upload_bytes(
+                self.bucket_name, self._shard_key(shard), raw, "application/gzip"
+            )
+
+        with ThreadPoolExecutor(max_workers=self.num_shards) as pool:
+            list(pool.map(write, by_shard.items()))
+        logger.info("Manifest: saved %d shards", len(by_shard))
+        self._dirty.clear()
+        self._pending.clear()
+        self.exists = True
+        # Folded into the shards (their seq covers them if this is cut short)
+        if self._deltas:
+            delete_blobs(self.bucket_name, self._deltas)
+            self._deltas = []
+
+    def mark_all_dirty(self) -> None:
+        self._dirty.update(range(self.num_shards))
+
+    # ── Rows ─────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, file_id: str) -> bool:
+        return file_id in self._rows
+
+    def get(self, file_id: str) -> Optional[ManifestRow]:
+        return self._rows.get(file_id)
+
+    def rows(self, category: Optional[str] = None) -> Iterator[ManifestRow]:
+        for row in self._rows.values():
+            if category is None or row.category == category:
+                yield row
+
+    def upsert(self, row: ManifestRow) -> None:
+        if self._rows.get(row.file_id) != row:
+            self._rows[row.file_id] = row
+            self._dirty.add(shard_of(row.file_id, self.num_shards))
+            self._pending.add(row.file_id)
+            self.changed.add(row.file_id)
+
+    def update(self, file_id: str, **fields: Any) -> None:
+        """Change some columns of an existing row (no-op if absent)."""
+        row = self._rows.get(file_id)
+        if row is not None:
+            self.upsert(row._replace(**fields))
+
+    def remove(self, file_id: str) -> None:
+        if self._rows.pop(file_id, None) is not None:
+            self._dirty.add(shard_of(file_id, self.num_shards))
+            self._pending.add(file_id)
+            self.changed.add(file_id)
+
+
+def rows_from_sidecars(bucket_name: str, meta_prefix: str) -> Iterator[ManifestRow]:
+    """Slow path: one read per sidecar (used to seed a missing manifest)."""
+    for key in list_blobs(bucket_name, meta_prefix):
+        if not key.endswith(".json"):
+            continue
+        meta = read_json(bucket_name, key)
+        if meta.get("dropbox_file_id"):
+            yield ManifestRow.from_meta(bucket_name, meta)
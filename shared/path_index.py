@@ -0,0 +1,287 @@
+"""
+Compact path → file id index with prefix range queries.
+
+The sync job's path index holds one entry per mirrored Dropbox path and
+per extracted ZIP member, so it can run to millions of long, highly
+redundant keys.  ``PathIndex`` keeps them sorted and front-coded:
+
+  base      sorted entries in blocks of BLOCK_SIZE; each block is one bytes
+            object in which every key (and value) stores only the suffix
+            that differs from the previous one.  ``_heads`` holds the first
+            key of each block for bisection.
+  overlay   plain dict of entries changed since the base was built, with a
+            sorted key list for range queries, plus the base keys deleted
+            since.  Merged into a new base once it outgrows a fraction of it.
+
+Lookups check the overlay, then decode the one block the key can be in.
+``with_prefix(prefix)`` walks only the blocks covering the prefix, so
+finding a ZIP's members or a folder's files costs O(log N + k), not a
+scan of every key.
+
+Like ``TrackedDict`` it records changed keys in ``dirty`` and can replay
+delta segments, so ``StateStore`` checkpoints it as usual; its base
+snapshot is written in the same front-coded form (``to_compact``), zlib
+compressed.
+"""
+
+import bisect
+import zlib
+from collections import OrderedDict
+from typing import Any, Iterator, Mapping, Optional
+
+# Entries per front-coded block
+BLOCK_SIZE = 64
+# Rebuild the base once overlay + deletions exceed this share of it ...
+MERGE_RATIO = 0.25
+# ... but never for fewer changes than this
+MIN_MERGE = 50_000
+# Decoded blocks kept for lookups with locality
+DECODED_BLOCKS = 64
+
+_MAGIC = b"PIDX1"
+
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _shared(a: bytes, b: bytes) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _encode(entries: list[tuple[str, str]]) -> bytes:
+    """Front-code sorted (key, value) pairs."""
+    out = bytearray()
+    prev_k = prev_v = b""
+    for key, value in entries:
+        k, v = key.encode(), value.encode()
+        for cur, prev in ((k, prev_k), (v, prev_v)):
+            common = _shared(prev, cur)
+            _put_varint(out, common)
+            _put_varint(out, len(cur) - common)
+            out += cur[common:]
+        prev_k, prev_v = k, v
+    return bytes(out)
+
+
+def _decode(buf: bytes, count: Optional[int] = None) -> list[tuple[str, str]]:
+    entries = []
+    pos = 0
+    prev_k = prev_v = b""
+    while pos < len(buf) and (count is None or len(entries) < count):
+        common, pos = _get_varint(buf, pos)
+        length, pos = _get_varint(buf, pos)
+        k = prev_k[:common] + buf[pos : pos + length]
+        pos += length
+        common, pos = _get_varint(buf, pos)
+        length, pos = _get_varint(buf, pos)
+        v = prev_v[:common] + buf[pos : pos + length]
+        pos += length
+        entries.append((k.decode(), v.decode()))
+        prev_k, prev_v = k, v
+    return entries
+
+
+class PathIndex:
+    """
+    Usage:
+        index = PathIndex({"/a/b.jpg": "id1"})
+        index["/a/c.zip!/x.jpg"] = "id2"
+        index.get("/a/b.jpg")                    # "id1"
+        index.with_prefix("/a/c.zip!/")          # [("/a/c.zip!/x.jpg", "id2")]
+    """
+
+    def __init__(self, data: Optional[Mapping[str, str]] = None) -> None:
+        self.dirty: set = set()
+        self._heads: list[str] = []
+        self._blocks: list[bytes] = []
+        self._base_len = 0
+        self._len = 0
+        self._overlay: dict[str, str] = {}
+        self._overlay_keys: list[str] = []  # sorted keys of _overlay
+        self._deleted: set[str] = set()  # base keys removed since the build
+        self._decoded: OrderedDict[int, list[tuple[str, str]]] = OrderedDict()
+        if data:
+            self._build(sorted(data.items()))
+
+    # ── Base ─────────────────────────────────────────────────
+
+    def _build(self, entries: list[tuple[str, str]]) -> None:
+        """Replace everything with *entries* (sorted by key)."""
+        self._heads = []
+        self._blocks = []
+        for start in range(0, len(entries), BLOCK_SIZE):
+            block = entries[start : start + BLOCK_SIZE]
+            self._heads.append(block[0][0])
+            self._blocks.append(_encode(block))
+        self._base_len = self._len = len(entries)
+        self._overlay = {}
+        self._overlay_keys = []
+        self._deleted = set()
+        self._decoded.clear()
+
+    def _block(self, i: int) -> list[tuple[str, str]]:
+        entries = self._decoded.get(i)
+        if entries is None:
+            entries = _decode(self._blocks[i])
+            self._decoded[i] = entries
+            if len(self._decoded) > DECODED_BLOCKS:
+                self._decoded.popitem(last=False)
+        else:
+            self._decoded.move_to_end(i)
+        return entries
+
+    def _base_get(self, key: str) -> Optional[str]:
+        i = bisect.bisect_right(self._heads, key) - 1
+        if i < 0:
+            return None
+        entries = self._block(i)
+        j = bisect.bisect_left(entries, (key,))
+        if j < len(entries) and entries[j][0] == key:
+            return entries[j][1]
+        return None
+
+    def _base_range(self, prefix: str) -> Iterator[tuple[str, str]]:
+        i = max(bisect.bisect_right(self._heads, prefix) - 1, 0)
+        while i < len(self._blocks):
+            if self._heads[i] > prefix and not self._heads[i].startswith(prefix):
+                return
+            for key, value in self._block(i):
+                if key.startswith(prefix):
+                    yield key, value
+                elif key > prefix:
+                    return
+            i += 1
+
+    def _maybe_merge(self) -> None:
+        changes = len(self._overlay) + len(self._deleted)
+        if changes > max(MIN_MERGE, self._base_len * MERGE_RATIO):
+            self._build(list(self.items()))
+
+    # ── Mapping API ──────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return self._len
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._overlay.get(key)
+        if value is not None:
+            return value
+        if key in self._deleted:
+            return default
+        value = self._base_get(key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.get(key) is not None
+
+    def __setitem__(self, key: str, value: str) -> None:
+        if key not in self._overlay:
+            if key not in self:
+                self._len += 1
+            bisect.insort(self._overlay_keys, key)
+        self._overlay[key] = value
+        self.dirty.add(key)
+        self._maybe_merge()
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.pop(key)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        value = self.get(key)
+        if value is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        if key in self._overlay:
+            del self._overlay[key]
+            del self._overlay_keys[bisect.bisect_left(self._overlay_keys, key)]
+        if self._base_get(key) is not None:
+            self._deleted.add(key)
+        self._len -= 1
+        self.dirty.add(key)
+        self._maybe_merge()
+        return value
+
+    def with_prefix(self, prefix: str) -> list[tuple[str, str]]:
+        """All (key, value) pairs whose key starts with *prefix*, sorted."""
+        found = {
+            key: value
+            for key, value in self._base_range(prefix)
+            if key not in self._deleted
+        }
+        i = bisect.bisect_left(self._overlay_keys, prefix)
+        while i < len(self._overlay_keys) and self._overlay_keys[i].startswith(prefix):
+            key = self._overlay_keys[i]
+            found[key] = self._overlay[key]
+            i += 1
+        return sorted(found.items())
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        """All pairs in key order."""
+        return iter(self.with_prefix(""))
+
+    def keys(self) -> Iterator[str]:
+        return (key for key, _ in self.items())
+
+    __iter__ = keys
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    # ── StateStore hooks ─────────────────────────────────────
+
+    def replay(self, segment: dict) -> None:
+        """Apply a loaded state segment without marking keys dirty."""
+        changes = segment.get("set", {})
+        if not self._base_len and not self._overlay:
+            self._build(sorted(changes.items()))
+        else:
+            for key, value in changes.items():
+                self[key] = value
+        for key in segment.get("del", ()):
+            self.pop(key, None)
+        self.dirty.clear()
+
+    def to_compact(self) -> bytes:
+        """Front-coded, zlib-compressed snapshot of every entry."""
+        entries = list(self.items())
+        out = bytearray(_MAGIC)
+        _put_varint(out, len(entries))
+        return bytes(out) + zlib.compress(_encode(entries), 6)
+
+    @classmethod
+    def from_compact(cls, raw: bytes) -> "PathIndex":
+        if not raw.startswith(_MAGIC):
+            raise ValueError("Not a compact path index")
+        count, pos = _get_varint(raw, len(_MAGIC))
+        index = cls()
+        index._build(_decode(zlib.decompress(raw[pos:]), count))
+        return index
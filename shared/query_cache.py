@@ -0,0 +1,125 @@
+"""
+Caches for the query server.
+
+  LRUCache      in-memory, bounded, optional TTL; thread-safe
+  DiskCache     sqlite-backed bytes store that survives restarts
+  VectorMemo    text → embedding: LRU in front of DiskCache in front of
+                the embedding call
+
+Embeddings of a query text never go stale (same model, same vector), so
+they're kept on disk.  Search results do, so the server keys them by the
+state versions the jobs publish (shared/state_store.py) and bounds them by
+a TTL as well.
+"""
+
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Usage:
+        cache = LRUCache(1024, ttl=300)
+        cache.put(key, value)
+        cache.get(key)            # None if missing or expired
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored, value = item
+            if self.ttl is not None and time.monotonic() - stored > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """Persistent str → bytes store in one sqlite file."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._db.commit()
+
+
+class VectorMemo:
+    """Memoized text → vector with a memory and a disk level.
+
+    Usage:
+        memo = VectorMemo(embed_text, "/var/cache/query/embeddings.sqlite",
+                          namespace="multimodalembedding@001-1408")
+        vector = memo(text)
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[str], list[float]],
+        path: str,
+        namespace: str,
+        max_entries: int = 4096,
+    ) -> None:
+        self.compute = compute
+        self.namespace = namespace
+        self.memory = LRUCache(max_entries)
+        self.disk = DiskCache(path)
+
+    def __call__(self, text: str) -> list[float]:
+        key = f"{self.namespace}\0{text}"
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        raw = self.disk.get(key)
+        if raw is not None:
+            vector = array("f", raw).tolist()
+        else:
+            vector = self.compute(text)
+            self.disk.put(key, array("f", vector).tobytes())
+        self.memory.put(key, vector)
+        return vector
@@ -0,0 +1,55 @@
+"""
+Thread-safe token bucket for API quotas.
+
+Workers call ``acquire()`` before each request; the bucket refills at
+``rate`` tokens per second up to ``capacity``.  When the API reports quota
+exhaustion anyway, ``pause()`` holds back every worker for a while rather
+than letting each one retry on its own.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Usage:
+        bucket = TokenBucket(rate=120 / 60)   # 120 requests per minute
+        bucket.acquire()                      # blocks until a token is free
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - max(self._updated, self._paused_until)
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = max(now, self._updated)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until *tokens* are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    self._paused_until - now,
+                    (tokens - self._tokens) / self.rate,
+                )
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for *seconds* and start again from empty."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
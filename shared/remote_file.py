@@ -0,0 +1,192 @@
+"""
+Seekable read-only file over HTTP Range requests.
+
+Lets ``zipfile`` open an archive that stays remote (e.g. behind a Dropbox
+temporary link): the central directory is read from the tail first, then
+only the byte ranges of the members actually opened are fetched.
+
+Reads go through a small cache of fetched windows.  A miss fetches a
+window of READ_AHEAD bytes, clipped to the planned span it falls in, so
+sequential member reads turn into a few large requests.  ``plan()`` takes
+the byte ranges the caller is about to read and coalesces neighbours
+(gaps up to COALESCE_GAP are read through rather than split into another
+request); ranges outside any span are fetched MIN_FETCH at a time.
+
+Works against any server that honours ``Range`` (206 responses), so it can
+be exercised with a local range-capable HTTP server.
+"""
+
+import bisect
+import io
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Bytes fetched per request inside a planned span
+READ_AHEAD = 8 * 1024 * 1024
+# Bytes fetched per request outside any span (headers, central directory)
+MIN_FETCH = 64 * 1024
+# Planned ranges closer than this are merged into one span
+COALESCE_GAP = 256 * 1024
+# Fetched windows kept (bounds memory at CACHE_WINDOWS × READ_AHEAD)
+CACHE_WINDOWS = 8
+
+RANGE_TIMEOUT = 120
+
+
+def coalesce(
+    ranges: list[tuple[int, int]], gap: int = COALESCE_GAP
+) -> list[tuple[int, int]]:
+    """Sort [start, end) ranges and merge those within *gap* of each other."""
+    spans: list[list[int]] = []
+    for start, end in sorted(ranges):
+        if spans and start - spans[-1][1] <= gap:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return [(s, e) for s, e in spans]
+
+
+def member_ranges(
+    zf: zipfile.ZipFile, members: list[zipfile.ZipInfo]
+) -> list[tuple[int, int]]:
+    """Byte range of each member's local header + data in the archive.
+
+    A member runs up to the next local header (or the central directory),
+    which covers variable-length local extras and data descriptors.
+    """
+    starts = sorted({info.header_offset for info in zf.infolist()})
+    ranges = []
+    for info in members:
+        i = bisect.bisect_right(starts, info.header_offset)
+        end = starts[i] if i < len(starts) else zf.start_dir
+        ranges.append((info.header_offset, end))
+    return ranges
+
+
+class RemoteFile(io.RawIOBase):
+    """
+    Usage:
+        remote = RemoteFile(url, size)
+        with zipfile.ZipFile(remote) as zf:
+            remote.plan(member_ranges(zf, wanted))
+            with zf.open(wanted[0]) as member:
+                ...
+    """
+
+    def __init__(
+        self,
+        url: str,
+        size: Optional[int] = None,
+        session: Optional[requests.Session] = None,
+        read_ahead: int = READ_AHEAD,
+        cache_windows: int = CACHE_WINDOWS,
+    ) -> None:
+        super().__init__()
+        self.url = url
+        self.session = session or requests.Session()
+        self.read_ahead = read_ahead
+        self.cache_windows = cache_windows
+        self._pos = 0
+        self._spans: list[tuple[int, int]] = []
+        self._windows: OrderedDict[int, bytes] = OrderedDict()  # start → bytes
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_fetched = 0
+        if size is None:
+            resp = self.session.head(url, allow_redirects=True, timeout=RANGE_TIMEOUT)
+            resp.raise_for_status()
+            size = int(resp.headers["Content-Length"])
+        self.size = size
+
+    # ── io.RawIOBase ─────────────────────────────────────────
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size is None or size < 0 else min(self.size, self._pos + size)
+        parts = []
+        while self._pos < end:
+            chunk = self._read_cached(self._pos, end)
+            parts.append(chunk)
+            self._pos += len(chunk)
+        return b"".join(parts)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    # ── Planning / fetching ──────────────────────────────────
+
+    def plan(self, ranges: list[tuple[int, int]]) -> None:
+        """Declare the ranges about to be read, so fetches can span them."""
+        self._spans = coalesce(ranges)
+        logger.debug(
+            "Remote file: %d ranges → %d spans (%.1f MB of %.1f MB)",
+            len(ranges),
+            len(self._spans),
+            sum(e - s for s, e in self._spans) / (1024 * 1024),
+            self.size / (1024 * 1024),
+        )
+
+    def _fetch_end(self, offset: int) -> int:
+        """End of the request that should serve a miss at *offset*."""
+        i = bisect.bisect_right(self._spans, (offset, float("inf"))) - 1
+        if i >= 0 and self._spans[i][0] <= offset < self._spans[i][1]:
+            return min(self._spans[i][1], offset + self.read_ahead)
+        return min(self.size, offset + MIN_FETCH)
+
+    def _read_cached(self, offset: int, end: int) -> bytes:
+        with self._lock:
+            for start, data in self._windows.items():
+                if start <= offset < start + len(data):
+                    self._windows.move_to_end(start)
+                    return data[offset - start : end - start]
+            # A single large read is fetched whole
+            data = self._fetch(offset, max(self._fetch_end(offset), end))
+            self._windows[offset] = data
+            while len(self._windows) > self.cache_windows:
+                self._windows.popitem(last=False)
+            return data[: end - offset]
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        resp = self.session.get(
+            self.url,
+            headers={"Range": f"bytes={start}-{end - 1}"},
+            timeout=RANGE_TIMEOUT,
+        )
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise IOError(f"Server ignored Range request ({resp.status_code})")
+        data = resp.content
+        if not data:
+            raise IOError(f"Empty range {start}-{end - 1}")
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        return data
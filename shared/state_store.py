@@ -0,0 +1,280 @@
+"""
+Delta-log key/value state store on GCS.
+
+A store named <name> lives under mirror/state/<name>/:
+
+  manifest.json               — ordered list of live segments (the index)
+  base-<seq>.json.gz          — full snapshot  {"set": {key: value, …}}
+  delta-<seq>.json.gz         — changes since  {"set": {…}, "del": [key, …]}
+  base-<seq>.pidx             — compact snapshot, for stores loaded as a
+                                ``PathIndex`` (shared/path_index.py)
+
+A checkpoint uploads one delta segment holding only the keys that changed,
+then rewrites the small manifest, so its cost tracks the change rate rather
+than the store size.  When the deltas grow past a fraction of the base (or
+too many pile up) the next checkpoint compacts everything into a new base.
+Loads fetch all live segments concurrently and replay them in order.
+
+Values must be JSON-serialisable.  Used for the sync indexes and the
+embedding state; an existing whole-file JSON blob can be given as
+``legacy_key`` and is migrated on first load.
+
+Each job also publishes a small version stamp when a run changed what
+queries can see (``publish_version``), so readers can invalidate cached
+search results.
+"""
+
+import gzip
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from shared.gcs import delete_blob, download_bytes, read_json, upload_bytes, write_json
+
+logger = logging.getLogger(__name__)
+
+STATE_PREFIX = "mirror/state/"
+
+# Version stamps: docs searchable (sync job), image vectors (embed job)
+SYNC_VERSION_KEY = f"{STATE_PREFIX}sync_version.json"
+EMBEDDING_VERSION_KEY = f"{STATE_PREFIX}embedding_version.json"
+
+# Compact once delta bytes exceed this fraction of the base …
+COMPACT_RATIO = 0.5
+# … or once this many deltas are live
+MAX_DELTAS = 64
+
+# Parallel segment downloads on load
+LOAD_WORKERS = 8
+
+
+class TrackedDict(dict):
+    """dict that remembers which keys changed since the last checkpoint.
+
+    In-place changes to a mutable value are invisible to the dict; call
+    ``mark(key)`` (or re-assign the key) after making one.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.dirty: set = set()
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self.dirty.add(key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key in self:
+            self.dirty.add(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple:
+        key, value = super().popitem()
+        self.dirty.add(key)
+        return key, value
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        self.dirty.update(self.keys())
+        super().clear()
+
+    def mark(self, key: Any) -> None:
+        self.dirty.add(key)
+
+    def replay(self, segment: dict) -> None:
+        """Apply a loaded state segment without marking keys dirty."""
+        dict.update(self, segment.get("set", {}))
+        for key in segment.get("del", ()):
+            dict.pop(self, key, None)
+
+
+def _encode(payload: dict) -> bytes:
+    return gzip.compress(
+        json.dumps(payload, separators=(",", ":"), default=str).encode(),
+        compresslevel=6,
+    )
+
+
+def _decode(raw: bytes) -> dict:
+    return json.loads(gzip.decompress(raw))
+
+
+class StateStore:
+    """One named delta-log store in *bucket_name*.
+
+    Usage:
+        store = StateStore(BUCKET, "rev_index", legacy_key=REV_INDEX_KEY)
+        rev_index = store.load()        # TrackedDict
+        rev_index[file_id] = rev
+        store.checkpoint(rev_index)     # appends only the changed keys
+
+    ``container`` swaps the in-memory type, e.g. ``PathIndex``; it needs
+    ``dirty``, ``replay()`` and the mapping methods, and bases are written
+    with its ``to_compact()`` when it has one.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        name: str,
+        legacy_key: Optional[str] = None,
+        prefix: str = STATE_PREFIX,
+        container: type = TrackedDict,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.container = container
+        self.name = name
+        self.legacy_key = legacy_key
+        self.prefix = f"{prefix}{name}/"
+        self.manifest_key = f"{self.prefix}manifest.json"
+        self._manifest: Optional[dict[str, Any]] = None
+
+    # ── Load ─────────────────────────────────────────────────
+
+    def load(self) -> Any:
+        """Replay the live segments (or migrate the legacy JSON)."""
+        self._manifest = read_json(self.bucket_name, self.manifest_key) or None
+        if self._manifest is None:
+            data = self.container()
+            if self.legacy_key:
+                data = self.container(read_json(self.bucket_name, self.legacy_key))
+                data.dirty.update(data.keys())  # first checkpoint writes a base
+                if data:
+                    logger.info(
+                        "State %s: migrating %d keys from %s",
+                        self.name,
+                        len(data),
+                        self.legacy_key,
+                    )
+            return data
+
+        names = [seg["name"] for seg in self._manifest["segments"]]
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            blobs = list(
+                pool.map(
+                    lambda n: download_bytes(self.bucket_name, self.prefix + n),
+                    names,
+                )
+            )
+
+        data = self.container()
+        for name, raw in zip(names, blobs):
+            if name.endswith(".pidx"):
+                data = self.container.from_compact(raw)
+            else:
+                data.replay(_decode(raw))
+        logger.info(
+            "State %s: loaded %d keys from %d segments",
+            self.name,
+            len(data),
+            len(names),
+        )
+        return data
+
+    # ── Checkpoint ───────────────────────────────────────────
+
+    def checkpoint(self, data: Any) -> None:
+        """Persist the changes in *data* since the last checkpoint."""
+        if self._manifest is None:
+            self._write_base(data)
+            return
+        if not data.dirty:
+            return
+        if self._should_compact():
+            self._write_base(data)
+            return
+
+        changed = set(data.dirty)
+        payload = {
+            "set": {k: data[k] for k in changed if k in data},
+            "del": [k for k in changed if k not in data],
+        }
+        seq = self._manifest["seq"] + 1
+        name = f"delta-{seq:08d}.json.gz"
+        raw = _encode(payload)
+        upload_bytes(self.bucket_name, self.prefix + name, raw, "application/gzip")
+
+        self._manifest["seq"] = seq
+        self._manifest["segments"].append(
+            {"name": name, "bytes": len(raw), "keys": len(changed)}
+        )
+        write_json(self.bucket_name, self.manifest_key, self._manifest)
+        data.dirty -= changed
+        logger.debug(
+            "State %s: delta %s (%d keys, %d bytes)",
+            self.name,
+            name,
+            len(changed),
+            len(raw),
+        )
+
+    def _should_compact(self) -> bool:
+        segments = self._manifest["segments"]
+        deltas = segments[1:]
+        if len(deltas) >= MAX_DELTAS:
+            return True
+        delta_bytes = sum(seg["bytes"] for seg in deltas)
+        return delta_bytes > COMPACT_RATIO * max(segments[0]["bytes"], 1)
+
+    def _write_base(self, data: Any) -> None:
+        changed = set(data.dirty)
+        old_segments = self._manifest["segments"] if self._manifest else []
+        seq = (self._manifest["seq"] + 1) if self._manifest else 1
+        if hasattr(data, "to_compact"):
+            name = f"base-{seq:08d}.pidx"
+            raw = data.to_compact()
+            content_type = "application/octet-stream"
+        else:
+            name = f"base-{seq:08d}.json.gz"
+            raw = _encode({"set": dict(data)})
+            content_type = "application/gzip"
+        upload_bytes(self.bucket_name, self.prefix + name, raw, content_type)
+
+        self._manifest = {
+            "seq": seq,
+            "segments": [{"name": name, "bytes": len(raw), "keys": len(data)}],
+        }
+        write_json(self.bucket_name, self.manifest_key, self._manifest)
+        data.dirty -= changed
+
+        # Superseded segments are no longer referenced by the manifest
+        for seg in old_segments:
+            delete_blob(self.bucket_name, self.prefix + seg["name"])
+        logger.info(
+            "State %s: compacted %d keys into %s (%d bytes)",
+            self.name,
+            len(data),
+            name,
+            len(raw),
+        )
+
+
+# ── Version stamps ───────────────────────────────────────────
+
+
+def publish_version(bucket_name: str, key: str) -> str:
+    """Write a fresh version stamp to *key*; returns it."""
+    version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    write_json(bucket_name, key, {"version": version})
+    logger.info("Published state version %s → %s", version, key)
+    return version
+
+
+def read_version(bucket_name: str, key: str) -> str:
+    """Current stamp at *key* ("" if none was published yet)."""
+    return read_json(bucket_name, key).get("version", "")
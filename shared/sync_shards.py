@@ -0,0 +1,361 @@
+"""
+Sharded sync runs: several Cloud Run tasks split one listing by file id.
+
+Every task lists the same changes from the committed cursor but handles
+only the files it owns (crc32 of the file id mod the task count, as for
+the manifest shards).  Tasks never write the shared indexes or the cursor.
+Each one keeps its changes — path/rev/hash index keys, manifest rows, and
+orphaned objects it would have deleted — in its own shard:
+
+  mirror/state/shards/<run_id>/task-<i>-of-<n>.json.gz        one task's parts
+  mirror/state/shards/<run_id>/task-<i>-of-<n>/part-<id>.json.gz
+                                                    changes since the last part
+  mirror/state/shards/<run_id>/done.json                      tasks finished
+
+Each checkpoint uploads one immutable part holding only what changed since
+the previous one, then lists it in the task's head object; loading a shard
+composes its parts in order.  Once MAX_PARTS are listed they are folded
+into one.  Heads and done.json are written with generation preconditions:
+a retried task takes over its shard, and a stale instance of it can no
+longer overwrite it.  The task whose ``finish()`` completes done.json
+claims the merge:
+
+  paths, revs       keys are disjoint by owner, except a path freed by one
+                    task and reused by another: deletes apply before sets
+  manifest          a row as written by its owner wins
+  hash entries      per-reference union against the pre-run entry; when
+                    tasks stored the same content under different keys, one
+                    object wins and every reference is repointed to it
+  orphans           deleted only if no entry or manifest row uses them
+  cursor            that of the task that listed the fewest entries —
+                    every task processed at least that far; later changes
+                    are listed again next run (reprocessing is idempotent)
+"""
+
+import gzip
+import json
+import logging
+import uuid
+from typing import Any, Callable, Optional
+
+from google.api_core.exceptions import PreconditionFailed
+
+from shared import config
+from shared.gcs import (
+    delete_blobs,
+    download_with_generation,
+    list_blobs,
+    upload_bytes,
+    upload_bytes_if_generation,
+)
+from shared.manifest import Manifest, ManifestRow, shard_of
+
+logger = logging.getLogger(__name__)
+
+# Fold a task's parts into one once this many are listed
+MAX_PARTS = 32
+
+
+def _encode(payload: dict) -> bytes:
+    return gzip.compress(
+        json.dumps(payload, separators=(",", ":"), default=str).encode(),
+        compresslevel=6,
+    )
+
+
+def _decode(raw: bytes) -> dict:
+    return json.loads(gzip.decompress(raw))
+
+
+# ── Deltas ───────────────────────────────────────────────────
+
+
+def dict_delta(data: Any) -> dict:
+    """Changes to a TrackedDict / PathIndex since load: {"set", "del"}."""
+    return {
+        "set": {k: data[k] for k in data.dirty if k in data},
+        "del": [k for k in data.dirty if k not in data],
+    }
+
+
+def apply_delta(data: Any, delta: dict) -> None:
+    """Re-apply a task's own delta (marks the keys dirty again)."""
+    for key in delta.get("del", ()):
+        data.pop(key, None)
+    data.update(delta.get("set", {}))
+
+
+def manifest_delta(manifest: Manifest) -> dict:
+    rows = [manifest.get(fid) for fid in manifest.changed]
+    return {
+        "upsert": [list(row) for row in rows if row is not None],
+        "remove": [fid for fid in manifest.changed if fid not in manifest],
+    }
+
+
+def apply_manifest_delta(manifest: Manifest, delta: dict) -> None:
+    for fid in delta.get("remove", ()):
+        manifest.remove(fid)
+    for values in delta.get("upsert", ()):
+        manifest.upsert(ManifestRow(*values))
+
+
+def clear_changes(manifest: Manifest, *stores: Any) -> None:
+    """Forget changes already saved in the task's shard."""
+    manifest.changed.clear()
+    for data in stores:
+        data.dirty.clear()
+
+
+def merge_dict_deltas(data: Any, deltas: list[dict]) -> None:
+    """Every task's deletes, then every task's sets."""
+    for delta in deltas:
+        for key in delta.get("del", ()):
+            data.pop(key, None)
+    for delta in deltas:
+        data.update(delta.get("set", {}))
+
+
+def merge_manifest_deltas(manifest: Manifest, deltas: list[dict]) -> None:
+    """Rows changed by a task that doesn't own them first, owners' last."""
+    count = len(deltas)
+    for owned in (False, True):
+        for index, delta in enumerate(deltas):
+            for fid in delta.get("remove", ()):
+                if (shard_of(fid, count) == index) == owned:
+                    manifest.remove(fid)
+            for values in delta.get("upsert", ()):
+                if (shard_of(values[0], count) == index) == owned:
+                    manifest.upsert(ManifestRow(*values))
+
+
+def merge_hash_deltas(
+    entries: Any,
+    deltas: list[dict],
+    row_key: Callable[[str], Optional[str]],
+) -> tuple[set[str], list[tuple[str, str]]]:
+    """Merge the tasks' hash-index changes into the pre-run *entries*.
+
+    *row_key* gives a file's stored object per the merged manifest.
+    Returns (object keys no longer held by their entry, (file id, key)
+    pairs whose sidecar and row must be repointed to the entry's object —
+    after a task moved it to a shared key, or when tasks stored the same
+    content under different keys).
+    """
+    stale: set[str] = set()
+    repoint: list[tuple[str, str]] = []
+    changed = {k for d in deltas for k in (*d.get("set", {}), *d.get("del", ()))}
+    for dkey in changed:
+        base = entries.get(dkey)
+        base_refs = set(base["refs"]) if base else set()
+        key = base["key"] if base else None
+        moved = None
+        removed: set[str] = set()
+        added: list[str] = []
+        candidates = {key} if key else set()  # objects holding this content
+        for delta in deltas:
+            if dkey in delta.get("set", {}):
+                entry = delta["set"][dkey]
+            elif dkey in delta.get("del", ()):
+                entry = None
+            else:
+                continue
+            refs = entry["refs"] if entry else []
+            removed |= base_refs - set(refs)
+            added += [f for f in refs if f not in base_refs and f not in added]
+            if entry:
+                stale.add(entry["key"])
+                candidates.add(entry["key"])
+                if key is None:
+                    key = entry["key"]  # first task to store the content
+                elif base and entry["key"] != base["key"] and moved is None:
+                    moved = entry["key"]
+        key = moved or key
+
+        refs = []
+        for fid in [f for f in (base["refs"] if base else []) if f not in removed] + added:
+            stored = row_key(fid)
+            if stored is None or stored == key:
+                refs.append(fid)
+            elif stored in candidates:
+                # Another task's copy of the content (or the pre-move key):
+                # serve it from the chosen object so the copy can go
+                repoint.append((fid, key))
+                refs.append(fid)
+            # else: the owner's row now points at other content
+        if base:
+            stale.add(base["key"])
+        if refs:
+            entries[dkey] = {"key": key, "refs": refs}
+            stale.discard(key)
+        else:
+            entries.pop(dkey, None)
+    return stale, repoint
+
+
+def _compose_dicts(first: dict, second: dict) -> dict:
+    """One dict delta equivalent to applying *first*, then *second*."""
+    sets = dict(first.get("set", {}))
+    dels = set(first.get("del", ()))
+    for key in second.get("del", ()):
+        sets.pop(key, None)
+        dels.add(key)
+    for key, value in second.get("set", {}).items():
+        sets[key] = value
+        dels.discard(key)
+    return {"set": sets, "del": sorted(dels)}
+
+
+def _compose_manifests(first: dict, second: dict) -> dict:
+    upserts = {values[0]: values for values in first.get("upsert", ())}
+    removes = set(first.get("remove", ()))
+    for fid in second.get("remove", ()):
+        upserts.pop(fid, None)
+        removes.add(fid)
+    for values in second.get("upsert", ()):
+        upserts[values[0]] = values
+        removes.discard(values[0])
+    return {"upsert": list(upserts.values()), "remove": sorted(removes)}
+
+
+def compose_parts(parts: list[dict]) -> dict:
+    """A task's checkpoints in order, as one state: the last part's header
+    (cursor, counters, stats) and every part's changes."""
+    state = dict(parts[-1])
+    for name in ("path", "rev", "hash"):
+        delta: dict = {}
+        for part in parts:
+            delta = _compose_dicts(delta, part[name])
+        state[name] = delta
+    manifest: dict = {}
+    for part in parts:
+        manifest = _compose_manifests(manifest, part["manifest"])
+    state["manifest"] = manifest
+    state["orphans"] = sorted({key for part in parts for key in part["orphans"]})
+    return state
+
+
+# ── Shards ───────────────────────────────────────────────────
+
+
+def _run_prefix(run_id: str) -> str:
+    return f"{config.SYNC_SHARDS_PREFIX}{run_id}/"
+
+
+def _shard_key(run_id: str, index: int, count: int) -> str:
+    return f"{_run_prefix(run_id)}task-{index:04d}-of-{count:04d}.json.gz"
+
+
+def _load_parts(bucket_name: str, key: str) -> tuple[list[str], int]:
+    """A task's part keys, in order, and its head's generation."""
+    raw, generation = download_with_generation(bucket_name, key)
+    return (json.loads(raw)["parts"] if raw else []), generation
+
+
+def _read_parts(bucket_name: str, keys: list[str]) -> Optional[dict]:
+    parts = []
+    for key in keys:
+        raw, _ = download_with_generation(bucket_name, key)
+        if raw:
+            parts.append(_decode(raw))
+    return compose_parts(parts) if parts else None
+
+
+class TaskShard:
+    """One task's delta for one sharded run, as a list of parts.
+
+    Usage:
+        task = TaskShard(BUCKET, run_id, index, count)
+        previous = task.load()          # this task's delta from a failed attempt
+        if task.owns(file_id): ...
+        task.save(payload)              # changes since the last save;
+                                        # PreconditionFailed if taken over
+        if task.finish():               # last task to finish merges
+            ...
+    """
+
+    def __init__(self, bucket_name: str, run_id: str, index: int, count: int) -> None:
+        if not run_id:
+            raise ValueError("A sharded run needs SYNC_RUN_ID (or CLOUD_RUN_EXECUTION)")
+        self.bucket_name = bucket_name
+        self.run_id = run_id
+        self.index = index
+        self.count = count
+        self.key = _shard_key(run_id, index, count)
+        self.done_key = f"{_run_prefix(run_id)}done.json"
+        self._generation = 0
+        self._parts: list[str] = []
+
+    def owns(self, file_id: str) -> bool:
+        return shard_of(file_id, self.count) == self.index
+
+    def load(self) -> Optional[dict]:
+        self._parts, self._generation = _load_parts(self.bucket_name, self.key)
+        return _read_parts(self.bucket_name, self._parts)
+
+    def _write_part(self, payload: dict) -> str:
+        key = f"{self.key.removesuffix('.json.gz')}/part-{uuid.uuid4().hex}.json.gz"
+        upload_bytes(self.bucket_name, key, _encode(payload), "application/gzip")
+        return key
+
+    def save(self, payload: dict) -> None:
+        """Append *payload* — the changes since the last save — as a part."""
+        folded: list[str] = []
+        if len(self._parts) >= MAX_PARTS:
+            folded = self._parts
+            combined = compose_parts([_read_parts(self.bucket_name, folded), payload])
+            parts = [self._write_part(combined)]
+        else:
+            parts = self._parts + [self._write_part(payload)]
+        self._generation = upload_bytes_if_generation(
+            self.bucket_name,
+            self.key,
+            json.dumps({"parts": parts}).encode(),
+            self._generation,
+            "application/json",
+        )
+        self._parts = parts
+        if folded:
+            delete_blobs(self.bucket_name, folded)
+
+    def finish(self) -> bool:
+        """Record this task as finished; True if it should run the merge."""
+        while True:
+            raw, generation = download_with_generation(self.bucket_name, self.done_key)
+            done = json.loads(raw) if raw else {"tasks": [], "merging": False}
+            tasks = set(done["tasks"]) | {self.index}
+            merge = len(tasks) == self.count and not done["merging"]
+            if self.index in done["tasks"] and not merge:
+                return False
+            data = {"tasks": sorted(tasks), "merging": merge}
+            try:
+                upload_bytes_if_generation(
+                    self.bucket_name,
+                    self.done_key,
+                    json.dumps(data).encode(),
+                    generation,
+                    "application/json",
+                )
+            except PreconditionFailed:
+                continue  # another task finished at the same time
+            logger.info(
+                "Task %d finished (%d/%d)%s",
+                self.index,
+                len(tasks),
+                self.count,
+                " — merging" if merge else "",
+            )
+            return merge
+
+
+def load_shards(bucket_name: str, run_id: str, count: int) -> list[Optional[dict]]:
+    """Every task's delta for *run_id* (None where a shard is missing)."""
+    shards = []
+    for index in range(count):
+        parts, _ = _load_parts(bucket_name, _shard_key(run_id, index, count))
+        shards.append(_read_parts(bucket_name, parts))
+    return shards
+
+
+def delete_shards(bucket_name: str, run_id: str) -> None:
+    delete_blobs(bucket_name, list_blobs(bucket_name, _run_prefix(run_id)))
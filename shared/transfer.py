@@ -0,0 +1,139 @@
+"""
+Bounded worker pool for network-bound transfers.
+
+Tasks run on a thread pool, but their completions are handed back to the
+submitting thread (during ``submit`` / ``poll`` / ``drain``), so shared
+state such as the sync indexes keeps a single writer and stays consistent
+at every checkpoint.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# on_done(context, result, error) — error is None on success
+DoneCallback = Callable[[Any, Any, Optional[BaseException]], None]
+
+
+class TransferPool:
+    """
+    Thread pool with a cap on in-flight tasks.
+
+    Each task has a *key* (e.g. the Dropbox path); submitting a key that is
+    already in flight first waits for the earlier task, so work on the same
+    object is applied in order.
+
+    Usage:
+        pool = TransferPool(8, on_done=apply_result)
+        pool.submit(path, transfer_fn, entry, context=entry)
+        ...
+        pool.drain()  # wait for everything, running on_done for each
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        on_done: DoneCallback,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="transfer"
+        )
+        self._on_done = on_done
+        self._max_pending = max_pending or max_workers * 2
+        self._pending: dict[Hashable, tuple[Future, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    def submit(
+        self,
+        key: Hashable,
+        fn: Callable[..., Any],
+        *args: Any,
+        context: Any = None,
+    ) -> None:
+        """Queue ``fn(*args)``; blocks while the pool is at capacity."""
+        if key in self._pending:
+            self.wait_for(key)
+        while len(self._pending) >= self._max_pending:
+            self._wait_any()
+        self._pending[key] = (self._executor.submit(fn, *args), context)
+
+    def poll(self) -> None:
+        """Run on_done for every task that has already finished."""
+        for key in [k for k, (f, _) in self._pending.items() if f.done()]:
+            self._finish(key)
+
+    def wait_for(self, key: Hashable) -> None:
+        """Block until the task for *key* (if any) has finished."""
+        item = self._pending.get(key)
+        if item is None:
+            return
+        wait([item[0]])
+        self._finish(key)
+
+    def drain(self) -> None:
+        """Block until every in-flight task has finished."""
+        while self._pending:
+            self._wait_any()
+
+    def close(self) -> None:
+        """Drain and shut down the worker threads."""
+        self.drain()
+        self._executor.shutdown(wait=True)
+
+    def _wait_any(self) -> None:
+        wait([f for f, _ in self._pending.values()], return_when=FIRST_COMPLETED)
+        self.poll()
+
+    def _finish(self, key: Hashable) -> None:
+        future, context = self._pending.pop(key)
+        error = future.exception()
+        result = None if error else future.result()
+        self._on_done(context, result, error)
+
+
+class PageLedger:
+    """
+    Tracks outstanding work per listing page.
+
+    A page's cursor becomes committable once the page has been fully
+    listed, all of its tasks have finished, and the same holds for every
+    earlier page.
+    """
+
+    def __init__(self) -> None:
+        self._next_seq = 0
+        self._outstanding: dict[int, int] = {}
+        self._cursors: dict[int, str] = {}  # closed pages → cursor
+        self._committable: Optional[str] = None
+
+    def open_page(self) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        self._outstanding[seq] = 0
+        return seq
+
+    def add(self, seq: int) -> None:
+        self._outstanding[seq] += 1
+
+    def done(self, seq: int) -> None:
+        self._outstanding[seq] -= 1
+
+    def close_page(self, seq: int, cursor: str) -> None:
+        self._cursors[seq] = cursor
+
+    def committable(self) -> Optional[str]:
+        """Cursor of the newest page whose whole prefix is finished."""
+        for seq in sorted(self._outstanding):
+            if seq not in self._cursors or self._outstanding[seq] > 0:
+                break
+            self._committable = self._cursors.pop(seq)
+            del self._outstanding[seq]
+        return self._committable
@@ -1,13 +1,47 @@
 """
 Vertex AI Search (Discovery Engine) helpers for importing documents.
+
+All calls go through the shared keep-alive session in shared/auth.py, which
+attaches a cached, background-refreshed access token.
+
+Two import modes (DOC_IMPORT_MODE):
+
+  batch   DocImportBuffer submits each new doc URI in batches of 50 as the
+          sync runs.  Imports are long-running operations; ImportTracker
+          records each one with its URIs in a ledger
+          (mirror/state/doc_import_ledger.json), polls them in bulk, and
+          re-submits only the documents that failed.
+  jsonl   IncrementalImporter diffs the manifest's docs against what the
+          last successful import covered and submits one JSONL import of
+          just the changes per run.
 """
 
+import hashlib
 import json
 import logging
-import urllib.request
-import urllib.error
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from typing import Any, Iterable, Optional
+
+import requests
 
 from shared import config
+from shared.auth import get_session, get_token_provider
+from shared.categories import mime_type
+from shared.gcs import (
+    delete_blob,
+    download_bytes,
+    list_blobs,
+    read_json,
+    upload_bytes,
+    write_json,
+)
+from shared.manifest import ManifestRow
+from shared.state_store import StateStore, TrackedDict
 
 logger = logging.getLogger(__name__)
 
@@ -16,31 +50,48 @@ DISCOVERY_ENGINE_BASE = "https://discoveryengine.googleapis.com/v1"
 
 
 def get_access_token() -> str:
-    """Get GCP access token from metadata server (Cloud Run) or gcloud (local)."""
-    # Try metadata server first (Cloud Run environment)
-    try:
-        req = urllib.request.Request(
-            "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token",
-            headers={"Metadata-Flavor": "Google"},
-        )
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            data = json.loads(resp.read().decode())
-            return data["access_token"]
-    except Exception:
-        pass
-
-    # Fall back to gcloud CLI (local development)
-    import subprocess
-
-    result = subprocess.run(
-        ["gcloud", "auth", "print-access-token"],
-        capture_output=True,
-        text=True,
-    )
-    if result.returncode == 0:
-        return result.stdout.strip()
+    """Current GCP access token (cached; see shared/auth.py)."""
+    return get_token_provider().token()
+
+
+def _branch_url(datastore_id: str) -> str:
+    return f"{DISCOVERY_ENGINE_BASE}/projects/{config.GCP_PROJECT_ID}/locations/global/collections/default_collection/dataStores/{datastore_id}/branches/default_branch"
+
+
+def _import_url(datastore_id: str) -> str:
+    return f"{_branch_url(datastore_id)}/documents:import"
 
-    raise RuntimeError("Could not obtain GCP access token")
+
+def _post_import(
+    datastore_id: str,
+    gcs_uris: list[str],
+    timeout: int,
+    error_prefix: Optional[str] = None,
+    data_schema: str = "content",
+) -> dict:
+    """POST a documents:import for *gcs_uris*; returns the operation JSON.
+
+    With *error_prefix* (a gs:// URI), per-document errors are written
+    there by the import.  *data_schema* "document" reads the URIs as JSONL
+    files of {id, content: {mimeType, uri}} entries.
+    """
+    payload: dict[str, Any] = {
+        "gcsSource": {
+            "inputUris": gcs_uris,
+            "dataSchema": data_schema,
+        },
+        "reconciliationMode": "INCREMENTAL",
+    }
+    if error_prefix:
+        payload["errorConfig"] = {"gcsPrefix": error_prefix}
+    resp = get_session().post(
+        _import_url(datastore_id),
+        json=payload,
+        headers={"x-goog-user-project": config.GCP_PROJECT_ID},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 
 def import_document(gcs_uri: str, document_id: str) -> bool:
@@ -59,50 +110,32 @@ def import_document(gcs_uri: str, document_id: str) -> bool:
         logger.warning("VERTEX_SEARCH_DATASTORE_ID not set, skipping import")
         return False
 
-    token = get_access_token()
-
-    url = f"{DISCOVERY_ENGINE_BASE}/projects/{config.GCP_PROJECT_ID}/locations/global/collections/default_collection/dataStores/{datastore_id}/branches/default_branch/documents:import"
-
-    payload = {
-        "gcsSource": {
-            "inputUris": [gcs_uri],
-            "dataSchema": "content",
-        },
-        "reconciliationMode": "INCREMENTAL",
-    }
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "x-goog-user-project": config.GCP_PROJECT_ID,
-    }
-
     try:
-        data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            result = json.loads(resp.read().decode())
-
-            # Check if operation completed
-            if result.get("done") is False:
-                # Async operation started - this is normal
-                op_name = result.get("name", "")
-                logger.debug("Import operation started: %s", op_name)
-                return True
-
-            # Check for errors in response
-            if "error" in result:
-                logger.warning(
-                    "Import failed for %s: %s", gcs_uri, result["error"].get("message")
-                )
-                return False
+        result = _post_import(datastore_id, [gcs_uri], timeout=60)
 
+        # Check if operation completed
+        if result.get("done") is False:
+            # Async operation started - this is normal
+            op_name = result.get("name", "")
+            logger.debug("Import operation started: %s", op_name)
             return True
 
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode() if e.fp else ""
-        logger.warning("Import HTTP error for %s: %s - %s", gcs_uri, e.code, error_body)
+        # Check for errors in response
+        if "error" in result:
+            logger.warning(
+                "Import failed for %s: %s", gcs_uri, result["error"].get("message")
+            )
+            return False
+
+        return True
+
+    except requests.HTTPError as e:
+        logger.warning(
+            "Import HTTP error for %s: %s - %s",
+            gcs_uri,
+            e.response.status_code,
+            e.response.text,
+        )
         return False
     except Exception as e:
         logger.warning("Import failed for %s: %s", gcs_uri, e)
@@ -127,57 +160,38 @@ def import_documents_batch(gcs_uris: list[str]) -> tuple[int, int]:
         logger.warning("VERTEX_SEARCH_DATASTORE_ID not set, skipping import")
         return 0, len(gcs_uris)
 
-    token = get_access_token()
-
-    url = f"{DISCOVERY_ENGINE_BASE}/projects/{config.GCP_PROJECT_ID}/locations/global/collections/default_collection/dataStores/{datastore_id}/branches/default_branch/documents:import"
-
-    payload = {
-        "gcsSource": {
-            "inputUris": gcs_uris,
-            "dataSchema": "content",
-        },
-        "reconciliationMode": "INCREMENTAL",
-    }
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "x-goog-user-project": config.GCP_PROJECT_ID,
-    }
-
     try:
-        data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-
-        with urllib.request.urlopen(req, timeout=120) as resp:
-            result = json.loads(resp.read().decode())
-
-            # Check if operation completed
-            if result.get("done") is False:
-                # Async operation started - this is normal
-                op_name = result.get("name", "")
-                logger.debug("Batch import operation started: %s", op_name)
-                return len(gcs_uris), 0
-
-            # Check for errors in response
-            if "error" in result:
-                logger.warning(
-                    "Batch import failed for %d docs: %s",
-                    len(gcs_uris),
-                    result["error"].get("message"),
-                )
-                return 0, len(gcs_uris)
-
-            # Check metadata for partial success
-            metadata = result.get("metadata", {})
-            success = int(metadata.get("successCount", len(gcs_uris)))
-            failed = int(metadata.get("failureCount", 0))
-            logger.info("Batch import: %d success, %d failed", success, failed)
-            return success, failed
-
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode() if e.fp else ""
-        logger.warning("Batch import HTTP error: %s - %s", e.code, error_body)
+        result = _post_import(datastore_id, gcs_uris, timeout=120)
+
+        # Check if operation completed
+        if result.get("done") is False:
+            # Async operation started - this is normal
+            op_name = result.get("name", "")
+            logger.debug("Batch import operation started: %s", op_name)
+            return len(gcs_uris), 0
+
+        # Check for errors in response
+        if "error" in result:
+            logger.warning(
+                "Batch import failed for %d docs: %s",
+                len(gcs_uris),
+                result["error"].get("message"),
+            )
+            return 0, len(gcs_uris)
+
+        # Check metadata for partial success
+        metadata = result.get("metadata", {})
+        success = int(metadata.get("successCount", len(gcs_uris)))
+        failed = int(metadata.get("failureCount", 0))
+        logger.info("Batch import: %d success, %d failed", success, failed)
+        return success, failed
+
+    except requests.HTTPError as e:
+        logger.warning(
+            "Batch import HTTP error: %s - %s",
+            e.response.status_code,
+            e.response.text,
+        )
         return 0, len(gcs_uris)
     except Exception as e:
         logger.warning("Batch import failed: %s", e)
@@ -186,46 +200,532 @@ def import_documents_batch(gcs_uris: list[str]) -> tuple[int, int]:
 
 # Recommended batch size for Vertex AI Search imports
 BATCH_SIZE = 50
+# Full batches waiting for the import worker before add() blocks
+MAX_PENDING_BATCHES = 4
+# Import attempts per document before it is given up on
+MAX_IMPORT_ATTEMPTS = 3
+# operations.list pages read per poll before falling back to single GETs
+MAX_LIST_PAGES = 5
+POLL_INTERVAL_SECONDS = 15
+
+
+class ImportTracker:
+    """
+    Ledger of in-flight document imports, persisted in GCS.
+
+    Every submitted batch is recorded under its operation name.  poll()
+    resolves finished operations, re-submits only the documents that
+    failed (up to MAX_IMPORT_ATTEMPTS) and counts the rest as imported.
+    Operations still running at the end of a run stay in the ledger and
+    are resolved by the next run.
+
+    Usage:
+        tracker = ImportTracker(BUCKET)
+        tracker.load()
+        tracker.submit(uris)
+        ...
+        tracker.settle(timeout=120)   # poll until done or timed out
+        tracker.save()
+        tracker.imported, tracker.failed, tracker.pending
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        ledger_key: str = config.DOC_IMPORT_LEDGER_KEY,
+        errors_prefix: str = config.DOC_IMPORT_ERRORS_PREFIX,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.ledger_key = ledger_key
+        self.errors_prefix = errors_prefix
+        self._operations: dict[str, dict] = {}  # name → {uris, attempt, errors}
+        self._retry: dict[str, int] = {}  # uri → attempts so far
+        self._failed: dict[str, int] = {}  # uri → attempts (given up)
+        self._lock = threading.Lock()
+        # Counts for this run
+        self.imported = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        """Documents still in flight or waiting to be re-submitted."""
+        with self._lock:
+            in_flight = sum(len(op["uris"]) for op in self._operations.values())
+            return in_flight + len(self._retry)
+
+    def load(self) -> None:
+        ledger = read_json(self.bucket_name, self.ledger_key)
+        self._operations = ledger.get("operations", {})
+        self._retry = ledger.get("retry", {})
+        self._failed = ledger.get("failed", {})
+        if self._operations or self._retry:
+            logger.info(
+                "Import ledger: %d operations in flight, %d docs to retry",
+                len(self._operations),
+                len(self._retry),
+            )
+
+    def save(self) -> None:
+        with self._lock:
+            ledger = {
+                "operations": dict(self._operations),
+                "retry": dict(self._retry),
+                "failed": dict(self._failed),
+            }
+        write_json(self.bucket_name, self.ledger_key, ledger)
+
+    # ── Submit ───────────────────────────────────────────────
+
+    def submit(self, gcs_uris: list[str], attempt: int = 1) -> None:
+        """Start an import of *gcs_uris* and record its operation."""
+        datastore_id = config.VERTEX_SEARCH_DATASTORE_ID
+        if not datastore_id:
+            logger.warning("VERTEX_SEARCH_DATASTORE_ID not set, skipping import")
+            with self._lock:
+                self.failed += len(gcs_uris)
+            return
+
+        errors = f"{self.errors_prefix}{uuid.uuid4().hex}/"
+        try:
+            result = _post_import(
+                datastore_id,
+                gcs_uris,
+                timeout=120,
+                error_prefix=f"gs://{self.bucket_name}/{errors}",
+            )
+        except Exception as e:
+            logger.warning("Import submit failed for %d docs: %s", len(gcs_uris), e)
+            self.record_failures(gcs_uris, attempt)
+            return
+
+        op = {"uris": gcs_uris, "attempt": attempt, "errors": errors}
+        if result.get("done"):
+            self._resolve(op, result)
+        elif result.get("name"):
+            logger.debug("Import operation started: %s", result["name"])
+            with self._lock:
+                self._operations[result["name"]] = op
+        else:
+            logger.warning("Import returned no operation: %s", result)
+            self.record_failures(gcs_uris, attempt)
+
+    def record_failures(self, uris: list[str], attempt: int) -> None:
+        """Queue *uris* for another attempt, or give up after MAX_IMPORT_ATTEMPTS."""
+        with self._lock:
+            for uri in uris:
+                if attempt >= MAX_IMPORT_ATTEMPTS:
+                    self._failed[uri] = attempt
+                    self.failed += 1
+                else:
+                    self._retry[uri] = attempt
+
+    # ── Resolve ──────────────────────────────────────────────
+
+    def _failed_in(self, op: dict, result: dict) -> list[str]:
+        """URIs of *op* named by its error samples or error files."""
+        texts = [
+            str(sample)
+            for sample in result.get("response", {}).get("errorSamples", [])
+        ]
+        for key in list_blobs(self.bucket_name, op["errors"]):
+            texts.append(download_bytes(self.bucket_name, key).decode(errors="replace"))
+        text = "\n".join(texts)
+        return [uri for uri in op["uris"] if uri in text]
+
+    def _resolve(self, op: dict, result: dict) -> None:
+        uris = op["uris"]
+        if "error" in result:
+            logger.warning(
+                "Import of %d docs failed: %s",
+                len(uris),
+                result["error"].get("message"),
+            )
+            failed_uris = uris
+        else:
+            failure_count = int(result.get("metadata", {}).get("failureCount", 0))
+            failed_uris = self._failed_in(op, result) if failure_count else []
+            if len(failed_uris) < failure_count:
+                # Can't tell which ones failed; re-importing the rest is
+                # harmless (INCREMENTAL reconciliation)
+                failed_uris = uris
+        # Error files only matter until the failures are attributed
+        for key in list_blobs(self.bucket_name, op["errors"]):
+            delete_blob(self.bucket_name, key)
+
+        failed_set = set(failed_uris)
+        with self._lock:
+            for uri in uris:
+                if uri not in failed_set:
+                    self._failed.pop(uri, None)
+                    self.imported += 1
+        if failed_uris:
+            logger.warning("Import: %d of %d docs failed", len(failed_uris), len(uris))
+            self.record_failures(failed_uris, op["attempt"])
+
+    def _finished_operations(self, names: set[str]) -> dict[str, dict]:
+        """Fetch *names* (listing in bulk first); returns the finished ones."""
+        session = get_session()
+        headers = {"x-goog-user-project": config.GCP_PROJECT_ID}
+        found: dict[str, dict] = {}
+        params: dict[str, Any] = {"pageSize": 1000}
+        url = f"{_branch_url(config.VERTEX_SEARCH_DATASTORE_ID)}/operations"
+        for _ in range(MAX_LIST_PAGES):
+            resp = session.get(url, params=params, headers=headers, timeout=60)
+            resp.raise_for_status()
+            body = resp.json()
+            for operation in body.get("operations", []):
+                if operation.get("name") in names:
+                    found[operation["name"]] = operation
+            params["pageToken"] = body.get("nextPageToken")
+            if not params["pageToken"] or len(found) == len(names):
+                break
+        for name in names - found.keys():
+            resp = session.get(
+                f"{DISCOVERY_ENGINE_BASE}/{name}", headers=headers, timeout=60
+            )
+            if resp.status_code == 404:
+                # Expired before we saw it finish: import those docs again
+                found[name] = {"done": True, "error": {"message": "operation not found"}}
+                continue
+            resp.raise_for_status()
+            found[name] = resp.json()
+        return {name: op for name, op in found.items() if op.get("done")}
+
+    def poll(self) -> None:
+        """Resolve finished operations, then re-submit failed documents."""
+        with self._lock:
+            names = set(self._operations)
+        if names:
+            try:
+                finished = self._finished_operations(names)
+            except Exception as e:
+                logger.warning("Could not poll import operations: %s", e)
+                finished = {}
+            for name, result in finished.items():
+                with self._lock:
+                    op = self._operations.pop(name, None)
+                if op is not None:
+                    self._resolve(op, result)
+
+        with self._lock:
+            retry, self._retry = self._retry, {}
+        by_attempt: dict[int, list[str]] = {}
+        for uri, attempt in retry.items():
+            by_attempt.setdefault(attempt, []).append(uri)
+        for attempt, uris in by_attempt.items():
+            logger.info("Re-submitting %d failed docs (attempt %d)", len(uris), attempt + 1)
+            for start in range(0, len(uris), BATCH_SIZE):
+                self.submit(uris[start : start + BATCH_SIZE], attempt + 1)
+
+    def settle(self, timeout: float) -> None:
+        """Poll until nothing is pending or *timeout* seconds have passed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll()
+            remaining = deadline - time.monotonic()
+            if not self.pending or remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL_SECONDS, remaining))
 
 
 class DocImportBuffer:
     """
     Buffer for batching document imports to Vertex AI Search.
 
+    Full batches are handed to a background worker, so the sync loop never
+    waits on an import request; once MAX_PENDING_BATCHES are queued, add()
+    blocks until the worker catches up.  With a *tracker*, batches are
+    submitted through it and the counts are the tracker's.
+
     Usage:
         buffer = DocImportBuffer()
         buffer.add(gcs_uri)  # Adds to buffer
         buffer.add(gcs_uri)  # Adds to buffer
         ...
-        buffer.flush()  # Imports any remaining docs
+        buffer.get_stats()  # Imports any remaining docs, waits for the worker
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        tracker: Optional[ImportTracker] = None,
+        max_pending: int = MAX_PENDING_BATCHES,
+    ):
+        self.tracker = tracker
         self._uris: list[str] = []
+        self._queue: queue.Queue[Optional[list[str]]] = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
         self.total_success = 0
         self.total_failed = 0
 
     def add(self, gcs_uri: str) -> None:
-        """Add a doc URI to the buffer, flushing if batch is full."""
+        """Add a doc URI to the buffer, handing off the batch once it's full."""
         self._uris.append(gcs_uri)
         if len(self._uris) >= BATCH_SIZE:
             self.flush()
 
     def flush(self) -> None:
-        """Import all buffered docs and clear the buffer."""
+        """Queue all buffered docs for import and clear the buffer."""
         if not self._uris:
             return
-
-        logger.info("Importing batch of %d docs to Vertex AI Search...", len(self._uris))
-        success, failed = import_documents_batch(self._uris)
-        self.total_success += success
-        self.total_failed += failed
-        self._uris = []
-
-        if failed > 0:
-            logger.warning("Batch had %d failures", failed)
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name="doc-import", daemon=True
+            )
+            self._worker.start()
+        batch, self._uris = self._uris, []
+        self._queue.put(batch)  # blocks while the worker is behind
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            logger.info("Importing batch of %d docs to Vertex AI Search...", len(batch))
+            if self.tracker is not None:
+                try:
+                    self.tracker.submit(batch)
+                except Exception:
+                    # Keep the worker alive (add() would block on a full
+                    # queue); the ledger retries the batch later
+                    logger.exception("Doc import worker failed on a batch")
+                    self.tracker.record_failures(batch, 1)
+                continue
+            try:
+                success, failed = import_documents_batch(batch)
+            except Exception:
+                logger.exception("Doc import worker failed on a batch")
+                success, failed = 0, len(batch)
+            with self._lock:
+                self.total_success += success
+                self.total_failed += failed
+            if failed > 0:
+                logger.warning("Batch had %d failures", failed)
 
     def get_stats(self) -> tuple[int, int]:
-        """Returns (total_success, total_failed). Flushes any remaining first."""
+        """Returns (total_success, total_failed) once every batch is imported."""
         self.flush()
-        return self.total_success, self.total_failed
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        if self.tracker is not None:
+            return self.tracker.imported, self.tracker.failed
+        with self._lock:
+            return self.total_success, self.total_failed
+
+
+# ── Incremental JSONL import ─────────────────────────────────
+
+
+def doc_id(gcs_key: str) -> str:
+    """Stable document id for a stored doc object.
+
+    Per-file objects keep their file id (as import_docs_jsonl.py does);
+    shared dedup objects use their content hash.  An id that had to be
+    sanitized or truncated ends in a hash of the full key, so distinct
+    objects never collapse onto one id.  Dedup ids always do: the same
+    content stored with another extension has the same stem.
+    """
+    stem = os.path.splitext(gcs_key.rsplit("/", 1)[-1])[0]
+    shared = "/dedup/" in gcs_key
+    if shared:
+        stem = f"dedup-{stem}"
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", stem)
+    if safe == stem and len(safe) <= 63 and not shared:
+        return safe
+    digest = hashlib.sha1(gcs_key.encode()).hexdigest()[:10]
+    return f"{safe[:52]}-{digest}"
+
+
+class IncrementalImporter:
+    """
+    One JSONL import per run covering only new or changed docs.
+
+    The state store maps each imported object key to the content hash it
+    had; docs whose hash differs (or that are missing) are written to a
+    JSONL under mirror/state/doc_import/ and imported with one request.
+    The operation is kept in pending.json until it finishes, so a run that
+    times out resolves it next time; documents that failed stay out of the
+    state and are picked up again by the next diff.
+
+    Usage:
+        importer = IncrementalImporter(BUCKET)
+        importer.load()
+        importer.run(manifest.rows("docs"), timeout=120)
+        importer.imported, importer.failed, importer.pending
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        store_name: str = config.DOC_IMPORT_STATE_STORE,
+        prefix: str = config.DOC_IMPORT_JSONL_PREFIX,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.pending_key = f"{prefix}pending.json"
+        self.store = StateStore(bucket_name, store_name)
+        self.state = TrackedDict()  # object key → content hash imported
+        self._pending: dict = {}
+        # Counts for this run
+        self.imported = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending.get("entries", {}))
+
+    def load(self) -> None:
+        self.state = self.store.load()
+        self._pending = read_json(self.bucket_name, self.pending_key)
+
+    def run(self, rows: Iterable[ManifestRow], timeout: float) -> None:
+        """Resolve the previous import, then import what changed since."""
+        if self._pending and not self._wait(timeout):
+            logger.info("Doc import %s still running", self._pending["operation"])
+            return
+
+        entries: dict[str, str] = {}  # object key → content hash
+        for row in rows:
+            if row.gcs_key:
+                entries[row.gcs_key] = row.content_hash or row.rev
+        # Objects that are gone (deleted / moved to a shared key)
+        for key in [k for k in self.state if k not in entries]:
+            del self.state[key]
+        changed = {k: h for k, h in entries.items() if self.state.get(k) != h}
+        if not changed:
+            logger.info("Doc import: nothing changed since the last import")
+            self.store.checkpoint(self.state)
+            return
+        self._submit(changed)
+        self._wait(timeout)
+
+    def _submit(self, changed: dict[str, str]) -> None:
+        datastore_id = config.VERTEX_SEARCH_DATASTORE_ID
+        if not datastore_id:
+            logger.warning("VERTEX_SEARCH_DATASTORE_ID not set, skipping import")
+            self.failed += len(changed)
+            return
+
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        jsonl_key = f"{self.prefix}{stamp}.jsonl"
+        lines = [
+            json.dumps(
+                {
+                    "id": doc_id(key),
+                    "content": {
+                        "mimeType": mime_type(key),
+                        "uri": f"gs://{self.bucket_name}/{key}",
+                    },
+                }
+            )
+            for key in changed
+        ]
+        upload_bytes(
+            self.bucket_name,
+            jsonl_key,
+            "\n".join(lines).encode(),
+            content_type="application/x-ndjson",
+        )
+        errors = f"{self.prefix}errors/{stamp}/"
+        try:
+            result = _post_import(
+                datastore_id,
+                [f"gs://{self.bucket_name}/{jsonl_key}"],
+                timeout=120,
+                error_prefix=f"gs://{self.bucket_name}/{errors}",
+                data_schema="document",
+            )
+        except Exception as e:
+            logger.warning("Doc import of %d docs failed to start: %s", len(changed), e)
+            delete_blob(self.bucket_name, jsonl_key)
+            self.failed += len(changed)
+            return
+
+        self._pending = {
+            "operation": result.get("name", ""),
+            "jsonl": jsonl_key,
+            "errors": errors,
+            "entries": changed,
+        }
+        write_json(self.bucket_name, self.pending_key, self._pending)
+        logger.info(
+            "Doc import: %d new/changed docs in one operation (%s)",
+            len(changed),
+            result.get("name", ""),
+        )
+        if result.get("done"):
+            self._resolve(result)
+
+    def _wait(self, timeout: float) -> bool:
+        """Poll the pending operation for up to *timeout*; True once resolved."""
+        headers = {"x-goog-user-project": config.GCP_PROJECT_ID}
+        deadline = time.monotonic() + timeout
+        while self._pending:
+            try:
+                resp = get_session().get(
+                    f"{DISCOVERY_ENGINE_BASE}/{self._pending['operation']}",
+                    headers=headers,
+                    timeout=60,
+                )
+                if resp.status_code == 404:
+                    # Expired unseen: its docs are simply diffed again
+                    result = {"done": True, "error": {"message": "operation not found"}}
+                else:
+                    resp.raise_for_status()
+                    result = resp.json()
+            except Exception as e:
+                logger.warning("Could not poll doc import: %s", e)
+                result = {}
+            if result.get("done"):
+                self._resolve(result)
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+        return not self._pending
+
+    def _resolve(self, result: dict) -> None:
+        entries: dict[str, str] = self._pending["entries"]
+        if "error" in result:
+            logger.warning("Doc import failed: %s", result["error"].get("message"))
+            failed = set(entries)
+        else:
+            texts = [
+                str(sample)
+                for sample in result.get("response", {}).get("errorSamples", [])
+            ]
+            for key in list_blobs(self.bucket_name, self._pending["errors"]):
+                texts.append(
+                    download_bytes(self.bucket_name, key).decode(errors="replace")
+                )
+            text = "\n".join(texts)
+            failed = {
+                key
+                for key in entries
+                if f"/{key}" in text or f'"{doc_id(key)}"' in text
+            }
+            failure_count = int(result.get("metadata", {}).get("failureCount", 0))
+            if len(failed) < failure_count:
+                # Can't tell which ones failed; the next diff retries them all
+                failed = set(entries)
+
+        for key, content_hash in entries.items():
+            if key not in failed:
+                self.state[key] = content_hash
+        self.imported += len(entries) - len(failed)
+        self.failed += len(failed)
+        if failed:
+            logger.warning(
+                "Doc import: %d of %d docs failed (retried next run)",
+                len(failed),
+                len(entries),
+            )
+        self.store.checkpoint(self.state)
+        for key in list_blobs(self.bucket_name, self._pending["errors"]):
+            delete_blob(self.bucket_name, key)
+        delete_blob(self.bucket_name, self._pending["jsonl"])
+        delete_blob(self.bucket_name, self.pending_key)
+        self._pending = {}
@@ -4,14 +4,25 @@ Disk-based streaming ZIP extraction for large archives (5–10 GB+).
 Extracts one file at a time to keep memory usage constant.
 Caller is responsible for deleting each yielded file's local_path
 after upload to free disk space.
+
+With a ``ScratchBudget``, extraction runs ahead of the uploads only as far
+as the budget allows: each member's size is acquired before it is written
+and released by whoever deletes the file.
+
+Members that nothing needs on disk can skip the scratch copy entirely:
+open them with ``zf.open(info)`` and wrap the reader in a ``HashingReader``
+to stream them into an upload while computing their content hash.
 """
 
 import os
+import threading
 import zipfile
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterator
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from shared.content_hash import DropboxContentHasher
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +35,38 @@ MAX_INNER_FILE_SIZE = 1 * 1024 * 1024 * 1024
 _READ_BUF = 8 * 1024 * 1024
 
 
+class ScratchBudget:
+    """
+    Bytes of scratch disk that extracted members may occupy at once.
+
+    A member larger than the whole budget is let through once nothing
+    else is held, so extraction never stalls on it.
+
+    Usage:
+        budget = ScratchBudget(1024**3)
+        budget.acquire(size)   # blocks until it fits
+        ...
+        budget.release(size)   # after the file is deleted
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._used == 0 or self._used + size <= self.limit
+            )
+            self._used += size
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self._used -= size
+            self._cond.notify_all()
+
+
 @dataclass
 class ExtractedFile:
     """Represents a single file extracted from a ZIP archive."""
@@ -31,18 +74,77 @@ class ExtractedFile:
     original_zip_path: str  # Dropbox path of the ZIP
     inner_path: str  # path inside the ZIP
     filename: str  # just the filename
-    local_path: Path  # temp file on disk — caller must delete
+    local_path: Optional[Path]  # temp file on disk — caller must delete (None if streamed)
     size: int  # file size in bytes
+    content_hash: str = ""  # Dropbox-style content hash of the bytes
+    crc: int = 0  # CRC-32 from the central directory
+    header_offset: int = 0  # offset of the member's local header
+
+
+class HashingReader:
+    """Read-only file-like wrapper that content-hashes what is read through it."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+        self._hasher = DropboxContentHasher()
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        self._hasher.update(chunk)
+        self._pos += len(chunk)
+        return chunk
+
+    def tell(self) -> int:
+        return self._pos
+
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+def extractable_members(
+    zf: zipfile.ZipFile, zip_dropbox_path: str
+) -> list[zipfile.ZipInfo]:
+    """Members worth mirroring: no directories, macOS metadata, dotfiles
+    or files over MAX_INNER_FILE_SIZE."""
+    entries = []
+    for info in zf.infolist():
+        basename = info.filename.rsplit("/", 1)[-1]
+        if (
+            info.is_dir()
+            or info.filename.startswith("__MACOSX")
+            or basename.startswith(".")
+        ):
+            continue
+        if info.file_size > MAX_INNER_FILE_SIZE:
+            logger.warning(
+                "Skipping oversized file in ZIP: %s (%.1f GB)",
+                info.filename,
+                info.file_size / (1024**3),
+            )
+            continue
+        entries.append(info)
+    logger.info(
+        "ZIP %s contains %d extractable files",
+        zip_dropbox_path,
+        len(entries),
+    )
+    return entries
 
 
 def extract_zip_streaming(
     zip_path: Path,
     zip_dropbox_path: str,
+    budget: Optional[ScratchBudget] = None,
+    wanted: Optional[Callable[[zipfile.ZipInfo], bool]] = None,
 ) -> Iterator[ExtractedFile]:
     """Yield one ExtractedFile at a time from a ZIP on disk.
 
+    With *wanted*, only members it returns True for are extracted.
+
     Each yielded file exists at ``local_path``.  The caller is responsible
-    for deleting it after upload to free disk space.
+    for deleting it after upload to free disk space (and for releasing
+    its ``size`` from *budget*, if one was given).
 
     Memory usage is constant regardless of ZIP size.
     """
@@ -51,34 +153,17 @@ def extract_zip_streaming(
 
     try:
         with zipfile.ZipFile(zip_path) as zf:
-            entries = [
-                info
-                for info in zf.infolist()
-                if not info.is_dir()
-                and not info.filename.startswith("__MACOSX")
-                and not info.filename.rsplit("/", 1)[-1].startswith(".")
-            ]
-            logger.info(
-                "ZIP %s contains %d extractable files (archive: %.2f GB)",
-                zip_dropbox_path,
-                len(entries),
-                zip_path.stat().st_size / (1024**3),
-            )
-
-            for info in entries:
-                basename = info.filename.rsplit("/", 1)[-1]
-
-                if info.file_size > MAX_INNER_FILE_SIZE:
-                    logger.warning(
-                        "Skipping oversized file in ZIP: %s (%.1f GB)",
-                        info.filename,
-                        info.file_size / (1024**3),
-                    )
+            for info in extractable_members(zf, zip_dropbox_path):
+                if wanted is not None and not wanted(info):
                     continue
+                basename = info.filename.rsplit("/", 1)[-1]
 
                 # Extract single file to disk with a safe name
                 safe_name = info.filename.replace("/", "_")
                 out_path = extract_dir / safe_name
+                hasher = DropboxContentHasher()
+                if budget is not None:
+                    budget.acquire(info.file_size)
                 try:
                     with zf.open(info) as src, open(out_path, "wb") as dst:
                         while True:
@@ -86,6 +171,7 @@ def extract_zip_streaming(
                             if not chunk:
                                 break
                             dst.write(chunk)
+                            hasher.update(chunk)
 
                     yield ExtractedFile(
                         original_zip_path=zip_dropbox_path,
@@ -93,6 +179,9 @@ def extract_zip_streaming(
                         filename=basename,
                         local_path=out_path,
                         size=info.file_size,
+                        content_hash=hasher.hexdigest(),
+                        crc=info.CRC,
+                        header_offset=info.header_offset,
                     )
                 except Exception:
                     logger.exception(
@@ -103,6 +192,8 @@ def extract_zip_streaming(
                     # Clean up partial file
                     if out_path.exists():
                         out_path.unlink(missing_ok=True)
+                    if budget is not None:
+                        budget.release(info.file_size)
 
     except zipfile.BadZipFile:
         logger.warning("Corrupt or invalid ZIP: %s", zip_dropbox_path)
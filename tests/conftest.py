@@ -0,0 +1,225 @@
+"""
+Shared fixtures: repo on sys.path, dummy config, a local Range server and
+an in-memory stand-in for the GCS client behind shared/gcs.py.
+"""
+
+import hashlib
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# shared.config requires these at import time; no test talks to GCP or Dropbox
+for _name in (
+    "GCP_PROJECT_ID",
+    "GCS_BUCKET_NAME",
+    "DROPBOX_APP_KEY",
+    "DROPBOX_APP_SECRET",
+    "DROPBOX_REFRESH_TOKEN",
+):
+    os.environ.setdefault(_name, "test")
+
+
+class RangeServer:
+    """
+    Serves ``body`` at ``url`` with HEAD and single-range GET support.
+
+    Usage:
+        server.body = data
+        server.honour_range = False          # answer 200 with the whole body
+        server.tamper = lambda start, end, chunk: chunk[:10]   # per request
+        server.ranges                        # [(start, end)] requested
+    """
+
+    def __init__(self) -> None:
+        self.body = b""
+        self.honour_range = True
+        self.tamper = None
+        self.ranges: list[tuple[int, int]] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}/file"
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_HEAD(self) -> None:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(server.body)))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                body = server.body
+                match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+                if not match or not server.honour_range:
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                start, end = int(match[1]), min(int(match[2]) + 1, len(body))
+                with server._lock:
+                    server.ranges.append((start, end))
+                chunk = body[start:end]
+                if server.tamper is not None:
+                    chunk = server.tamper(start, end, chunk)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(body)}")
+                self.send_header("Content-Length", str(len(chunk)))
+                self.end_headers()
+                self.wfile.write(chunk)
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def range_server():
+    server = RangeServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+class FakeBlob:
+    """The parts of ``storage.Blob`` that shared/gcs.py uses."""
+
+    def __init__(self, gcs: "FakeGCS", name: str) -> None:
+        self._gcs = gcs
+        self.name = name
+
+    def _stored(self) -> tuple[bytes, int]:
+        try:
+            return self._gcs.objects[self.name]
+        except KeyError:
+            raise NotFound(self.name) from None
+
+    @property
+    def generation(self) -> int:
+        return self._gcs.objects.get(self.name, (b"", 0))[1]
+
+    @property
+    def size(self) -> int:
+        return len(self._stored()[0])
+
+    @property
+    def md5_hash(self) -> str:
+        return hashlib.md5(self._stored()[0]).hexdigest()
+
+    crc32c = ""
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        if isinstance(data, str):
+            data = data.encode()
+        self._gcs.put(self.name, data, if_generation_match)
+
+    def upload_from_file(self, stream, size=None, content_type=None, timeout=None):
+        self._gcs.put(self.name, stream.read(size))
+
+    def upload_from_filename(self, filename, content_type=None, timeout=None):
+        with open(filename, "rb") as f:
+            self._gcs.put(self.name, f.read())
+
+    def download_as_bytes(self, start=None, end=None):
+        data = self._stored()[0]
+        if start is not None:
+            return data[start : None if end is None else end + 1]
+        return data
+
+    def delete(self):
+        self._gcs.delete(self.name)
+
+    def exists(self):
+        return self.name in self._gcs.objects
+
+
+class FakeGCS:
+    """
+    One in-memory bucket standing in for the storage client.
+
+    Usage:
+        gcs.objects[key]          # (bytes, generation)
+        gcs.data(key)             # bytes, or None if absent
+        gcs.uploads               # keys written, in order
+        gcs.failures[key] = exc   # raised by deletes of key
+    """
+
+    name = "test-bucket"
+
+    def __init__(self) -> None:
+        self.objects: dict[str, tuple[bytes, int]] = {}
+        self.uploads: list[str] = []
+        self.failures: dict[str, Exception] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def data(self, key: str):
+        item = self.objects.get(key)
+        return item[0] if item else None
+
+    def put(self, key: str, data: bytes, if_generation_match=None) -> None:
+        with self._lock:
+            current = self.objects.get(key, (b"", 0))[1]
+            if if_generation_match is not None and current != if_generation_match:
+                raise PreconditionFailed(key)
+            self._generation += 1
+            self.objects[key] = (bytes(data), self._generation)
+            self.uploads.append(key)
+
+    def delete(self, key: str) -> None:
+        if key in self.failures:
+            raise self.failures[key]
+        with self._lock:
+            if self.objects.pop(key, None) is None:
+                raise NotFound(key)
+
+    # ── storage.Client / storage.Bucket ──────────────────────
+
+    def bucket(self, name: str) -> "FakeGCS":
+        return self
+
+    def blob(self, name: str, chunk_size=None) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str):
+        return FakeBlob(self, name) if name in self.objects else None
+
+    def copy_blob(self, blob: FakeBlob, bucket, new_name: str) -> FakeBlob:
+        self.put(new_name, blob.download_as_bytes())
+        return FakeBlob(self, new_name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = "", fields=None):
+        return [FakeBlob(self, k) for k in sorted(self.objects) if k.startswith(prefix)]
+
+    @contextmanager
+    def batch(self, raise_exception=True):
+        yield self
+
+
+@pytest.fixture
+def gcs(monkeypatch):
+    from shared import gcs as gcs_module
+
+    fake = FakeGCS()
+    monkeypatch.setattr(gcs_module, "_get_client", lambda: fake)
+    return fake
@@ -0,0 +1,71 @@
+from shared.dedup import HashIndex, dedup_key, shared_object_key
+from shared.state_store import TrackedDict
+
+DKEY = dedup_key("images", "abc123", "")
+OWNER_KEY = "mirror/images/F1"
+
+
+def _shared_by(*file_ids: str) -> HashIndex:
+    hashes = HashIndex(TrackedDict())
+    for fid in file_ids:
+        hashes.add_ref(DKEY, f"mirror/images/{fid}", fid)  # key of the first wins
+    return hashes
+
+
+def test_dedup_onto_an_existing_entry_keeps_its_object():
+    hashes = _shared_by("F1", "F2", "F3")
+    assert hashes.object_for(DKEY) == OWNER_KEY
+    assert hashes.refs(DKEY) == ["F1", "F2", "F3"]
+    assert {hashes.dedup_key_of(fid) for fid in ("F1", "F2", "F3")} == {DKEY}
+    assert hashes.dedup_key_of_object(OWNER_KEY) == DKEY
+    assert hashes.dedup_key_of_object("mirror/images/F2") is None
+
+
+def test_releasing_the_owner_keeps_the_object_for_the_others():
+    hashes = _shared_by("F1", "F2")
+    assert hashes.release("F1") is None
+    assert hashes.object_for(DKEY) == OWNER_KEY
+    assert hashes.refs(DKEY) == ["F2"]
+    assert hashes.dedup_key_of("F1") is None
+
+    # The last reference orphans the object
+    assert hashes.release("F2") == OWNER_KEY
+    assert hashes.object_for(DKEY) is None
+    assert hashes.dedup_key_of_object(OWNER_KEY) is None
+    assert len(hashes) == 0
+    assert hashes.release("F2") is None  # untracked
+
+
+def test_move_to_shared_key_before_the_owner_is_overwritten():
+    entries = TrackedDict()
+    hashes = HashIndex(entries)
+    for fid in ("F1", "F2"):
+        hashes.add_ref(DKEY, OWNER_KEY, fid)
+    entries.dirty.clear()
+
+    shared = shared_object_key(DKEY)
+    assert shared == "mirror/images/dedup/abc123"
+    hashes.move_object(DKEY, shared)
+    assert hashes.release("F1") is None
+    assert hashes.object_for(DKEY) == shared
+    assert hashes.dedup_key_of_object(shared) == DKEY
+    assert hashes.dedup_key_of_object(OWNER_KEY) is None  # free to overwrite
+    assert entries.dirty == {DKEY}
+    assert dict(entries) == {DKEY: {"key": shared, "refs": ["F2"]}}
+
+    # Reloading the entries rebuilds the reverse lookups
+    reloaded = HashIndex(dict(entries))
+    assert reloaded.dedup_key_of("F2") == DKEY
+    assert reloaded.dedup_key_of_object(shared) == DKEY
+
+
+def test_sole_owner_released_before_overwrite_is_not_deduped_onto():
+    # F1 is edited; its old content must not be found at its key while the
+    # new bytes are in flight, or B would be served F1's new content
+    hashes = _shared_by("F1")
+    assert hashes.release("F1") == OWNER_KEY
+    assert hashes.object_for(DKEY) is None
+
+    hashes.add_ref(DKEY, "mirror/images/B", "B")  # B uploads its own copy
+    assert hashes.object_for(DKEY) == "mirror/images/B"
+    assert hashes.dedup_key_of_object(OWNER_KEY) is None
@@ -0,0 +1,121 @@
+import json
+import random
+
+import pytest
+
+from shared import dropbox_download
+from shared.content_hash import DropboxContentHasher
+from shared.dropbox_download import download_url
+
+SEGMENT = 16 * 1024
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dropbox_download, "RETRY_BACKOFF_SECONDS", 0)
+
+
+@pytest.fixture
+def body(range_server):
+    data = random.Random(0).randbytes(6 * SEGMENT + 123)
+    range_server.body = data
+    return data
+
+
+def _hash(data: bytes) -> str:
+    hasher = DropboxContentHasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _sidecar(path):
+    return path.with_name(path.name + ".segments.json")
+
+
+def test_download_verifies_hash(range_server, body, tmp_path):
+    target = tmp_path / "big.bin"
+    fetched = download_url(
+        range_server.url, target, len(body), _hash(body), workers=3, segment_size=SEGMENT
+    )
+    assert fetched == len(body)
+    assert target.read_bytes() == body
+    assert not _sidecar(target).exists()
+    assert len(range_server.ranges) == 7
+
+
+def test_failed_segment_is_retried_alone(range_server, body, tmp_path):
+    failures = []
+
+    def fail_once(start, end, chunk):
+        if start == 2 * SEGMENT and not failures:
+            failures.append(start)
+            return chunk[:100]  # connection cut mid-segment
+        return chunk
+
+    range_server.tamper = fail_once
+    target = tmp_path / "big.bin"
+    download_url(range_server.url, target, len(body), _hash(body), segment_size=SEGMENT)
+    assert target.read_bytes() == body
+    starts = [start for start, _ in range_server.ranges]
+    assert starts.count(2 * SEGMENT) == 2
+    assert len(starts) == 8
+
+
+def test_interrupted_download_resumes_from_sidecar(
+    range_server, body, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(dropbox_download, "SEGMENT_ATTEMPTS", 1)
+    range_server.tamper = lambda start, end, chunk: (
+        chunk[:100] if start == 2 * SEGMENT else chunk
+    )
+    target = tmp_path / "big.bin"
+    content_hash = _hash(body)
+    with pytest.raises(IOError, match="Segment 2"):
+        download_url(
+            range_server.url, target, len(body), content_hash, workers=1, segment_size=SEGMENT
+        )
+    done = json.loads(_sidecar(target).read_text())["done"]
+    assert {0, 1} <= set(done) and 2 not in done  # later ones may have finished
+    assert target.stat().st_size == len(body)
+
+    range_server.tamper = None
+    range_server.ranges.clear()
+    fetched = download_url(
+        range_server.url, target, len(body), content_hash, workers=2, segment_size=SEGMENT
+    )
+    missing = [i for i in range(7) if i not in done]
+    assert sorted(start // SEGMENT for start, _ in range_server.ranges) == missing
+    assert fetched == sum(len(body[i * SEGMENT : (i + 1) * SEGMENT]) for i in missing)
+    assert target.read_bytes() == body
+    assert not _sidecar(target).exists()
+
+
+def test_sidecar_for_other_content_is_ignored(range_server, body, tmp_path):
+    target = tmp_path / "big.bin"
+    target.write_bytes(b"\0" * len(body))
+    _sidecar(target).write_text(
+        json.dumps(
+            {
+                "size": len(body),
+                "segment_size": SEGMENT,
+                "content_hash": "older-revision",
+                "done": [0, 1, 2],
+            }
+        )
+    )
+    download_url(range_server.url, target, len(body), _hash(body), segment_size=SEGMENT)
+    assert target.read_bytes() == body
+    assert len(range_server.ranges) == 7
+
+
+def test_corrupted_segment_is_rejected(range_server, body, tmp_path):
+    range_server.tamper = lambda start, end, chunk: (
+        bytes(b ^ 0xFF for b in chunk) if start == 3 * SEGMENT else chunk
+    )
+    target = tmp_path / "big.bin"
+    with pytest.raises(IOError, match="Content hash mismatch"):
+        download_url(
+            range_server.url, target, len(body), _hash(body), segment_size=SEGMENT
+        )
+    assert not target.exists()
+    assert not _sidecar(target).exists()
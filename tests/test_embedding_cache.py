@@ -0,0 +1,63 @@
+import hashlib
+
+import pytest
+
+from shared import embedding_cache
+from shared.embedding_cache import EmbeddingCache
+
+BUCKET = "test-bucket"
+MODEL = "multimodalembedding@001"
+
+
+def _hash(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def _vector(i: int, dim: int = 8) -> list[float]:
+    return [float(i + j / 8) for j in range(dim)]  # exact in float32
+
+
+def _cache(tmp_path, name: str = "disk") -> EmbeddingCache:
+    return EmbeddingCache(BUCKET, MODEL, 8, local_dir=str(tmp_path / name)).load()
+
+
+def test_round_trip_through_a_fresh_disk(gcs, tmp_path):
+    cache = _cache(tmp_path)
+    for i in range(5):
+        cache.put(_hash(i), _vector(i))
+    assert cache.get(_hash(3)) == _vector(3)  # pending, before flush
+    cache.flush()
+    cache.flush()  # nothing pending: no segment
+    assert len([k for k in gcs.objects if k.endswith(".bin")]) == 1
+
+    # Another machine range-reads the digests, then fetches the segment once
+    other = _cache(tmp_path, "other")
+    assert len(other) == 5
+    assert [other.get(_hash(i)) for i in range(5)] == [_vector(i) for i in range(5)]
+    assert other.get(_hash(99)) is None
+    assert (other.hits, other.misses) == (5, 1)
+
+
+def test_put_of_a_cached_hash_keeps_the_stored_vector(gcs, tmp_path):
+    cache = _cache(tmp_path)
+    cache.put(_hash(1), _vector(1))
+    cache.flush()
+    cache.put(_hash(1), _vector(2))
+    cache.flush()
+    assert len(_cache(tmp_path, "other")) == 1
+    assert _cache(tmp_path, "other").get(_hash(1)) == _vector(1)
+    with pytest.raises(ValueError):
+        cache.put(_hash(2), [0.0] * 3)
+
+
+def test_small_segments_are_merged(gcs, tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "MAX_SMALL_SEGMENTS", 2)
+    cache = _cache(tmp_path)
+    for i in range(3):
+        cache.put(_hash(i), _vector(i))
+        cache.flush()
+
+    segments = sorted(k for k in gcs.objects if k.endswith(".bin"))
+    assert len(segments) == 1  # three flushes, then merged into one
+    other = _cache(tmp_path, "other")
+    assert [other.get(_hash(i)) for i in range(3)] == [_vector(i) for i in range(3)]
@@ -0,0 +1,39 @@
+from google.api_core.exceptions import Forbidden
+
+from shared import gcs as gcs_module
+from shared.gcs import BlobCatalog, delete_blobs
+
+BUCKET = "test-bucket"
+
+
+def test_delete_blobs_in_batches(gcs, monkeypatch):
+    batches = []
+    batch = gcs.batch
+    monkeypatch.setattr(gcs, "batch", lambda: batches.append(1) or batch())
+    keys = [f"mirror/images/F{i:04d}" for i in range(250)]
+    for key in keys:
+        gcs.put(key, b"x")
+    delete_blobs(BUCKET, keys)
+    assert not gcs.objects
+    assert len(batches) == 3  # 100 + 100 + 50
+
+
+def test_delete_blobs_sorts_out_failures_per_blob(gcs):
+    for key in ("a", "c", "d"):
+        gcs.put(key, b"x")
+    gcs.failures["c"] = Forbidden("c")
+    catalog = BlobCatalog(BUCKET).load("")
+    delete_blobs(BUCKET, ["a", "b", "c", "d"])  # b is missing, c can't go
+
+    assert set(gcs.objects) == {"c"}
+    assert not catalog.exists("a") and not catalog.exists("d")
+    assert catalog.exists("c")  # re-checked with GCS, not assumed deleted
+
+
+def test_catalog_skips_known_missing(gcs, monkeypatch):
+    gcs.put("mirror/images/A", b"x")
+    catalog = BlobCatalog(BUCKET).load("mirror/images/")
+    deleted = []
+    monkeypatch.setattr(gcs_module, "delete_blobs", lambda b, keys: deleted.extend(keys))
+    catalog.delete_many(["mirror/images/A", "mirror/images/B", "mirror/images/A"])
+    assert deleted == ["mirror/images/A"]
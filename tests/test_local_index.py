@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from shared.local_index import LocalIndex, export_index, read_index_meta
+
+BUCKET = "test-bucket"
+MODEL = "multimodalembedding@001"
+DIM = 32
+
+
+def _vectors(n: int) -> np.ndarray:
+    rows = np.random.default_rng(1).normal(size=(n, DIM)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _export(vectors: np.ndarray, dtype: str, nlist=None) -> int:
+    items = ((f"F{i}", row.tolist()) for i, row in enumerate(vectors))
+    return export_index(
+        BUCKET, MODEL, DIM, items, len(vectors), dtype=dtype, nlist=nlist
+    )
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+@pytest.mark.parametrize("nlist", [None, 4])
+def test_search_returns_the_exact_nearest_neighbour(gcs, tmp_path, dtype, nlist):
+    vectors = _vectors(300)
+    assert _export(vectors, dtype, nlist) == 300
+    meta = read_index_meta(BUCKET, MODEL, DIM)
+    assert (meta["dtype"], meta["count"], meta["nlist"]) == (dtype, 300, nlist or 0)
+
+    index = LocalIndex.fetch(BUCKET, MODEL, DIM, local_dir=str(tmp_path))
+    assert len(index) == 300
+    noise = np.random.default_rng(2).normal(scale=0.01, size=DIM)
+    for i in (0, 17, 299):
+        hits = index.search((vectors[i] + noise).tolist(), k=5, nprobe=4)
+        assert len(hits) == 5
+        assert hits[0][0] == f"F{i}"
+        exact = float(vectors[i] @ (vectors[i] + noise))
+        assert hits[0][1] == pytest.approx(exact, abs=0.02)
+        assert [score for _, score in hits] == sorted((s for _, s in hits), reverse=True)
+
+
+def test_ivf_probe_of_one_list_finds_a_stored_vector(gcs, tmp_path):
+    vectors = _vectors(300)
+    _export(vectors, "float16", nlist=8)
+    index = LocalIndex.fetch(BUCKET, MODEL, DIM, local_dir=str(tmp_path))
+    for i in range(0, 300, 37):
+        assert index.search(vectors[i].tolist(), k=1, nprobe=1)[0][0] == f"F{i}"
+
+
+def test_new_export_replaces_the_old_version(gcs, tmp_path, monkeypatch):
+    _export(_vectors(10), "float16")
+    old = read_index_meta(BUCKET, MODEL, DIM)["version"]
+    monkeypatch.setattr("shared.local_index.time.strftime", lambda *args: "next")
+    _export(_vectors(20), "int8")
+    assert not [k for k in gcs.objects if f"/v{old}/" in k]
+    assert len(LocalIndex.fetch(BUCKET, MODEL, DIM, local_dir=str(tmp_path))) == 20
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_empty_index(gcs, tmp_path, dtype):
+    assert _export(np.empty((0, DIM), dtype=np.float32), dtype) == 0
+    index = LocalIndex.fetch(BUCKET, MODEL, DIM, local_dir=str(tmp_path))
+    assert len(index) == 0
+    assert index.search([1.0] * DIM, k=3) == []
+
+
+def test_fetch_without_an_export(gcs, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LocalIndex.fetch(BUCKET, MODEL, DIM, local_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        _export(_vectors(1), "float32")
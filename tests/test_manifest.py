@@ -0,0 +1,92 @@
+from shared import manifest as manifest_module
+from shared.manifest import Manifest, ManifestRow
+
+BUCKET = "test-bucket"
+
+
+def _row(file_id: str, rev: str = "r1") -> ManifestRow:
+    return ManifestRow(file_id, "images", rev, 1, f"mirror/images/{file_id}", "h")
+
+
+def _saved(gcs, *rows: ManifestRow) -> Manifest:
+    manifest = Manifest(BUCKET)
+    manifest.mark_all_dirty()
+    for row in rows:
+        manifest.upsert(row)
+    manifest.save()
+    return manifest
+
+
+def _deltas(gcs) -> list[str]:
+    return [k for k in gcs.objects if "/delta-" in k]
+
+
+def test_checkpoint_writes_only_changed_rows(gcs):
+    manifest = _saved(gcs, *(_row(f"F{i:03d}") for i in range(100)))
+    gcs.uploads.clear()
+
+    manifest.upsert(_row("F001", "r2"))
+    manifest.remove("F002")
+    manifest.upsert(_row("NEW"))
+    manifest.checkpoint()
+    assert gcs.uploads == _deltas(gcs)  # one delta segment, no shard
+    manifest.checkpoint()  # nothing changed since
+    assert len(gcs.uploads) == 1
+
+    loaded = Manifest(BUCKET).load()
+    assert loaded.get("F001").rev == "r2"
+    assert "F002" not in loaded
+    assert loaded.get("NEW") is not None
+    assert len(loaded) == 100
+
+
+def test_save_folds_deltas_into_shards(gcs):
+    manifest = _saved(gcs, _row("A"), _row("B"))
+    manifest.upsert(_row("A", "r2"))
+    manifest.checkpoint()
+    manifest.remove("B")
+    manifest.checkpoint()
+    assert len(_deltas(gcs)) == 2
+
+    manifest.save()
+    assert not _deltas(gcs)
+    loaded = Manifest(BUCKET).load()
+    assert [(row.file_id, row.rev) for row in loaded.rows()] == [("A", "r2")]
+
+
+def test_reader_folds_deltas_on_its_next_save(gcs):
+    manifest = _saved(gcs, _row("A"))
+    manifest.upsert(_row("A", "r2"))
+    manifest.checkpoint()
+
+    # A later run loads the delta and writes it into the shards itself
+    later = Manifest(BUCKET).load()
+    later.save()
+    assert not _deltas(gcs)
+    assert Manifest(BUCKET).load().get("A").rev == "r2"
+
+
+def test_delta_left_by_an_interrupted_save_is_not_replayed(gcs, monkeypatch):
+    manifest = _saved(gcs, _row("A"))
+    manifest.upsert(_row("A", "r2"))
+    manifest.checkpoint()
+    manifest.upsert(_row("A", "r3"))  # newer than the delta
+
+    # Shards written, crash before the deltas are deleted
+    monkeypatch.setattr(manifest_module, "delete_blobs", lambda bucket, keys: None)
+    manifest.save()
+    assert _deltas(gcs)
+    assert Manifest(BUCKET).load().get("A").rev == "r3"
+
+
+def test_too_many_deltas_rewrite_the_shards(gcs, monkeypatch):
+    monkeypatch.setattr(manifest_module, "MAX_DELTAS", 3)
+    manifest = _saved(gcs, _row("A"))
+    for i in range(4):
+        manifest.upsert(_row("A", f"r{i + 2}"))
+        manifest.checkpoint()
+    assert len(_deltas(gcs)) == 0
+    manifest.upsert(_row("A", "r9"))
+    manifest.checkpoint()
+    assert len(_deltas(gcs)) == 1
+    assert Manifest(BUCKET).load().get("A").rev == "r9"
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from shared import path_index as path_index_module
+from shared.path_index import BLOCK_SIZE, PathIndex
+
+
+def _paths(n: int) -> dict[str, str]:
+    return {
+        f"/photos/{y}/album-{i % 7}/img_{i:05d}.jpg": f"id:{i}"
+        for i, y in ((i, 2000 + i % 5) for i in range(n))
+    }
+
+
+def _check(index: PathIndex, expected: dict[str, str]) -> None:
+    assert len(index) == len(expected)
+    assert list(index.items()) == sorted(expected.items())
+    for key, value in expected.items():
+        assert index[key] == value
+    assert "/photos/missing.jpg" not in index
+
+
+def test_round_trip_across_blocks():
+    expected = _paths(BLOCK_SIZE * 5 + 3)
+    index = PathIndex(expected)
+    _check(index, expected)
+    _check(PathIndex.from_compact(index.to_compact()), expected)
+
+
+def test_prefix_queries_cover_base_and_overlay():
+    expected = _paths(BLOCK_SIZE * 4)
+    index = PathIndex(expected)
+    index["/photos/2003/album.zip!/x.jpg"] = "id:zx"
+    index["/photos/2003/album.zip!/y.jpg"] = "id:zy"
+    del index["/photos/2003/album-1/img_00008.jpg"]
+    expected.pop("/photos/2003/album-1/img_00008.jpg")
+    expected["/photos/2003/album.zip!/x.jpg"] = "id:zx"
+    expected["/photos/2003/album.zip!/y.jpg"] = "id:zy"
+
+    prefixes = ("/photos/2003/", "/photos/2003/album-1/", "/photos/2003/album.zip!/", "/no/", "")
+    for prefix in prefixes:
+        assert index.with_prefix(prefix) == sorted(
+            (k, v) for k, v in expected.items() if k.startswith(prefix)
+        )
+
+
+def test_random_edits_match_a_dict_through_merges(monkeypatch):
+    monkeypatch.setattr(path_index_module, "MIN_MERGE", 20)
+    rng = random.Random(7)
+    expected = _paths(300)
+    index = PathIndex(expected)
+    keys = list(expected) + [f"/new/{i:04d}.jpg" for i in range(200)]
+    for step in range(2000):
+        key = rng.choice(keys)
+        if rng.random() < 0.4:
+            assert index.pop(key, None) == expected.pop(key, None)
+        else:
+            index[key] = expected[key] = f"v{step}"
+    _check(index, expected)
+    assert index._base_len  # the overlay was merged into the base on the way
+    _check(PathIndex.from_compact(index.to_compact()), expected)
+
+
+def test_edits_mark_keys_dirty_but_replay_does_not():
+    index = PathIndex()
+    index.replay({"set": _paths(10), "del": []})
+    assert not index.dirty
+    key = next(iter(_paths(1)))
+    index.replay({"set": {}, "del": [key]})
+    assert key not in index and not index.dirty
+
+    index["/a.jpg"] = "id:a"
+    index.pop("/photos/2001/album-1/img_00001.jpg")
+    assert index.dirty == {"/a.jpg", "/photos/2001/album-1/img_00001.jpg"}
+    with pytest.raises(KeyError):
+        del index["/missing.jpg"]
+
+
+def test_from_compact_rejects_other_data():
+    with pytest.raises(ValueError):
+        PathIndex.from_compact(b"{}")
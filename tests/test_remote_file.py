@@ -0,0 +1,88 @@
+import io
+import random
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared.remote_file import COALESCE_GAP, RemoteFile, coalesce, member_ranges
+
+MEMBER_SIZE = 16 * 1024
+
+
+def _zip(count: int) -> tuple[bytes, dict[str, bytes]]:
+    rng = random.Random(0)
+    members = {f"dir/m{i:03d}.bin": rng.randbytes(MEMBER_SIZE) for i in range(count)}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue(), members
+
+
+def test_coalesce_merges_within_gap():
+    far = 601 + COALESCE_GAP
+    ranges = [(500, 600), (0, 100), (far, far + 20), (90, 200)]
+    assert coalesce(ranges) == [(0, 600), (far, far + 20)]
+    assert coalesce(ranges, gap=0) == [(0, 200), (500, 600), (far, far + 20)]
+
+
+def test_read_and_seek(range_server):
+    range_server.body = bytes(range(256)) * 4096
+    remote = RemoteFile(range_server.url)  # size from HEAD
+    assert remote.size == len(range_server.body)
+
+    assert remote.seek(1000) == 1000
+    assert remote.read(10) == range_server.body[1000:1010]
+    assert remote.tell() == 1010
+    remote.seek(-10, io.SEEK_CUR)
+    assert remote.read(10) == range_server.body[1000:1010]
+    assert remote.requests == 1  # second read served from the cached window
+
+    remote.seek(-5, io.SEEK_END)
+    assert remote.read() == range_server.body[-5:]
+    assert remote.read(1) == b""
+
+    buffer = bytearray(4)
+    remote.seek(7)
+    assert remote.readinto(buffer) == 4
+    assert bytes(buffer) == range_server.body[7:11]
+
+
+def test_planned_members_are_coalesced(range_server):
+    range_server.body, members = _zip(40)
+    remote = RemoteFile(range_server.url, len(range_server.body))
+    with zipfile.ZipFile(remote) as zf:
+        infos = zf.infolist()
+        wanted = [infos[5], infos[6], infos[7], infos[30]]
+        ranges = member_ranges(zf, wanted)
+        assert ranges[0][1] == infos[6].header_offset
+        remote.plan(ranges)
+        assert len(remote._spans) == 2
+
+        remote.requests = remote.bytes_fetched = 0
+        for info in wanted:
+            assert zf.read(info) == members[info.filename]
+    assert remote.requests == 2
+    assert remote.bytes_fetched < len(range_server.body) / 4
+
+
+def test_concurrent_member_reads(range_server):
+    range_server.body, members = _zip(40)
+    remote = RemoteFile(range_server.url, len(range_server.body))
+    with zipfile.ZipFile(remote) as zf:
+        wanted = zf.infolist()[::3]
+        remote.plan(member_ranges(zf, wanted))
+        remote.requests = 0
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(zf.read, wanted))
+    assert results == [members[info.filename] for info in wanted]
+    assert remote.requests == 1  # every third member: one span
+
+
+def test_server_ignoring_range(range_server):
+    range_server.body = b"x" * 1024
+    range_server.honour_range = False
+    remote = RemoteFile(range_server.url, len(range_server.body))
+    with pytest.raises(IOError, match="ignored Range"):
+        remote.read(10)
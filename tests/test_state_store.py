@@ -0,0 +1,99 @@
+import pytest
+
+from shared import state_store
+from shared.path_index import PathIndex
+from shared.state_store import StateStore
+
+BUCKET = "test-bucket"
+
+
+def _segments(gcs, name: str) -> list[str]:
+    prefix = f"mirror/state/{name}/"
+    return sorted(k[len(prefix):] for k in gcs.objects if k.startswith(prefix))
+
+
+def test_round_trip_writes_a_base_then_deltas(gcs):
+    store = StateStore(BUCKET, "revs")
+    data = store.load()
+    data.update({"F1": "r1", "F2": "r1", "F3": "r1"})
+    store.checkpoint(data)
+    data["F2"] = "r2"
+    del data["F3"]
+    store.checkpoint(data)
+    store.checkpoint(data)  # nothing changed: no segment
+
+    assert _segments(gcs, "revs") == [
+        "base-00000001.json.gz",
+        "delta-00000002.json.gz",
+        "manifest.json",
+    ]
+    assert StateStore(BUCKET, "revs").load() == {"F1": "r1", "F2": "r2"}
+
+
+def test_path_index_store_keeps_prefix_queries(gcs):
+    store = StateStore(BUCKET, "paths", container=PathIndex)
+    index = store.load()
+    index.update({"/a/x.zip!/1.jpg": "Z", "/a/x.zip!/2.jpg": "Z", "/b.jpg": "B"})
+    store.checkpoint(index)
+    del index["/a/x.zip!/2.jpg"]
+    index["/a/x.zip!/3.jpg"] = "Z"
+    store.checkpoint(index)
+
+    assert _segments(gcs, "paths")[0] == "base-00000001.pidx"
+    loaded = StateStore(BUCKET, "paths", container=PathIndex).load()
+    assert isinstance(loaded, PathIndex)
+    assert loaded.with_prefix("/a/x.zip!/") == [
+        ("/a/x.zip!/1.jpg", "Z"),
+        ("/a/x.zip!/3.jpg", "Z"),
+    ]
+    assert not loaded.dirty
+
+
+def test_deltas_compact_into_a_new_base(gcs, monkeypatch):
+    monkeypatch.setattr(state_store, "MAX_DELTAS", 3)
+    store = StateStore(BUCKET, "revs")
+    data = store.load()
+    data.update({f"F{i}": "r1" for i in range(2000)})
+    store.checkpoint(data)
+    for i in range(4):
+        data[f"F{i}"] = "r2"
+        store.checkpoint(data)
+
+    assert _segments(gcs, "revs") == ["base-00000005.json.gz", "manifest.json"]
+    loaded = StateStore(BUCKET, "revs").load()
+    assert loaded == {f"F{i}": "r2" if i < 4 else "r1" for i in range(2000)}
+
+
+def test_segment_without_manifest_update_is_ignored(gcs, monkeypatch):
+    store = StateStore(BUCKET, "revs")
+    data = store.load()
+    data["F1"] = "r1"
+    store.checkpoint(data)
+
+    # The delta is uploaded, then the run dies before the manifest is rewritten
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed")
+
+    data["F1"] = "r2"
+    with monkeypatch.context() as m, pytest.raises(RuntimeError):
+        m.setattr(state_store, "write_json", crash)
+        store.checkpoint(data)
+    assert "delta-00000002.json.gz" in _segments(gcs, "revs")
+
+    # A reload sees the last complete checkpoint; the next one reuses the seq
+    store = StateStore(BUCKET, "revs")
+    data = store.load()
+    assert data == {"F1": "r1"}
+    data["F2"] = "r1"
+    store.checkpoint(data)
+    assert StateStore(BUCKET, "revs").load() == {"F1": "r1", "F2": "r1"}
+
+
+def test_legacy_json_is_migrated_into_a_base(gcs):
+    gcs.put("mirror/state/revs.json", b'{"F1": "r1"}')
+    store = StateStore(BUCKET, "revs", legacy_key="mirror/state/revs.json")
+    data = store.load()
+    assert data == {"F1": "r1"}
+    store.checkpoint(data)
+    assert _segments(gcs, "revs") == ["base-00000001.json.gz", "manifest.json"]
+    assert StateStore(BUCKET, "revs").load() == {"F1": "r1"}
@@ -0,0 +1,170 @@
+import io
+import json
+import zipfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from jobs.sync_dropbox_to_gcs import main as sync
+from shared.categories import meta_key
+from shared.dropbox_client import KIND_FILE, ListedEntry, ListingPage
+
+
+class FakeDropbox:
+    """Serves one listing run: ``pages`` of entries, ``content`` by (path, rev)."""
+
+    pages: list[list[ListedEntry]] = []
+    content: dict[tuple[str, str], bytes] = {}
+    link = ""  # temporary link for ranged ZIP reads
+
+    def __init__(self, **kwargs) -> None:
+        self._dbx = None
+
+    def iter_pages(self, cursor=None):
+        for i, entries in enumerate(self.pages):
+            yield ListingPage(entries, f"{cursor or 'c'}-{i}", i < len(self.pages) - 1)
+
+    @contextmanager
+    def open_download(self, path, rev=None):
+        yield None, SimpleNamespace(raw=io.BytesIO(self.content[(path, rev)]))
+
+    def temporary_link(self, path, rev=None):
+        return self.link
+
+
+@pytest.fixture
+def dropbox(monkeypatch, gcs):
+    monkeypatch.setattr(sync, "DropboxClient", FakeDropbox)
+    monkeypatch.setattr(sync._local, "dbx", None, raising=False)
+    FakeDropbox.pages = []
+    FakeDropbox.content = {}
+    return FakeDropbox
+
+
+def _file(file_id: str, rev: str, data: bytes, dropbox) -> ListedEntry:
+    path = f"/photos/{file_id.lower()}.jpg"
+    dropbox.content[(path, rev)] = data
+    return ListedEntry(
+        kind=KIND_FILE,
+        path_lower=path,
+        path_display=path,
+        name=f"{file_id}.jpg",
+        id=f"id:{file_id}",
+        rev=rev,
+        size=len(data),
+        content_hash=f"hash-{data.decode()}",
+    )
+
+
+def _zip(rev: str, members: dict[str, bytes], range_server) -> ListedEntry:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    range_server.body = buf.getvalue()
+    return ListedEntry(
+        kind=KIND_FILE,
+        path_lower="/photos/album.zip",
+        path_display="/photos/album.zip",
+        name="album.zip",
+        id="id:Z",
+        rev=rev,
+        size=len(range_server.body),
+        content_hash=f"zip-{rev}",
+    )
+
+
+def _served(gcs, file_id: str) -> bytes:
+    """Bytes behind a file's sidecar."""
+    meta = json.loads(gcs.data(meta_key(file_id)))
+    return gcs.data(meta["gcs_uri"].split("/", 3)[3])
+
+
+def test_edit_and_same_page_dedup_onto_old_content(gcs, dropbox):
+    dropbox.pages = [[_file("A", "r1", b"old", dropbox)]]
+    sync.run()
+    assert _served(gcs, "A") == b"old"
+
+    # A is edited while B arrives with A's old bytes, in the same page
+    dropbox.pages = [
+        [_file("A", "r2", b"new", dropbox), _file("B", "r1", b"old", dropbox)]
+    ]
+    sync.run()
+    assert _served(gcs, "A") == b"new"
+    assert _served(gcs, "B") == b"old"
+
+    # A third copy of the old bytes dedups onto B's object, not A's
+    dropbox.pages = [[_file("C", "r1", b"old", dropbox)]]
+    sync.run()
+    assert _served(gcs, "C") == b"old"
+
+
+def test_zip_member_edit_and_dedup_onto_old_content(gcs, dropbox, range_server):
+    dropbox.link = range_server.url
+    dropbox.pages = [[_zip("r1", {"x.jpg": b"old"}, range_server)]]
+    sync.run()
+    assert _served(gcs, "Z___x.jpg") == b"old"
+
+    # x.jpg is rewritten while y.jpg arrives with its old bytes
+    dropbox.pages = [[_zip("r2", {"x.jpg": b"new", "y.jpg": b"old"}, range_server)]]
+    sync.run()
+    assert _served(gcs, "Z___x.jpg") == b"new"
+    assert _served(gcs, "Z___y.jpg") == b"old"
+
+
+def test_sharded_run_merges_every_checkpoint(gcs, dropbox, monkeypatch):
+    monkeypatch.setattr(sync, "SAVE_INTERVAL", 2)
+    monkeypatch.setattr(sync.config, "SYNC_TASK_COUNT", 2)
+    monkeypatch.setattr(sync.config, "SYNC_RUN_ID", "run1")
+    ids = [f"F{i}" for i in range(12)]
+    dropbox.pages = [[_file(fid, "r1", fid.encode(), dropbox)] for fid in ids]
+    for index in (0, 1):
+        monkeypatch.setattr(sync.config, "SYNC_TASK_INDEX", index)
+        sync.run()
+
+    assert not [k for k in gcs.objects if k.startswith(sync.config.SYNC_SHARDS_PREFIX)]
+    manifest = sync.Manifest(sync.BUCKET).load()
+    assert sorted(row.file_id for row in manifest.rows()) == sorted(ids)
+    for fid in ids:
+        assert _served(gcs, fid) == fid.encode()
+
+
+def test_sharded_tasks_leave_the_manifest_rebuild_to_the_merge(gcs, dropbox, monkeypatch):
+    ids = [f"F{i}" for i in range(6)]
+    dropbox.pages = [[_file(fid, "r1", fid.encode(), dropbox) for fid in ids]]
+    sync.run()
+    # Lose the manifest and rev index: the next run rebuilds them from sidecars
+    lost = ("mirror/state/manifest/", "mirror/state/rev_index/")
+    for key in [k for k in gcs.objects if k.startswith(lost)]:
+        del gcs.objects[key]
+    gcs.uploads.clear()
+
+    monkeypatch.setattr(sync.config, "SYNC_TASK_COUNT", 2)
+    monkeypatch.setattr(sync.config, "SYNC_RUN_ID", "run1")
+    parts = []
+    real_load_shards = sync.load_shards
+
+    def load_shards(*args):
+        shards = real_load_shards(*args)
+        parts.extend(shards)
+        return shards
+
+    monkeypatch.setattr(sync, "load_shards", load_shards)
+    dropbox.pages = [[_file("NEW", "r1", b"NEW", dropbox)]]
+    for index in (0, 1):
+        monkeypatch.setattr(sync.config, "SYNC_TASK_INDEX", index)
+        sync.run()
+
+    # Only the task that owns NEW sends a row; the merge writes each shard once
+    manifest = sync.Manifest(sync.BUCKET).load()
+    upserts = [shard["manifest"]["upsert"] for shard in parts]
+    assert sorted(upserts) == [[], [list(manifest.get("NEW"))]]
+    written = [k for k in gcs.uploads if k.startswith("mirror/state/manifest/shard-")]
+    assert sorted(written) == sorted(set(written))
+    assert len(written) == manifest.num_shards
+    assert sorted(row.file_id for row in manifest.rows()) == sorted([*ids, "NEW"])
+    revs = sync.StateStore(
+        sync.BUCKET, sync.config.REV_INDEX_STORE, sync.config.REV_INDEX_KEY
+    ).load()
+    assert revs == {fid: "r1" for fid in [*ids, "NEW"]}
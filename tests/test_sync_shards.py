@@ -0,0 +1,172 @@
+import copy
+
+import pytest
+from google.api_core.exceptions import PreconditionFailed
+
+from shared import sync_shards
+from shared.dedup import HashIndex
+from shared.state_store import TrackedDict
+from shared.sync_shards import (
+    TaskShard,
+    dict_delta,
+    load_shards,
+    merge_dict_deltas,
+    merge_hash_deltas,
+)
+
+DKEY = "images/abc123.jpg"
+
+
+def _task(base: dict, *ops) -> dict:
+    """Delta of one task that applied *ops* to its own copy of *base*."""
+    entries = TrackedDict(copy.deepcopy(base))
+    hashes = HashIndex(entries)
+    for op in ops:
+        op(hashes)
+    return dict_delta(entries)
+
+
+def _merge(base: dict, deltas: list[dict], rows: dict) -> tuple:
+    entries = TrackedDict(copy.deepcopy(base))
+    stale, repoint = merge_hash_deltas(entries, deltas, rows.get)
+    for file_id, key in repoint:  # as merge_shards does for rows and sidecars
+        rows[file_id] = key
+    return entries, stale, repoint
+
+
+def test_same_new_content_in_two_tasks_keeps_every_ref():
+    # Task 0 stores F0001 under its own key; task 1 stores F0004 and dedups
+    # F0007 and F0010 onto it
+    deltas = [
+        _task({}, lambda h: h.add_ref(DKEY, "mirror/images/F0001", "F0001")),
+        _task(
+            {},
+            *(
+                lambda h, fid=fid: h.add_ref(DKEY, "mirror/images/F0004", fid)
+                for fid in ("F0004", "F0007", "F0010")
+            ),
+        ),
+    ]
+    rows = {
+        "F0001": "mirror/images/F0001",
+        "F0004": "mirror/images/F0004",
+        "F0007": "mirror/images/F0004",
+        "F0010": "mirror/images/F0004",
+    }
+    entries, stale, repoint = _merge({}, deltas, rows)
+
+    entry = entries[DKEY]
+    assert entry["key"] == "mirror/images/F0001"
+    assert sorted(entry["refs"]) == ["F0001", "F0004", "F0007", "F0010"]
+    assert sorted(repoint) == [
+        (fid, "mirror/images/F0001") for fid in ("F0004", "F0007", "F0010")
+    ]
+    assert set(rows.values()) == {"mirror/images/F0001"}
+    assert stale == {"mirror/images/F0004"}
+
+    # Deleting the file that owns the shared object must not orphan it
+    hashes = HashIndex(entries)
+    assert hashes.release("F0001") is None
+    for fid in ("F0004", "F0007"):
+        assert hashes.release(fid) is None
+    assert hashes.release("F0010") == "mirror/images/F0001"
+
+
+def test_move_to_shared_key_repoints_earlier_dedups():
+    base = {DKEY: {"key": "mirror/images/F0001", "refs": ["F0001", "F0002"]}}
+    shared = "mirror/images/dedup/abc123.jpg"
+    deltas = [
+        # F0001 overwrites its key: content moves, F0001 lets go
+        _task(base, lambda h: h.move_object(DKEY, shared), lambda h: h.release("F0001")),
+        # Meanwhile F0003 dedups onto the old key
+        _task(base, lambda h: h.add_ref(DKEY, "mirror/images/F0001", "F0003")),
+    ]
+    rows = {"F0002": shared, "F0003": "mirror/images/F0001"}
+    entries, stale, repoint = _merge(base, deltas, rows)
+
+    assert entries[DKEY] == {"key": shared, "refs": ["F0002", "F0003"]}
+    assert repoint == [("F0003", shared)]
+    assert stale == {"mirror/images/F0001"}
+
+
+def test_released_everywhere_is_stale():
+    base = {DKEY: {"key": "mirror/images/F0001", "refs": ["F0001"]}}
+    deltas = [_task(base, lambda h: h.release("F0001")), _task(base)]
+    entries, stale, _ = _merge(base, deltas, {})
+    assert DKEY not in entries
+    assert stale == {"mirror/images/F0001"}
+
+
+def test_deletes_apply_before_sets():
+    paths = TrackedDict({"/a.jpg": "F0001"})
+    merge_dict_deltas(
+        paths,
+        [{"set": {"/a.jpg": "F0002"}, "del": []}, {"set": {}, "del": ["/a.jpg"]}],
+    )
+    assert dict(paths) == {"/a.jpg": "F0002"}
+
+
+def _part(path: dict, dels=(), upsert=(), remove=(), orphans=(), processed=0) -> dict:
+    return {
+        "task": 0,
+        "start_cursor": None,
+        "finished": False,
+        "cursor": None,
+        "listed": processed,
+        "processed": processed,
+        "stats": {"synced": processed},
+        "path": {"set": path, "del": list(dels)},
+        "rev": {"set": {}, "del": []},
+        "hash": {"set": {}, "del": []},
+        "manifest": {"upsert": list(upsert), "remove": list(remove)},
+        "orphans": list(orphans),
+    }
+
+
+def _row(fid: str, rev: str) -> list:
+    return [fid, "images", rev, 1, f"mirror/images/{fid}", "h"]
+
+
+def test_task_saves_only_changes_and_load_composes_them(gcs):
+    task = TaskShard("test-bucket", "run1", 0, 2)
+    assert task.load() is None
+    task.save(_part({"/a.jpg": "F1"}, upsert=[_row("F1", "r1")], orphans=["x"], processed=1))
+    task.save(_part({"/b.jpg": "F2"}, dels=["/a.jpg"], upsert=[_row("F1", "r2")], processed=2))
+    task.save(_part({"/a.jpg": "F3"}, remove=["F1"], orphans=["y"], processed=3))
+
+    # Each save uploads one part with its own changes, plus the head
+    parts = [k for k in gcs.uploads if "/part-" in k]
+    assert len(parts) == 3
+    assert gcs.uploads.count(task.key) == 3
+
+    state = TaskShard("test-bucket", "run1", 0, 2).load()
+    assert state["processed"] == 3
+    assert state["path"] == {"set": {"/b.jpg": "F2", "/a.jpg": "F3"}, "del": []}
+    assert state["manifest"] == {"upsert": [], "remove": ["F1"]}
+    assert state["orphans"] == ["x", "y"]
+    assert load_shards("test-bucket", "run1", 2) == [state, None]
+
+
+def test_stale_attempt_cannot_add_parts(gcs):
+    stale = TaskShard("test-bucket", "run1", 0, 1)
+    stale.load()
+    retry = TaskShard("test-bucket", "run1", 0, 1)
+    retry.load()
+    retry.save(_part({"/a.jpg": "F1"}, processed=1))
+    with pytest.raises(PreconditionFailed):
+        stale.save(_part({"/b.jpg": "F2"}, processed=5))
+    assert load_shards("test-bucket", "run1", 1)[0]["path"]["set"] == {"/a.jpg": "F1"}
+
+
+def test_parts_are_folded_once_too_many(gcs, monkeypatch):
+    monkeypatch.setattr(sync_shards, "MAX_PARTS", 3)
+    task = TaskShard("test-bucket", "run1", 0, 1)
+    task.load()
+    for i in range(5):
+        task.save(_part({f"/{i}.jpg": f"F{i}"}, processed=i))
+
+    live = [k for k in gcs.objects if "/part-" in k]
+    assert len(live) == 2  # folded on the 4th save, then one more
+    state = TaskShard("test-bucket", "run1", 0, 1).load()
+    assert state["path"]["set"] == {f"/{i}.jpg": f"F{i}" for i in range(5)}
+    assert state["processed"] == 4
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from shared.transfer import PageLedger, TransferPool
+
+
+def test_ledger_waits_for_every_earlier_page():
+    ledger = PageLedger()
+    pages = [ledger.open_page() for _ in range(3)]
+    for seq in pages:
+        ledger.add(seq)
+    ledger.close_page(pages[1], "c1")
+    ledger.close_page(pages[2], "c2")
+    ledger.done(pages[2])
+    ledger.done(pages[1])
+    assert ledger.committable() is None  # page 0 is neither listed nor done
+
+    ledger.close_page(pages[0], "c0")
+    assert ledger.committable() is None  # listed, its task still running
+    ledger.done(pages[0])
+    assert ledger.committable() == "c2"
+
+    # A new page that is still open keeps the last committable cursor
+    seq = ledger.open_page()
+    ledger.add(seq)
+    ledger.close_page(seq, "c3")
+    assert ledger.committable() == "c2"
+    ledger.done(seq)
+    assert ledger.committable() == "c3"
+
+
+def test_out_of_order_completions_never_pass_an_unfinished_page():
+    ledger = PageLedger()
+    release = {seq: threading.Event() for seq in range(3)}
+    main_thread = threading.get_ident()
+    finished: list[int] = []
+    seen: list[object] = []
+
+    def on_done(seq, result, error):
+        assert threading.get_ident() == main_thread
+        finished.append(seq)
+        ledger.done(seq)
+        seen.append(ledger.committable())
+
+    pool = TransferPool(3, on_done=on_done)
+    for seq in range(3):
+        page = ledger.open_page()
+        ledger.add(page)
+        pool.submit(f"/file-{seq}", release[seq].wait, context=page)
+        ledger.close_page(page, f"c{seq}")
+
+    # Later pages finish first
+    for seq in (2, 1, 0):
+        release[seq].set()
+        pool.wait_for(f"/file-{seq}")
+    pool.close()
+    assert finished == [2, 1, 0]
+    assert seen == [None, None, "c2"]
+
+
+def test_same_key_runs_in_order_and_errors_reach_on_done():
+    results = {}
+
+    def on_done(ctx, result, error):
+        results[ctx] = (result, error)
+
+    pool = TransferPool(4, on_done=on_done)
+    order = []
+
+    def slow(tag):
+        time.sleep(0.05)
+        order.append(tag)
+        return tag
+
+    def fail():
+        raise ValueError("boom")
+
+    pool.submit("/a.jpg", slow, "first", context=1)
+    pool.submit("/a.jpg", slow, "second", context=2)  # waits for the first
+    pool.submit("/b.jpg", fail, context=3)
+    pool.close()
+
+    assert order == ["first", "second"]
+    assert results[1] == ("first", None)
+    assert results[2] == ("second", None)
+    result, error = results[3]
+    assert result is None and isinstance(error, ValueError)
+
+
+def test_submit_blocks_at_capacity():
+    gate = threading.Event()
+    done = []
+    pool = TransferPool(2, on_done=lambda ctx, *_: done.append(ctx), max_pending=2)
+    pool.submit("a", gate.wait, context="a")
+    pool.submit("b", gate.wait, context="b")
+    assert len(pool) == 2
+
+    threading.Timer(0.05, gate.set).start()
+    pool.submit("c", gate.wait, context="c")  # returns once a slot frees up
+    assert len(pool) <= 2 and done
+    pool.close()
+    assert sorted(done) == ["a", "b", "c"]
@@ -0,0 +1,183 @@
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from shared import vertex_search
+from shared.manifest import ManifestRow
+from shared.vertex_search import (
+    MAX_IMPORT_ATTEMPTS,
+    ImportTracker,
+    IncrementalImporter,
+    doc_id,
+)
+
+BUCKET = "test-bucket"
+ID_CHARS = re.compile(r"[A-Za-z0-9_-]{1,63}")
+
+
+@pytest.fixture
+def imports(monkeypatch):
+    """Records documents:import calls; set ``.reply(uris)`` to answer them."""
+    calls = SimpleNamespace(uris=[], reply=lambda uris: {"done": True})
+
+    def post_import(datastore_id, gcs_uris, timeout, error_prefix=None, **kwargs):
+        calls.uris.append(list(gcs_uris))
+        return calls.reply(gcs_uris)
+
+    monkeypatch.setattr(vertex_search.config, "VERTEX_SEARCH_DATASTORE_ID", "store")
+    monkeypatch.setattr(vertex_search, "_post_import", post_import)
+    return calls
+
+
+# ── doc_id ───────────────────────────────────────────────────
+
+
+def test_doc_id_keeps_plain_file_ids():
+    assert doc_id("mirror/docs/id_AbC-123.pdf") == "id_AbC-123"
+    assert doc_id("mirror/docs/dedup/abc123.pdf").startswith("dedup-abc123-")
+
+
+@pytest.mark.parametrize(
+    "keys",
+    [
+        ["mirror/docs/a b.pdf", "mirror/docs/a+b.pdf", "mirror/docs/a_b.pdf"],
+        [f"mirror/docs/{'x' * 70}{i}.pdf" for i in range(3)],
+        ["mirror/docs/Z___dir/é.pdf", "mirror/docs/Z___dir/ü.pdf"],
+        [f"mirror/docs/dedup/{'f' * 64}.pdf", f"mirror/docs/dedup/{'f' * 63}e.pdf"],
+        ["mirror/docs/dedup/abc123.pdf", "mirror/docs/dedup/abc123.docx"],
+    ],
+)
+def test_doc_ids_are_valid_and_distinct(keys):
+    ids = [doc_id(key) for key in keys]
+    assert all(ID_CHARS.fullmatch(i) for i in ids), ids
+    assert len(set(ids)) == len(keys)
+    assert ids == [doc_id(key) for key in keys]  # stable
+
+
+# ── ImportTracker ────────────────────────────────────────────
+
+
+def test_failed_docs_are_retried_then_given_up(gcs, imports):
+    imports.reply = lambda uris: {
+        "done": True,
+        "metadata": {"failureCount": 1},
+        "response": {"errorSamples": [{"message": "bad gs://b/docs/bad.pdf"}]},
+    }
+    tracker = ImportTracker(BUCKET)
+    tracker.load()
+    tracker.submit(["gs://b/docs/ok.pdf", "gs://b/docs/bad.pdf"])
+    assert (tracker.imported, tracker.failed, tracker.pending) == (1, 0, 1)
+
+    for _ in range(MAX_IMPORT_ATTEMPTS):
+        tracker.poll()
+    # Only the failed doc was re-submitted, once per remaining attempt
+    assert imports.uris[1:] == [["gs://b/docs/bad.pdf"]] * (MAX_IMPORT_ATTEMPTS - 1)
+    assert (tracker.imported, tracker.failed, tracker.pending) == (1, 1, 0)
+
+    tracker.save()
+    ledger = json.loads(gcs.data(tracker.ledger_key))
+    assert ledger == {
+        "operations": {},
+        "retry": {},
+        "failed": {"gs://b/docs/bad.pdf": MAX_IMPORT_ATTEMPTS},
+    }
+
+
+def test_unattributed_failures_retry_the_whole_batch(gcs, imports):
+    replies = iter([{"done": True, "metadata": {"failureCount": 1}}, {"done": True}])
+    imports.reply = lambda uris: next(replies)
+    tracker = ImportTracker(BUCKET)
+    tracker.submit(["gs://b/1.pdf", "gs://b/2.pdf"])
+    assert (tracker.imported, tracker.pending) == (0, 2)
+    tracker.poll()
+    assert imports.uris[1] == ["gs://b/1.pdf", "gs://b/2.pdf"]
+    assert (tracker.imported, tracker.failed, tracker.pending) == (2, 0, 0)
+
+
+def test_submit_errors_and_worker_failures_are_recorded(gcs, imports):
+    def reply(uris):
+        raise RuntimeError("503")
+
+    imports.reply = reply
+    tracker = ImportTracker(BUCKET)
+    tracker.submit(["gs://b/1.pdf"])
+    tracker.record_failures(["gs://b/2.pdf"], MAX_IMPORT_ATTEMPTS)
+    assert (tracker.failed, tracker.pending) == (1, 1)
+
+    imports.reply = lambda uris: {"name": "operations/op-1"}  # still running
+    tracker.poll()
+    assert tracker.pending == 1  # in flight now, not waiting to retry
+    tracker.save()
+    ledger = json.loads(gcs.data(tracker.ledger_key))
+    assert ledger["operations"]["operations/op-1"]["attempt"] == 2
+
+    # The next run resumes the operation from the ledger
+    resumed = ImportTracker(BUCKET)
+    resumed.load()
+    assert resumed.pending == 1
+
+
+def test_no_datastore_counts_every_doc_as_failed(gcs, imports, monkeypatch):
+    monkeypatch.setattr(vertex_search.config, "VERTEX_SEARCH_DATASTORE_ID", "")
+    tracker = ImportTracker(BUCKET)
+    tracker.submit(["gs://b/1.pdf", "gs://b/2.pdf"])
+    assert (tracker.failed, tracker.pending, imports.uris) == (2, 0, [])
+
+
+# ── IncrementalImporter ──────────────────────────────────────
+
+
+def _rows(**hashes: str) -> list[ManifestRow]:
+    return [
+        ManifestRow(name, "docs", "r1", 1, f"mirror/docs/{name}.pdf", content_hash)
+        for name, content_hash in hashes.items()
+    ]
+
+
+def _jsonl_ids(gcs, uris: list[str]) -> list[str]:
+    (uri,) = uris
+    raw = gcs.data(uri.split("/", 3)[3])
+    return [json.loads(line)["id"] for line in raw.decode().splitlines()]
+
+
+def test_incremental_import_diffs_and_retries_failures(gcs, imports):
+    submitted = []
+
+    def reply(uris):
+        submitted.append(_jsonl_ids(gcs, uris))
+        return {
+            "done": True,
+            "metadata": {"failureCount": 1},
+            "response": {"errorSamples": [{"message": 'id "B" failed'}]},
+        }
+
+    imports.reply = reply
+    importer = IncrementalImporter(BUCKET)
+    importer.load()
+    importer.run(_rows(A="h1", B="h1"), timeout=0)
+    assert sorted(submitted[0]) == ["A", "B"]
+    assert (importer.imported, importer.failed, importer.pending) == (1, 1, 0)
+    assert not [k for k in gcs.objects if k.endswith(".jsonl")]
+
+    # Next run: the failed doc plus what changed; gone docs leave the state
+    def reply(uris):
+        submitted.append(_jsonl_ids(gcs, uris))
+        return {"done": True}
+
+    imports.reply = reply
+    importer = IncrementalImporter(BUCKET)
+    importer.load()
+    importer.run(_rows(B="h1", C="h1"), timeout=0)
+    assert sorted(submitted[1]) == ["B", "C"]
+    assert importer.imported == 2
+    assert dict(importer.state) == {
+        "mirror/docs/B.pdf": "h1",
+        "mirror/docs/C.pdf": "h1",
+    }
+
+    importer.run(_rows(B="h1", C="h2"), timeout=0)
+    assert submitted[2] == ["C"]
+    importer.run(_rows(B="h1", C="h2"), timeout=0)
+    assert len(submitted) == 3  # nothing changed